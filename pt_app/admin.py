@@ -1,9 +1,38 @@
 from django.contrib import admin
-from .models import Program, Workout, Exercise, WorkoutExercise, User, UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet, Message, ChatSession, TrainerRequest, TrainerClientRelationship 
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+from .models import Program, Workout, Exercise, WorkoutExercise, User, UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet, Message, ChatSession, TrainerRequest, TrainerClientRelationship, PersonalRecord, ExerciseTarget 
 from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import mark_safe
 
+# Unfiltered changelists of the big tables (sessions, logs, sets, messages) stop counting past this many rows
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips the full-table COUNT(*). The unfiltered changelist
+    uses the highest primary key, which only overestimates by the rows
+    deleted. Filtered lists are counted exactly: a capped count would leave
+    the pages past the cap unreachable.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            estimate = queryset.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+            if estimate > ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return queryset.count()
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered count shown next to filtered results
+    show_full_result_count = False
+    # Newest first, straight off the primary key instead of sorting the table
+    ordering = ('-pk',)
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     fieldsets = BaseUserAdmin.fieldsets + (
@@ -21,9 +50,10 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(Program)
 class ProgramAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'creator', 'id')
+    list_select_related = ('creator',)
     search_fields = ('name', 'creator__username')
-    list_filter = ('creator',)
-    filter_horizontal = ('participants',)
+    # A filter choice or a select option per user doesn't scale; search instead
+    autocomplete_fields = ('creator', 'participants')
 
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
@@ -38,21 +68,35 @@ class ExerciseAdmin(admin.ModelAdmin):
 @admin.register(WorkoutExercise)
 class WorkoutExerciseAdmin(admin.ModelAdmin):
     list_display = ('workout', 'exercise', 'sets', 'reps', 'note', 'id')
+    list_select_related = ('workout', 'exercise')
     search_fields = ('workout__name', 'exercise__name')  # This is correct as a tuple
-    list_filter = ('exercise',) 
+    autocomplete_fields = ('workout', 'exercise')
 
 @admin.register(UserProgramProgress)
 class UserProgramProgressAdmin(admin.ModelAdmin):
     list_display = ('user', 'program', 'is_active', 'start_date')
+    list_select_related = ('user', 'program')
     search_fields = ('user__username', 'program__name')
-    list_filter = ('program','is_active')
+    list_filter = ('is_active',)
+    autocomplete_fields = ('user', 'program')
     date_hierarchy = 'start_date'  # Enables a quick date drill down
 
-class ExerciseSetAdmin(admin.ModelAdmin):
-    list_display = ('exercise_log', 'set_number', 'reps', 'weight_used', 'video_link', 'id')
-    list_filter = ('exercise_log', 'set_number')
-    search_fields = ('exercise_log__workout_exercise__exercise__name', 'set_number')
-    ordering = ('exercise_log', 'set_number')
+@admin.register(WorkoutSession)
+class WorkoutSessionAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'workout', 'date', 'completed', 'active')
+    list_select_related = ('user', 'workout')
+    list_filter = ('completed', 'active')
+    search_fields = ('=user__username',)
+    autocomplete_fields = ('user', 'workout')
+    raw_id_fields = ('user_program_progress',)
+    date_hierarchy = 'date'
+
+class ExerciseSetAdmin(LargeTableAdmin):
+    list_display = ('exercise', 'user', 'set_number', 'reps', 'weight_used', 'session_date', 'video_link', 'id')
+    list_select_related = ('exercise', 'user')
+    # Exact matches, so the search can use the user/exercise indexes
+    search_fields = ('=user__username', '=exercise__name')
+    raw_id_fields = ('exercise_log',)
     fieldsets = (
         (None, {
             'fields': ('exercise_log', 'set_number')
@@ -69,29 +113,64 @@ class ExerciseSetAdmin(admin.ModelAdmin):
 
     video_link.short_description = "Video"
 
-class ExerciseLogAdmin(admin.ModelAdmin):
-    list_display = ('id', 'workout_session', 'workout_exercise', 'sets_completed', 'note')  # Add other fields as needed
+class ExerciseLogAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'exercise', 'session_date', 'workout_session_id', 'sets_completed', 'note')  # Add other fields as needed
+    # The denormalized user/exercise, rather than walking session and workout exercise per row
+    list_select_related = ('user', 'exercise')
+    search_fields = ('=user__username', '=exercise__name')
+    raw_id_fields = ('workout_session', 'workout_exercise', 'user', 'exercise')
 
-    def get_queryset(self, request):
-        # This method can be used to modify the queryset. For example, you can optimize queries by selecting related fields
-        qs = super().get_queryset(request)
-        return qs.select_related('workout_session', 'workout_exercise')
-    
 @admin.register(TrainerRequest)
 class TrainerRequestAdmin(admin.ModelAdmin):
     list_display = ('from_user', 'to_user', 'is_active', 'created_at')
+    list_select_related = ('from_user', 'to_user')
     list_filter = ('is_active', 'created_at')
     search_fields = ('from_user__username', 'to_user__username')
+    autocomplete_fields = ('from_user', 'to_user')
 
 @admin.register(TrainerClientRelationship)
 class TrainerClientRelationshipAdmin(admin.ModelAdmin):
     list_display = ('trainer', 'client', 'created_at')
+    list_select_related = ('trainer', 'client')
     list_filter = ('created_at',)
     search_fields = ('trainer__username', 'client__username')
-    
-admin.site.register(WorkoutSession)
+    autocomplete_fields = ('trainer', 'client')
+
+@admin.register(PersonalRecord)
+class PersonalRecordAdmin(LargeTableAdmin):
+    list_display = ('user', 'exercise', 'rep_range', 'best_weight', 'best_e1rm', 'best_volume', 'updated_at')
+    list_select_related = ('user', 'exercise')
+    list_filter = ('rep_range',)
+    search_fields = ('=user__username', '=exercise__name')
+    raw_id_fields = ('user', 'exercise', 'best_weight_set', 'best_e1rm_set', 'best_volume_set')
+
+@admin.register(ExerciseTarget)
+class ExerciseTargetAdmin(LargeTableAdmin):
+    list_display = ('user', 'workout_exercise_id', 'reps', 'weight', 'last_sets', 'last_reps', 'last_weight', 'stalls', 'updated_at')
+    list_select_related = ('user',)
+    search_fields = ('=user__username',)
+    raw_id_fields = ('user', 'workout_exercise', 'workout_session')
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ('id', 'sender', 'chat_session_id', 'timestamp', 'read')
+    list_select_related = ('sender',)
+    list_filter = ('read',)
+    raw_id_fields = ('chat_session', 'sender')
+    date_hierarchy = 'timestamp'
+
+@admin.register(ChatSession)
+class ChatSessionAdmin(LargeTableAdmin):
+    list_display = ('id', 'participant_names', 'created_at')
+    raw_id_fields = ('participants',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('participants')
+
+    def participant_names(self, obj):
+        return ', '.join(user.username for user in obj.participants.all())
+    participant_names.short_description = 'Participants'
+
 admin.site.register(ExerciseLog, ExerciseLogAdmin)
 admin.site.register(ExerciseSet, ExerciseSetAdmin)
-admin.site.register(Message)
-admin.site.register(ChatSession)
 
@@ -0,0 +1,97 @@
+import copy
+import threading
+import time
+from urllib.parse import parse_qs
+from channels.auth import AuthMiddlewareStack
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+from .metrics import timed_database_sync_to_async
+
+# JWT authentication without a User query on every request. Users are kept in
+# a small per-process cache for AUTH_USER_CACHE_TTL seconds; saves and deletes
+# evict the entry in this process (see signals.py), other workers pick the
+# change up when their entry expires.
+
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def get_cached_user(user_id):
+    entry = _user_cache.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    # Hand out a copy so a view changing request.user can't leak into other requests
+    return copy.copy(entry[1])
+
+def cache_user(user):
+    with _user_cache_lock:
+        if len(_user_cache) >= settings.AUTH_USER_CACHE_MAX_ENTRIES:
+            now = time.monotonic()
+            for user_id in [user_id for user_id, (expires, _) in _user_cache.items() if expires < now]:
+                del _user_cache[user_id]
+            if len(_user_cache) >= settings.AUTH_USER_CACHE_MAX_ENTRIES:
+                _user_cache.clear()
+        _user_cache[user.pk] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, copy.copy(user))
+
+def invalidate_cached_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = get_cached_user(user_id)
+        if user is None:
+            # Not found / inactive users raise here and are never cached
+            user = super().get_user(validated_token)
+            cache_user(user)
+        return user
+
+class TokenClaimsJWTAuthentication(CachedJWTAuthentication):
+    # For read-only endpoints that only need to know who is asking: the user is
+    # built from the signed claims without touching the database. A deactivated
+    # user keeps access to these endpoints until their access token expires.
+    def get_user(self, validated_token):
+        if self.request_method not in SAFE_METHODS:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        return get_cached_user(user_id) or User(id=user_id, username=validated_token.get('username', ''))
+
+    def authenticate(self, request):
+        self.request_method = request.method
+        return super().authenticate(request)
+
+# Websocket handshakes can't carry an Authorization header from the browser, so
+# the access token comes in the query string: ws/user/<id>/?token=<access>
+
+@timed_database_sync_to_async
+def get_websocket_user(raw_token):
+    authenticator = CachedJWTAuthentication()
+    try:
+        return authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return AnonymousUser()
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            scope = dict(scope, user=await get_websocket_user(token[0]))
+        return await super().__call__(scope, receive, send)
+
+def JWTAuthMiddlewareStack(inner):
+    # Session auth still applies when no token is given
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
@@ -0,0 +1,46 @@
+import time
+import weakref
+from collections import Counter
+
+# Per-connection flow control for ChatConsumer: token buckets on inbound frame
+# types and process-wide bookkeeping of outbound queue depths, so one chatty or
+# lagging client can't hold up the event loop for everyone else.
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+class SendQueueStats:
+    def __init__(self):
+        # Consumers are dropped from the registry as soon as they're collected
+        self.queues = weakref.WeakKeyDictionary()
+        self.counters = Counter()
+
+    def register(self, consumer, queue):
+        self.queues[consumer] = queue
+
+    def unregister(self, consumer):
+        self.queues.pop(consumer, None)
+
+    def snapshot(self):
+        depths = [queue.qsize() for queue in list(self.queues.values())]
+        return {
+            'connections': len(depths),
+            'queued_frames': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            **self.counters,
+        }
+
+send_queue_stats = SendQueueStats()
@@ -0,0 +1,72 @@
+import json
+import platform
+import subprocess
+import time
+from django.utils import timezone
+
+# Shared helpers for the bench_* management commands: timing, percentile
+# summaries and machine-readable result files that can be diffed across commits.
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples):
+    """Summarize a list of durations in seconds as milliseconds."""
+    return {
+        'n': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 4) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 4),
+        'p90_ms': round(percentile(samples, 90) * 1000, 4),
+        'p99_ms': round(percentile(samples, 99) * 1000, 4),
+        'max_ms': round(max(samples) * 1000, 4) if samples else 0.0,
+    }
+
+def measure(fn, iterations=100, warmup=5, setup=None):
+    # setup, if given, runs untimed before every call
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def resident_memory_kb(pid='self'):
+    # Linux only; returns None where /proc isn't available
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(path, benchmark, results, **meta):
+    payload = {
+        'benchmark': benchmark,
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'timestamp': timezone.now().isoformat(),
+        'meta': meta,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, default=str)
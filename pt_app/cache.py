@@ -0,0 +1,55 @@
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+# Per-user cache for the chart endpoints. Every key embeds a per-user version
+# number, so invalidating a user's charts is a single counter bump instead of
+# hunting down every endpoint/parameter combination that was cached.
+
+CHART_CACHE_ALIAS = 'charts'
+
+def get_chart_cache():
+    return caches[CHART_CACHE_ALIAS]
+
+def _version_key(user_id):
+    return f"charts:version:{user_id}"
+
+def get_chart_version(user_id):
+    cache = get_chart_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock rather than 1 so a version that was evicted can't
+        # come back with a number that still matches stale entries
+        cache.add(_version_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(user_id), 0)
+    return version
+
+def chart_cache_key(user_id, endpoint, params, version):
+    params_digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f"charts:{user_id}:{version}:{endpoint}:{params_digest}"
+
+def cached_chart(user_id, endpoint, params, build):
+    """
+    Return the cached chart data for (user, endpoint, params), calling build()
+    and storing its result on a miss. `user_id` is the owner of the data, not
+    the requester, so a trainer viewing a client's charts shares the client's entries.
+    """
+    cache = get_chart_cache()
+    key = chart_cache_key(user_id, endpoint, params, get_chart_version(user_id))
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=settings.CHART_CACHE_TIMEOUT)
+    return data
+
+def invalidate_user_charts(user_id):
+    if user_id is None:
+        return
+    cache = get_chart_cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # No version stored yet, so nothing has been cached for this user
+        pass
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from datetime import timedelta, datetime, time
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import now, make_aware
+from .models import Exercise, WorkoutSession, ExerciseSet
+from .cache import cached_chart
+
+# Chart data shared by the user and client (trainer) chart views. Each builder
+# returns plain lists/dicts so the result can be stored in the chart cache.
+
+def workout_sessions_last_3_months(user):
+    end_date = now()
+    start_date = end_date - timedelta(days=90)  # Approximately 3 months
+
+    def build():
+        sessions = WorkoutSession.objects.filter(
+            user=user,
+            date__range=(start_date, end_date)
+        ).order_by('date')
+        return process_sessions_by_week(sessions, start_date, end_date)
+
+    return cached_chart(user.id, 'workout_sessions_last_3_months', {'day': end_date.date().isoformat()}, build)
+
+def process_sessions_by_week(sessions, start_date, end_date):
+    data = OrderedDict()
+    current_date = start_date
+    while current_date <= end_date:
+        week_str = current_date.strftime('%Y-%U')  # Maintain unique year-week identification
+        data[week_str] = 0
+        current_date += timedelta(days=7)
+
+    end_week_str = end_date.strftime('%Y-%U')
+    if end_week_str not in data:
+        data[end_week_str] = 0
+
+    for session in sessions:
+        week_str = session.date.strftime('%Y-%U')
+        if week_str in data:
+            data[week_str] += 1
+
+    # Convert to a format suitable for Recharts, consider transforming week_str for frontend display if needed
+    return [{'week': week, 'workouts': count} for week, count in data.items()]
+
+def exercise_1rm(user, exercise_id):
+    # Calculate the date 6 months ago from today
+    six_months_ago = now() - timedelta(days=180)
+
+    def build():
+        # Fetch exercise sets for the given exercise in the last 6 months for the user
+        exercise_sets = ExerciseSet.objects.filter(
+            user=user,
+            exercise_id=exercise_id,
+            session_date__gte=six_months_ago
+        ).exclude(weight_used__isnull=True).exclude(reps__isnull=True).order_by('session_date').values_list(
+            'weight_used', 'reps', 'session_date'
+        )
+        return prepare_1rm_chart_data(exercise_sets)
+
+    params = {'exercise_id': exercise_id, 'day': six_months_ago.date().isoformat()}
+    return cached_chart(user.id, 'exercise_1rm', params, build)
+
+def prepare_1rm_chart_data(exercise_sets):
+    chart_data = {}
+    for weight_used, reps, session_date in exercise_sets:
+        # Calculate 1RM using the Epley formula for each set
+        one_rm = weight_used * (1 + reps / 30.0)
+        one_rm = round(one_rm, 1)
+        day = session_date.strftime('%Y-%m-%d')
+
+        # If multiple sets are done on the same day, store the max 1RM
+        if day not in chart_data or one_rm > chart_data[day]:
+            chart_data[day] = one_rm
+
+    # Convert the chart data dictionary to a list of objects
+    return [{'day': day, 'one_rm': one_rm} for day, one_rm in chart_data.items()]
+
+def exercises_with_weights(user):
+    def build():
+        # Exercises with at least one ExerciseSet with weight_used for the user
+        weighted_exercise_ids = ExerciseSet.objects.filter(
+            user=user,
+            weight_used__isnull=False
+        ).values('exercise_id')
+        exercises = Exercise.objects.filter(id__in=weighted_exercise_ids).order_by('id')
+
+        return [{'id': exercise.id, 'name': exercise.name} for exercise in exercises]
+
+    return cached_chart(user.id, 'exercises_with_weights', {}, build)
+
+def cumulative_weight(user):
+    end_date = now().date()
+    start_date = end_date - timedelta(days=6)  # Last 7 days including today
+
+    def build():
+        # Total weight (weight x reps) per day over the user's sets in the last 7 days
+        daily_totals = ExerciseSet.objects.filter(
+            user=user,
+            session_date__range=(
+                make_aware(datetime.combine(start_date, time.min)),
+                make_aware(datetime.combine(end_date, time.max))
+            ),
+            weight_used__isnull=False,
+            reps__isnull=False
+        ).annotate(day=TruncDate('session_date')).values('day').annotate(
+            total=Sum(F('weight_used') * F('reps'))
+        ).values_list('day', 'total')
+
+        # Prepare data structure for cumulative weights
+        cumulative_weights = {date.strftime('%Y-%m-%d'): 0 for date in [start_date + timedelta(days=x) for x in range((end_date-start_date).days + 1)]}
+        for day, total in daily_totals:
+            cumulative_weights[day.strftime('%Y-%m-%d')] += total
+
+        return [{'date': date, 'total_weight_lifted': weight} for date, weight in cumulative_weights.items()]
+
+    return cached_chart(user.id, 'cumulative_weight', {'day': end_date.isoformat()}, build)
@@ -1,15 +1,36 @@
-import json
+import asyncio
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from .models import Message, ChatSession, User
+from .fast_json import dumps, loads
+from .presence import presence
+from .inbox import mark_read, unread_counts, read_receipt_event, chat_participant_ids
+from .backpressure import TokenBucket, send_queue_stats
+from .metrics import timed_database_sync_to_async
+from django.conf import settings
 from django.db.models import Q
 from django.db import models
 
+CLOSE_SLOW_CONSUMER = 4008
+CLOSE_RATE_LIMITED = 4029
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.user_id = self.scope['url_route']['kwargs']['user_id']
+        self.registered = False
+        self.send_queue = None
+        self.closing = False
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        # The URL id is kept for existing clients but must match the token
+        if int(self.scope['url_route']['kwargs']['user_id']) != user.id:
+            await self.close(code=4403)
+            return
+
+        self.user_id = user.id
         self.personal_channel_name = f"user_{self.user_id}"
 
         # Subscribe to personal channel
@@ -17,18 +38,103 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.personal_channel_name,
             self.channel_name
         )
+        presence.connect(self.user_id)
+        self.registered = True
         await self.accept()
 
+        # Outbound frames go through a bounded queue drained by one writer task,
+        # so frames that pile up in this process (e.g. a burst of group events)
+        # are bounded. The ASGI server buffers what it has been handed without
+        # waiting on the client's socket, so a client that stops reading is
+        # only caught here once the event loop itself falls behind.
+        self.buckets = {}
+        self.rate_limit_strikes = 0
+        self.send_queue = asyncio.Queue(maxsize=settings.WEBSOCKET_SEND_QUEUE_SIZE)
+        self.writer = asyncio.create_task(self.drain_send_queue())
+        send_queue_stats.register(self, self.send_queue)
+
     async def disconnect(self, close_code):
+        if not self.registered:
+            return
+        if self.send_queue is not None:
+            self.writer.cancel()
+            send_queue_stats.unregister(self)
+        presence.disconnect(self.user_id)
         # Unsubscribe from personal channel
         await self.channel_layer.group_discard(
             self.personal_channel_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        event_type = text_data_json.get('type')
+    async def send_to_user(self, user_id, event):
+        # Nobody is listening on an offline user's group; chat messages are
+        # already stored and reach them through the inbox on next load
+        if not presence.is_online(int(user_id)):
+            return False
+        await self.channel_layer.group_send(f"user_{user_id}", event)
+        return True
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self.send_queue is None or close:
+            return await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        if self.closing:
+            return
+        try:
+            self.send_queue.put_nowait((time.monotonic(), text_data, bytes_data))
+        except asyncio.QueueFull:
+            await self.close_slow_consumer()
+
+    async def drain_send_queue(self):
+        while True:
+            queued_at, text_data, bytes_data = await self.send_queue.get()
+            if self.closing:
+                return
+            if time.monotonic() - queued_at > settings.WEBSOCKET_SEND_MAX_LAG:
+                await self.close_slow_consumer()
+                return
+            await super().send(text_data=text_data, bytes_data=bytes_data)
+
+    async def close_slow_consumer(self):
+        if self.closing:
+            return
+        self.closing = True
+        send_queue_stats.counters['slow_consumer_closes'] += 1
+        # The client resyncs missed messages from the API when it reconnects
+        await self.close(code=CLOSE_SLOW_CONSUMER)
+
+    def allow_frame(self, event_type):
+        # Types without their own limit share one bucket, so made-up type
+        # names neither dodge the limit nor grow self.buckets
+        limits = settings.WEBSOCKET_RATE_LIMITS
+        key = event_type if event_type in limits else 'default'
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(*limits[key])
+        return self.buckets[key].consume()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            text_data_json = loads(text_data)
+        except (TypeError, ValueError):
+            text_data_json = None
+        event_type = text_data_json.get('type') if isinstance(text_data_json, dict) else None
+        if not isinstance(event_type, str):
+            event_type = None
+
+        if not self.allow_frame(event_type):
+            send_queue_stats.counters['rate_limited_frames'] += 1
+            self.rate_limit_strikes += 1
+            if self.rate_limit_strikes > settings.WEBSOCKET_RATE_LIMIT_STRIKES:
+                self.closing = True
+                await self.close(code=CLOSE_RATE_LIMITED)
+            else:
+                await self.send(text_data=dumps({'type': 'error', 'error': 'rate_limited', 'event': event_type}))
+            return
+        self.rate_limit_strikes = 0
+
+        if event_type is None:
+            # Undecodable or untyped frames still used up a token above
+            await self.send(text_data=dumps({'type': 'error', 'error': 'invalid_frame'}))
+            return
 
         # Dispatch to the appropriate handler based on the type of the message
         if event_type == 'message':
@@ -43,22 +149,25 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.handle_remove_client(text_data_json)
         elif event_type == 'remove-trainer':
             await self.handle_remove_trainer(text_data_json)
+        elif event_type == 'mark-read':
+            await self.handle_mark_read(text_data_json)
 
     async def handle_chat_message(self, data):
-        # Prepare and send message to both the sender's and recipient's personal channel
+        # Prepare and send message to both the sender's and recipient's personal channel.
+        # The sender is always the authenticated user, whatever senderId says.
         message_data = {
             'type': 'chat_message',
             'message': {
-                'sender': data['senderId'],
+                'sender': self.user_id,
                 'recipient': data['recipientId'],
                 'content': data['content'],
             },
         }
         # Save the message
-        await self.save_message(data['senderId'],  data['recipientId'], data['content'])
+        await self.save_message(self.user_id, data['recipientId'], data['content'])
 
-        await self.channel_layer.group_send(f"user_{data['senderId']}", message_data)
-        await self.channel_layer.group_send(f"user_{data['recipientId']}", message_data)
+        await self.channel_layer.group_send(self.personal_channel_name, message_data)
+        await self.send_to_user(data['recipientId'], message_data)
 
     async def handle_trainer_request(self, data):
         # Directly relay the trainer request data to the recipient's channel
@@ -72,7 +181,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'is_active': data['is_active']
             },
         }
-        await self.channel_layer.group_send(f"user_{data['to_user']}", request_data)
+        await self.send_to_user(data['to_user'], request_data)
 
     async def handle_accepted_response(self, data):
         # Process trainer request responses (accepted or rejected)
@@ -84,7 +193,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'to_user': data['to_user']
             }
         }
-        await self.channel_layer.group_send(f"user_{data['to_user']}", response_data)
+        await self.send_to_user(data['to_user'], response_data)
 
     async def handle_rejected_response(self, data):
         # Process trainer request responses (accepted or rejected)
@@ -96,7 +205,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'to_user': data['to_user']
             }
         }
-        await self.channel_layer.group_send(f"user_{data['to_user']}", response_data)
+        await self.send_to_user(data['to_user'], response_data)
 
     async def handle_remove_client(self, data):
         response_data = {
@@ -106,7 +215,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'to_user': data['to_user']
             }
         }
-        await self.channel_layer.group_send(f"user_{data['to_user']}", response_data)
+        await self.send_to_user(data['to_user'], response_data)
 
     async def handle_remove_trainer(self, data):
         response_data = {
@@ -116,49 +225,93 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'to_user': data['to_user']
             }
         }
-        await self.channel_layer.group_send(f"user_{data['to_user']}", response_data)
+        await self.send_to_user(data['to_user'], response_data)
+
+    async def handle_mark_read(self, data):
+        try:
+            chat_session_id = int(data['chatSessionId'])
+        except (KeyError, TypeError, ValueError):
+            await self.send(text_data=dumps({'type': 'error', 'error': 'invalid_chat_session', 'event': 'mark-read'}))
+            return
+        up_to = data.get('upTo')
+        # Same rule as MarkChatReadView: upTo is a message id or absent
+        if up_to is not None and not isinstance(up_to, int):
+            await self.send(text_data=dumps({'type': 'error', 'error': 'invalid_up_to', 'event': 'mark-read'}))
+            return
+        participants = await timed_database_sync_to_async(chat_participant_ids)(chat_session_id)
+        if self.user_id not in participants:
+            return
+        user = self.scope['user']
+        marked = await timed_database_sync_to_async(mark_read)(user, chat_session_id, up_to)
+        if not marked:
+            return
+        for recipient in participants - {self.user_id}:
+            await self.send_to_user(recipient, read_receipt_event(chat_session_id, self.user_id, up_to))
+        # Refresh the badge on all of the reader's devices
+        await self.channel_layer.group_send(self.personal_channel_name, {
+            'type': 'forward_unread_counts',
+            'data': await timed_database_sync_to_async(unread_counts)(user),
+        })
 
     async def chat_message(self, event):
         # Send chat message data to the WebSocket client
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'message',
             'message': event['message']
         }))
     
     async def forward_trainer_request(self, event):
         # Forward the trainer request data to the WebSocket client
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'trainer-request-sent',
             'data': event['request']
         }))
 
     async def forward_request_accepted(self, event):
         # Handler for when a trainer request is accepted
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'trainer_request_accepted',
             'data': event['data']
         }))
 
     async def forward_request_rejected(self, event):
         # Handler for when a trainer request is rejected
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'trainer_request_rejected',
             'data': event['data']
         }))
 
     async def forward_remove_client(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'remove_client',
             'data': event['data']
         }))
 
     async def forward_remove_trainer(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'remove_trainer',
             'data': event['data']
         }))
 
-    @database_sync_to_async
+    async def forward_messages_read(self, event):
+        await self.send(text_data=dumps({
+            'type': 'messages_read',
+            'data': event['data']
+        }))
+
+    async def forward_unread_counts(self, event):
+        await self.send(text_data=dumps({
+            'type': 'unread_counts',
+            'data': event['data']
+        }))
+
+    async def forward_personal_records(self, event):
+        await self.send(text_data=dumps({
+            'type': 'personal_record',
+            'data': event['data']
+        }))
+
+    @timed_database_sync_to_async
     def get_or_create_chat_session(self, user_id_1, user_id_2):
         # Ensure the user IDs are in a consistent order
         user_id_1, user_id_2 = sorted([user_id_1, user_id_2])
@@ -181,14 +334,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def save_message(self, sender_id, recipient_id, content):
         # Retrieve sender and recipient from the database
-        sender = await database_sync_to_async(User.objects.get)(id=sender_id)
-        recipient = await database_sync_to_async(User.objects.get)(id=recipient_id)
+        sender = await timed_database_sync_to_async(User.objects.get)(id=sender_id)
+        recipient = await timed_database_sync_to_async(User.objects.get)(id=recipient_id)
 
         # Get or create a chat session between sender and recipient
         chat_session, created = await self.get_or_create_chat_session(sender_id, recipient_id)
 
         # Create and save the new message
-        message = await database_sync_to_async(Message.objects.create)(
+        message = await timed_database_sync_to_async(Message.objects.create)(
             sender=sender,
             content=content,
             chat_session=chat_session
@@ -0,0 +1,73 @@
+import csv
+from asgiref.sync import sync_to_async
+from .fast_json import dumps
+from .models import ExerciseSet
+
+# Streaming training-history export. Rows are read from ExerciseSet in
+# server-side chunks and encoded one at a time, so memory use stays flat no
+# matter how many years of sets a user has.
+
+EXPORT_COLUMNS = ['session_id', 'date', 'workout', 'exercise', 'set_number', 'reps', 'weight_used', 'is_logged']
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+class Echo:
+    """File-like object whose write() hands the value straight back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+def iter_history_rows(user):
+    # Ordering by (session_date, id) follows the (user, session_date) index, so
+    # SQLite can stream rows without sorting the user's whole history first
+    rows = ExerciseSet.objects.filter(user=user).order_by('session_date', 'id').values_list(
+        'exercise_log__workout_session_id',
+        'session_date',
+        'exercise_log__workout_session__workout__name',
+        'exercise__name',
+        'set_number',
+        'reps',
+        'weight_used',
+        'is_logged',
+    )
+    for session_id, date, *rest in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [session_id, date.isoformat() if date else None, *rest]
+
+def buffered(lines, lines_per_chunk=500):
+    # Group lines so the response isn't written to the socket one row at a time
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+def stream_csv(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    yield from buffered(writer.writerow(row) for row in iter_history_rows(user))
+
+def stream_ndjson(user):
+    yield from buffered(dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in iter_history_rows(user))
+
+async def aiter_stream(stream):
+    # Under ASGI, StreamingHttpResponse collects a sync iterator into a list
+    # before sending it, so hand it an async iterator that pulls one chunk at a
+    # time through the sync thread where the DB cursor lives
+    iterator = iter(stream)
+    done = object()
+    while True:
+        chunk = await sync_to_async(next)(iterator, done)
+        if chunk is done:
+            break
+        yield chunk
+
+EXPORT_STREAMS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,72 @@
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .profiling import timed
+
+# orjson-backed JSON for DRF responses/requests and websocket frames. orjson is
+# optional: without it everything falls back to the stdlib/DRF behaviour.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_drf_encoder = JSONEncoder()
+
+# Datetimes are passed through to DRF's encoder so their format (e.g. the 'Z'
+# suffix and millisecond precision) is identical to the stdlib path
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+def _default(obj):
+    return _drf_encoder.default(obj)
+
+def dumps(data):
+    """Encode data as a JSON str, e.g. for a websocket text frame."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS).decode()
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers beyond 64 bits, which the stdlib encoder handles
+    return json.dumps(data, cls=JSONEncoder)
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return self.render_json(data, accepted_media_type, renderer_context)
+
+    def render_json(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Indented output (e.g. ?format=json from the browsable API) keeps the stdlib path
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Match JSONRenderer, which escapes these for JavaScript consumers
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
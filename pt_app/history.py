@@ -0,0 +1,60 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ExerciseSet
+
+# Per-exercise set history for one user, newest session first. Sets are read
+# straight off the denormalized user/exercise/session_date columns, so the
+# (user, exercise, session_date) index answers the query whatever the number
+# of workouts sharing the exercise. Pages hold whole sessions and are bounded
+# by a date window.
+
+HISTORY_DEFAULT_DAYS = 365
+HISTORY_MAX_DAYS = 3650
+HISTORY_DEFAULT_LIMIT = 20
+HISTORY_MAX_LIMIT = 100
+
+def encode_history_cursor(session_date):
+    return urlsafe_b64encode(session_date.isoformat().encode()).decode()
+
+def parse_history_cursor(value):
+    # Sessions older than the cursor's date make up the next page
+    if not value:
+        return None
+    try:
+        session_date = parse_datetime(urlsafe_b64decode(value.encode()).decode())
+    except (Base64Error, UnicodeDecodeError, ValueError):
+        session_date = None
+    # encode_history_cursor writes the aware session date; naive ones can't be compared
+    if session_date is None or timezone.is_naive(session_date):
+        raise ValueError('Invalid cursor.')
+    return session_date
+
+def exercise_set_history(user, exercise_id, days=HISTORY_DEFAULT_DAYS, before=None, limit=HISTORY_DEFAULT_LIMIT):
+    sets = ExerciseSet.objects.filter(
+        user=user,
+        exercise_id=exercise_id,
+        session_date__gte=timezone.now() - timedelta(days=days),
+        weight_used__gt=0,
+    )
+    if before is not None:
+        sets = sets.filter(session_date__lt=before)
+
+    # The page's session dates first, then only their sets
+    dates = list(sets.order_by('-session_date').values_list('session_date', flat=True).distinct()[:limit + 1])
+    next_cursor = None
+    if len(dates) > limit:
+        dates = dates[:limit]
+        next_cursor = encode_history_cursor(dates[-1])
+    if not dates:
+        return [], None
+
+    sessions = {session_date: [] for session_date in dates}
+    page = sets.filter(session_date__gte=dates[-1]).order_by('-session_date', 'exercise_log_id', 'set_number').only(
+        'id', 'exercise_log_id', 'set_number', 'reps', 'weight_used', 'video', 'is_logged', 'session_date'
+    )
+    for exercise_set in page:
+        sessions[exercise_set.session_date].append(exercise_set)
+    return list(sessions.items()), next_cursor
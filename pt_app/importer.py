@@ -0,0 +1,221 @@
+import csv
+from datetime import datetime, time
+from itertools import islice
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import capfirst
+from .cache import invalidate_user_charts
+from .records import rebuild_personal_records
+from .models import (Program, Workout, Exercise, WorkoutExercise, UserProgramProgress, WorkoutSession, ExerciseLog,
+                     ExerciseSet)
+
+# Bulk import of training history from CSV. Accepts the export format from
+# pt_app.export; only date, exercise, set_number, reps and weight_used are
+# required. Rows are processed in chunks, each chunk resolving names in bulk
+# and inserting sessions, logs and sets with bulk_create in one transaction.
+
+IMPORT_REQUIRED_COLUMNS = ['date', 'exercise', 'set_number', 'reps', 'weight_used']
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_PROGRAM_NAME = 'Imported history'
+IMPORT_DEFAULT_WORKOUT = 'Imported workout'
+MAX_REPORTED_ERRORS = 100
+# reps and weight_used beyond this are typos, and past 64 bits SQLite can't store them
+IMPORT_MAX_NUMBER = 2 ** 31 - 1
+
+class HistoryImportError(ValueError):
+    pass
+
+class HistoryImporter:
+    def __init__(self, user, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.progress = progress
+        # Lookups carried across chunks so a session split over a chunk boundary stays one session
+        self.exercise_ids = {}
+        self.workout_ids = {}
+        self.workout_exercise_ids = {}
+        self.session_ids = {}
+        self.log_ids = {}
+        self.log_set_counts = {}
+        self.result = {'rows': 0, 'sets_created': 0, 'sessions_created': 0, 'exercises_created': 0, 'errors': []}
+
+    def run(self, lines):
+        reader = csv.DictReader(lines)
+        missing = [column for column in IMPORT_REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise HistoryImportError(f"Missing required columns: {', '.join(missing)}")
+
+        with transaction.atomic():
+            self.program, _ = Program.objects.get_or_create(
+                creator=self.user, name=IMPORT_PROGRAM_NAME,
+                defaults={'description': 'Training history imported from another app.'}
+            )
+            self.user_program_progress, _ = UserProgramProgress.objects.get_or_create(
+                user=self.user, program=self.program, defaults={'is_active': False}
+            )
+
+        while True:
+            # Line 1 is the header, so data rows start at line 2
+            chunk = list(islice(enumerate(reader, start=self.result['rows'] + 2), self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                self.import_chunk(chunk)
+            self.result['rows'] += len(chunk)
+            if self.progress:
+                self.progress(self.result)
+
+        with transaction.atomic():
+            updated_at = timezone.now()
+            logs = [ExerciseLog(id=log_id, sets_completed=count, updated_at=updated_at) for log_id, count in self.log_set_counts.items()]
+            ExerciseLog.objects.bulk_update(logs, ['sets_completed', 'updated_at'], batch_size=1000)
+
+        # bulk_create skips update_personal_records, so recount them from the full history
+        rebuild_personal_records([self.user.id])
+        invalidate_user_charts(self.user.id)
+        return self.result
+
+    def import_chunk(self, chunk):
+        rows = []
+        for line_number, raw in chunk:
+            try:
+                rows.append(self.parse_row(raw))
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+                    self.result['errors'].append({'line': line_number, 'error': str(e)})
+
+        self.resolve_exercises({row['exercise'] for row in rows})
+        self.resolve_workouts({row['workout'] for row in rows})
+        self.resolve_workout_exercises({(self.workout_ids[row['workout']], self.exercise_ids[row['exercise']]) for row in rows})
+
+        new_sessions = {}
+        for row in rows:
+            if row['session_key'] not in self.session_ids and row['session_key'] not in new_sessions:
+                new_sessions[row['session_key']] = WorkoutSession(
+                    user_program_progress=self.user_program_progress, user=self.user,
+                    workout_id=self.workout_ids[row['workout']], date=row['date'], completed=True, active=False
+                )
+        WorkoutSession.objects.bulk_create(new_sessions.values())
+        for key, session in new_sessions.items():
+            self.session_ids[key] = session.id
+        self.result['sessions_created'] += len(new_sessions)
+
+        new_logs = {}
+        for row in rows:
+            log_key = (row['session_key'], self.exercise_ids[row['exercise']])
+            if log_key not in self.log_ids and log_key not in new_logs:
+                workout_exercise_key = (self.workout_ids[row['workout']], self.exercise_ids[row['exercise']])
+                new_logs[log_key] = ExerciseLog(
+                    workout_session_id=self.session_ids[row['session_key']],
+                    workout_exercise_id=self.workout_exercise_ids[workout_exercise_key],
+                    user=self.user, exercise_id=log_key[1], session_date=row['date']
+                )
+        ExerciseLog.objects.bulk_create(new_logs.values())
+        for key, log in new_logs.items():
+            self.log_ids[key] = log.id
+
+        exercise_sets = []
+        for row in rows:
+            log_id = self.log_ids[(row['session_key'], self.exercise_ids[row['exercise']])]
+            self.log_set_counts[log_id] = self.log_set_counts.get(log_id, 0) + 1
+            exercise_sets.append(ExerciseSet(
+                exercise_log_id=log_id, set_number=row['set_number'], reps=row['reps'],
+                weight_used=row['weight_used'], is_logged=row['is_logged'], user=self.user,
+                exercise_id=self.exercise_ids[row['exercise']], session_date=row['date']
+            ))
+        ExerciseSet.objects.bulk_create(exercise_sets)
+        self.result['sets_created'] += len(exercise_sets)
+
+    def parse_row(self, raw):
+        # csv.DictReader fills the columns missing from a short row with None
+        raw_date = (raw.get('date') or '').strip()
+        date = parse_datetime(raw_date)
+        if date is None:
+            day = parse_date(raw_date)
+            if day is None:
+                raise ValueError(f"Invalid date: {raw_date!r}")
+            date = datetime.combine(day, time.min)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+
+        exercise = capfirst((raw.get('exercise') or '').strip())
+        workout = (raw.get('workout') or '').strip() or IMPORT_DEFAULT_WORKOUT
+        if not exercise:
+            raise ValueError('Exercise name is required')
+        if len(exercise) > 50 or len(workout) > 50:
+            raise ValueError('Exercise and workout names must be at most 50 characters')
+
+        set_number = (raw.get('set_number') or '').strip()
+        if not set_number:
+            raise ValueError('set_number is required')
+
+        return {
+            'date': date,
+            'exercise': exercise,
+            'workout': workout,
+            # Without a session id, sets of the same workout at the same time form one session
+            'session_key': (raw.get('session_id') or '').strip() or (date, workout),
+            'set_number': int(set_number),
+            'reps': parse_number(raw.get('reps')),
+            'weight_used': parse_number(raw.get('weight_used')),
+            'is_logged': (raw.get('is_logged') or 'true').strip().lower() not in ('false', '0', 'no'),
+        }
+
+    def resolve_exercises(self, names):
+        names = names - self.exercise_ids.keys()
+        if not names:
+            return
+        # Shared catalog exercises win over the user's own, matching WorkoutExerciseSerializer
+        for exercise in Exercise.objects.filter(name__in=names, creator=self.user).only('id', 'name'):
+            self.exercise_ids[exercise.name] = exercise.id
+        for exercise in Exercise.objects.filter(name__in=names, creator=None).only('id', 'name'):
+            self.exercise_ids[exercise.name] = exercise.id
+
+        created = Exercise.objects.bulk_create([
+            Exercise(name=name, creator=self.user) for name in names - self.exercise_ids.keys()
+        ])
+        for exercise in created:
+            self.exercise_ids[exercise.name] = exercise.id
+        self.result['exercises_created'] += len(created)
+
+    def resolve_workouts(self, names):
+        names = names - self.workout_ids.keys()
+        if not names:
+            return
+        for workout in Workout.objects.filter(program=self.program, name__in=names).only('id', 'name'):
+            self.workout_ids[workout.name] = workout.id
+        created = Workout.objects.bulk_create([
+            Workout(program=self.program, name=name, creator=self.user) for name in names - self.workout_ids.keys()
+        ])
+        for workout in created:
+            self.workout_ids[workout.name] = workout.id
+
+    def resolve_workout_exercises(self, keys):
+        keys = keys - self.workout_exercise_ids.keys()
+        if not keys:
+            return
+        existing = WorkoutExercise.objects.filter(
+            workout_id__in={workout_id for workout_id, _ in keys}
+        ).values_list('workout_id', 'exercise_id', 'id')
+        for workout_id, exercise_id, workout_exercise_id in existing:
+            self.workout_exercise_ids.setdefault((workout_id, exercise_id), workout_exercise_id)
+        created = WorkoutExercise.objects.bulk_create([
+            WorkoutExercise(workout_id=workout_id, exercise_id=exercise_id, sets=0, reps=0)
+            for workout_id, exercise_id in keys - self.workout_exercise_ids.keys()
+        ])
+        for workout_exercise in created:
+            self.workout_exercise_ids[(workout_exercise.workout_id, workout_exercise.exercise_id)] = workout_exercise.id
+
+def parse_number(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    # weight_used and reps are whole numbers; round values like "102.5"
+    number = round(float(value))
+    if abs(number) > IMPORT_MAX_NUMBER:
+        raise ValueError(f"Number out of range: {value!r}")
+    return number
+
+def import_history(user, lines, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    return HistoryImporter(user, chunk_size=chunk_size, progress=progress).run(lines)
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import ChatSession, Message, UnreadCounter
+
+# Unread counts per (user, chat session), maintained incrementally: +1 for each
+# participant other than the sender when a message arrives, -n when n messages
+# are marked read. Counter rows are created when participants join a session.
+
+def ensure_counters(chat_session_id, user_ids):
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(chat_session_id=chat_session_id, user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True
+    )
+
+def adjust_unread(message, delta):
+    counters = UnreadCounter.objects.filter(chat_session_id=message.chat_session_id).exclude(user_id=message.sender_id)
+    counters.update(count=Greatest(F('count') + delta, 0))
+
+def mark_read(user, chat_session_id, up_to=None):
+    # Everything sent to the user in the session up to and including message
+    # id up_to (or all of it) becomes read in one UPDATE
+    messages = Message.objects.filter(chat_session_id=chat_session_id, read=False).exclude(sender=user)
+    if up_to is not None:
+        messages = messages.filter(id__lte=up_to)
+    with transaction.atomic():
+        marked = messages.update(read=True, updated_at=timezone.now())
+        if marked:
+            UnreadCounter.objects.filter(chat_session_id=chat_session_id, user=user).update(
+                count=Greatest(F('count') - marked, 0)
+            )
+    return marked
+
+def unread_counts(user):
+    sessions = dict(UnreadCounter.objects.filter(user=user, count__gt=0).values_list('chat_session_id', 'count'))
+    return {'total': sum(sessions.values()), 'sessions': sessions}
+
+def rebuild_unread_counters(user=None):
+    # Recount from Message, e.g. after data fixes done with raw SQL
+    participants = ChatSession.participants.through.objects.all()
+    if user is not None:
+        participants = participants.filter(user=user)
+    unread = Message.objects.filter(read=False)
+    if user is not None:
+        unread = unread.filter(chat_session__participants=user)
+    unread = unread.values('chat_session_id', 'sender_id').annotate(n=Count('id'))
+    unread_by_session = {}
+    for row in unread:
+        unread_by_session.setdefault(row['chat_session_id'], []).append((row['sender_id'], row['n']))
+
+    counters = [
+        UnreadCounter(
+            user_id=user_id, chat_session_id=chat_session_id,
+            count=sum(n for sender_id, n in unread_by_session.get(chat_session_id, []) if sender_id != user_id)
+        )
+        for chat_session_id, user_id in participants.values_list('chatsession_id', 'user_id')
+    ]
+    with transaction.atomic():
+        existing = UnreadCounter.objects.all() if user is None else UnreadCounter.objects.filter(user=user)
+        existing.delete()
+        UnreadCounter.objects.bulk_create(counters, batch_size=1000)
+    return len(counters)
+
+def read_receipt_event(chat_session_id, reader_id, up_to):
+    return {
+        'type': 'forward_messages_read',
+        'data': {'chat_session': chat_session_id, 'reader': reader_id, 'up_to': up_to},
+    }
+
+def chat_participant_ids(chat_session_id):
+    return set(
+        ChatSession.participants.through.objects.filter(chatsession_id=chat_session_id).values_list('user_id', flat=True)
+    )
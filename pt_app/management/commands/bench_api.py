@@ -0,0 +1,149 @@
+import os
+import random
+import tempfile
+from itertools import cycle
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework_simplejwt.tokens import AccessToken
+from pt_app.benchmarking import measure, write_results
+from pt_app.models import User, Workout, WorkoutSession, ExerciseLog, ExerciseSet
+from pt_app.synthetic import generate_synthetic_data, SYNTHETIC_PREFIX
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the hot REST endpoints through the test client against a freshly seeded test database, '
+            'reporting latency percentiles and query counts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--sessions', type=int, default=100, help='Workout sessions per user over the last year.')
+        parser.add_argument('--messages', type=int, default=50, help='Messages per chat session.')
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        setup_test_environment()
+        # A file-backed test database so the SQLite pragmas apply as in production
+        tmp = tempfile.TemporaryDirectory()
+        test_settings = settings.DATABASES['default'].setdefault('TEST', {})
+        test_settings['NAME'] = os.path.join(tmp.name, 'bench_api.sqlite3')
+        # The schema is built from the models: the early migrations can't be replayed on an empty database
+        test_settings['MIGRATE'] = False
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options)
+            results = self.run_benchmarks(options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            tmp.cleanup()
+
+        self.stdout.write(f"{'endpoint':<36}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'queries':>9}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<36}{result['p50_ms']:>10.2f}{result['p90_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['queries']:>9}")
+
+        if options['output']:
+            write_results(options['output'], 'api', results, **{
+                key: options[key] for key in ('users', 'sessions', 'messages', 'iterations', 'seed')
+            })
+
+    def seed(self, options):
+        generate_synthetic_data(users=options['users'], sessions_per_user=options['sessions'], days=365,
+                                messages_per_chat=options['messages'], seed=options['seed'])
+        self.users = list(User.objects.filter(username__startswith=SYNTHETIC_PREFIX).order_by('id'))
+        # start_workout_session needs a workout from the user's active program
+        self.workouts_by_user = {}
+        for workout in Workout.objects.filter(program__active_users__is_active=True).order_by('id'):
+            self.workouts_by_user.setdefault(workout.creator_id, []).append(workout)
+
+    def run_benchmarks(self, iterations):
+        rng = self.rng
+        clients = {
+            user.id: Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}') for user in self.users
+        }
+        users = cycle(self.users)
+        chart_cache = caches['charts']
+        state = {}
+
+        def pick_user():
+            state['user'] = next(users)
+            return state['user']
+
+        def end_active_sessions():
+            user = pick_user()
+            WorkoutSession.objects.filter(user=user, active=True).update(active=False, completed=True)
+
+        def start_session():
+            user = state['user']
+            response = clients[user.id].post(
+                '/start_workout_session/', {'workout_id': rng.choice(self.workouts_by_user[user.id]).id},
+                content_type='application/json'
+            )
+            assert response.status_code == 200, response.content
+
+        def pick_set():
+            user = pick_user()
+            state['set_id'] = ExerciseSet.objects.filter(user=user).order_by('?').values_list('id', flat=True)[0]
+
+        def update_set():
+            response = clients[state['user'].id].patch(
+                f"/exercise_set_update/{state['set_id']}/", {'reps': rng.randint(1, 12), 'weight_used': rng.randint(20, 200)},
+                content_type='application/json'
+            )
+            assert response.status_code == 200, response.content
+
+        def pick_log():
+            user = pick_user()
+            state['log_id'] = ExerciseLog.objects.filter(user=user).order_by('-id').values_list('id', flat=True)[0]
+
+        def create_set():
+            response = clients[state['user'].id].post(
+                f"/exercise-logs/{state['log_id']}/exercise-sets/", {'reps': 8, 'weight_used': 100},
+                content_type='application/json'
+            )
+            assert response.status_code == 201, response.content
+
+        def get(path):
+            def request():
+                response = clients[state['user'].id].get(path(state['user']) if callable(path) else path)
+                assert response.status_code == 200, response.content
+            return request
+
+        def cold_chart():
+            pick_user()
+            chart_cache.clear()
+
+        def first_exercise(user):
+            return f"/exercise/{ExerciseSet.objects.filter(user=user).values_list('exercise_id', flat=True)[0]}/1rm/"
+
+        cases = {
+            # start_workout_session leaves an active session behind for check_active_session
+            'start_workout_session': (end_active_sessions, start_session),
+            'check_active_session': (pick_user, get('/check_active_session/')),
+            'exercise_set_update': (pick_set, update_set),
+            'exercise_set_create': (pick_log, create_set),
+            'user_chats': (pick_user, get('/user_chats/')),
+            'charts.sessions_3_months.cold': (cold_chart, get('/workout_sessions_last_3_months/')),
+            'charts.sessions_3_months.warm': (pick_user, get('/workout_sessions_last_3_months/')),
+            'charts.exercise_1rm.cold': (cold_chart, get(first_exercise)),
+            'charts.exercises_with_weights.cold': (cold_chart, get('/exercises_with_weights/')),
+            'charts.cumulative_weight.cold': (cold_chart, get('/cumulative-weight/')),
+        }
+
+        results = {}
+        for name, (setup, request) in cases.items():
+            # Query counts come from one extra run so capturing doesn't skew the timings
+            setup()
+            # The log is a bounded deque; once seeding fills it, its length stops changing
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            results[name] = measure(request, iterations, setup=setup)
+            results[name]['queries'] = len(queries.captured_queries)
+        return results
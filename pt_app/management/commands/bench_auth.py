@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from pt_app.authentication import CachedJWTAuthentication, TokenClaimsJWTAuthentication
+from pt_app.benchmarking import measure, write_results
+from pt_app.models import User
+
+AUTHENTICATORS = {
+    'jwt': JWTAuthentication,
+    'cached': CachedJWTAuthentication,
+    'claims': TokenClaimsJWTAuthentication,
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request authentication overhead of the stock, cached and claims-based JWT authenticators.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--user', help='Username to authenticate as (defaults to the first active user).')
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=options['user']).first() if options['user'] else users.order_by('id').first()
+        if user is None:
+            raise CommandError('No active user to authenticate as.')
+
+        header = f'Bearer {AccessToken.for_user(user)}'
+        factory = APIRequestFactory()
+
+        results = {}
+        for name, authenticator_class in AUTHENTICATORS.items():
+            def authenticate():
+                # A fresh request and authenticator each time, as DRF does per request
+                request = Request(factory.get('/', HTTP_AUTHORIZATION=header))
+                return authenticator_class().authenticate(request)
+
+            authenticate()  # Warm the user cache outside the timed loop
+            with CaptureQueriesContext(connection) as queries:
+                authenticate()
+            results[name] = measure(authenticate, options['iterations'])
+            results[name]['queries_per_request'] = len(queries.captured_queries)
+
+        self.stdout.write(f"{'authenticator':<15}{'p50 us':>10}{'p99 us':>10}{'queries':>10}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<15}{result['p50_ms'] * 1000:>10.1f}{result['p99_ms'] * 1000:>10.1f}{result['queries_per_request']:>10}")
+
+        if options['output']:
+            write_results(options['output'], 'auth', results, iterations=options['iterations'])
@@ -0,0 +1,77 @@
+import io
+import json
+from itertools import cycle, islice
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from pt_app import fast_json
+from pt_app.benchmarking import measure, write_results
+from pt_app.models import WorkoutSession, Message
+from pt_app.serializers import WorkoutSessionSerializer, MessageSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare stdlib and fast JSON rendering/parsing on nested workout sessions and chat history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help='Workout sessions in the nested session payload.')
+        parser.add_argument('--messages', type=int, default=2000, help='Messages in the chat history payload.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file.')
+
+    def handle(self, *args, **options):
+        if fast_json.orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed; the fast path falls back to the stdlib.'))
+
+        sessions = self.build_payload(
+            WorkoutSessionSerializer,
+            WorkoutSession.objects.order_by('-id').select_related('workout__creator').prefetch_related(
+                'workout__workout_exercises__exercise', 'exercise_logs__workout_exercise__exercise', 'exercise_logs__exercise_sets'
+            ),
+            options['sessions'],
+        )
+        messages = self.build_payload(MessageSerializer, Message.objects.order_by('-timestamp'), options['messages'])
+        frames = [{'type': 'message', 'message': {'sender': m['sender'], 'recipient': m['sender'], 'content': m['content']}} for m in messages]
+
+        iterations = options['iterations']
+        results = {}
+        for name, payload in (('workout_sessions', sessions), ('chat_history', messages)):
+            body = JSONRenderer().render(payload)
+            results[f'{name}.render'] = {
+                'stdlib': measure(lambda: JSONRenderer().render(payload), iterations),
+                'fast': measure(lambda: fast_json.FastJSONRenderer().render(payload), iterations),
+            }
+            results[f'{name}.parse'] = {
+                'stdlib': measure(lambda: JSONParser().parse(io.BytesIO(body)), iterations),
+                'fast': measure(lambda: fast_json.FastJSONParser().parse(io.BytesIO(body)), iterations),
+            }
+            results[f'{name}.render']['bytes'] = len(body)
+
+        # Websocket frames are encoded and decoded one at a time by ChatConsumer
+        encoded = [json.dumps(frame) for frame in frames]
+        results['chat_frames.encode'] = {
+            'stdlib': measure(lambda: [json.dumps(frame, cls=JSONEncoder) for frame in frames], iterations),
+            'fast': measure(lambda: [fast_json.dumps(frame) for frame in frames], iterations),
+        }
+        results['chat_frames.decode'] = {
+            'stdlib': measure(lambda: [json.loads(frame) for frame in encoded], iterations),
+            'fast': measure(lambda: [fast_json.loads(frame) for frame in encoded], iterations),
+        }
+
+        self.stdout.write(f"{'case':<28}{'stdlib p50 ms':>15}{'fast p50 ms':>15}{'speedup':>10}")
+        for case, timings in results.items():
+            stdlib_ms, fast_ms = timings['stdlib']['p50_ms'], timings['fast']['p50_ms']
+            speedup = stdlib_ms / fast_ms if fast_ms else float('inf')
+            timings['speedup'] = round(speedup, 2)
+            self.stdout.write(f"{case:<28}{stdlib_ms:>15.3f}{fast_ms:>15.3f}{speedup:>9.1f}x")
+
+        if options['output']:
+            write_results(options['output'], 'json', results, sessions=len(sessions), messages=len(messages), iterations=iterations)
+
+    def build_payload(self, serializer_class, queryset, size):
+        data = serializer_class(queryset[:size], many=True).data
+        if not data:
+            raise CommandError(f'No {queryset.model.__name__} rows to build the payload from.')
+        # Repeat the real rows to reach the requested size on small databases
+        return list(islice(cycle(data), size))
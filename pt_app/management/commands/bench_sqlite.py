@@ -0,0 +1,137 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from pt_app.benchmarking import summarize, write_results
+from pt_app.models import ExerciseSet, ExerciseLog, WorkoutSession
+
+# What SQLite does without the tuned profile from settings
+DEFAULT_PROFILE = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'options': {'timeout': 5},
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure mixed chart-read / set-write throughput on a copy of the database, default vs tuned SQLite profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file.')
+
+    def handle(self, *args, **options):
+        db_settings = connections['default'].settings_dict
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only applies to the SQLite backend.')
+
+        set_ids = list(ExerciseSet.objects.values_list('id', flat=True)[:10000])
+        user_ids = list(WorkoutSession.objects.values_list('user_program_progress__user_id', flat=True).distinct())
+        if not set_ids or not user_ids:
+            raise CommandError('The database has no workout sessions/sets to benchmark against.')
+
+        source = str(db_settings['NAME'])
+        connections.close_all()
+        original = {'NAME': db_settings['NAME'], 'OPTIONS': db_settings.get('OPTIONS', {})}
+        original_pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+        tuned_profile = {'pragmas': original_pragmas, 'options': original['OPTIONS']}
+
+        results = {}
+        try:
+            for name, profile in (('default', DEFAULT_PROFILE), ('tuned', tuned_profile)):
+                with tempfile.TemporaryDirectory() as tmp:
+                    # Each profile starts from a fresh copy so neither run sees the other's writes
+                    db_settings['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+                    shutil.copyfile(source, db_settings['NAME'])
+                    db_settings['OPTIONS'] = profile['options']
+                    settings.SQLITE_PRAGMAS = profile['pragmas']
+                    results[name] = self.run_profile(set_ids, user_ids, options)
+                    connections.close_all()
+        finally:
+            db_settings.update(original)
+            settings.SQLITE_PRAGMAS = original_pragmas
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<8} reads/s {result['reads_per_sec']:>9.1f}  writes/s {result['writes_per_sec']:>8.1f}  "
+                f"locked errors {result['locked_errors']:>5}  read p99 {result['read_latency']['p99_ms']:.2f} ms  "
+                f"write p99 {result['write_latency']['p99_ms']:.2f} ms"
+            )
+
+        if options['output']:
+            write_results(options['output'], 'sqlite', results, readers=options['readers'], writers=options['writers'], duration=options['duration'])
+
+    def run_profile(self, set_ids, user_ids, options):
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        stats = {'reads': [], 'writes': [], 'locked_errors': 0}
+
+        def record(kind, elapsed=None, locked=False):
+            with lock:
+                if locked:
+                    stats['locked_errors'] += 1
+                else:
+                    stats[kind].append(elapsed)
+
+        def reader(rng):
+            try:
+                while time.monotonic() < deadline:
+                    user_id = rng.choice(user_ids)
+                    start = time.perf_counter()
+                    try:
+                        # The shape of the 1RM/volume chart queries
+                        list(ExerciseSet.objects.filter(
+                            exercise_log__workout_session__user_program_progress__user_id=user_id,
+                            weight_used__isnull=False
+                        ).values_list('weight_used', 'reps', 'exercise_log__workout_session__date'))
+                        WorkoutSession.objects.filter(user_program_progress__user_id=user_id).count()
+                    except OperationalError:
+                        record('reads', locked=True)
+                        continue
+                    record('reads', time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        def writer(rng):
+            try:
+                while time.monotonic() < deadline:
+                    set_id = rng.choice(set_ids)
+                    start = time.perf_counter()
+                    try:
+                        # Same read-then-write pattern as logging a set during a session
+                        with transaction.atomic():
+                            exercise_set = ExerciseSet.objects.get(id=set_id)
+                            exercise_set.reps = rng.randint(1, 12)
+                            exercise_set.weight_used = rng.randint(5, 300)
+                            exercise_set.save()
+                            ExerciseLog.objects.filter(id=exercise_set.exercise_log_id).update(sets_completed=F('sets_completed'))
+                    except OperationalError:
+                        record('writes', locked=True)
+                        continue
+                    record('writes', time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        rng = random.Random(options['seed'])
+        threads = [threading.Thread(target=reader, args=(random.Random(rng.random()),)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(random.Random(rng.random()),)) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'reads_per_sec': len(stats['reads']) / options['duration'],
+            'writes_per_sec': len(stats['writes']) / options['duration'],
+            'locked_errors': stats['locked_errors'],
+            'read_latency': summarize(stats['reads']),
+            'write_latency': summarize(stats['writes']),
+        }
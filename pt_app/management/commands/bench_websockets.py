@@ -0,0 +1,267 @@
+import asyncio
+import base64
+import gc
+import itertools
+import os
+import random
+import shutil
+import struct
+import tempfile
+import time
+from urllib.parse import urlparse
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework_simplejwt.tokens import AccessToken
+from pt_app.benchmarking import resident_memory_kb, summarize, write_results
+from pt_app.fast_json import dumps, loads
+from pt_app.models import User
+
+BENCH_PREFIX = 'bench'
+
+
+class InProcessClient:
+    # Talks to the ASGI application directly, no sockets involved
+    def __init__(self, application, path):
+        from channels.testing import WebsocketCommunicator
+        self.communicator = WebsocketCommunicator(application, path)
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=30)
+        return connected
+
+    async def send(self, data):
+        await self.communicator.send_to(text_data=dumps(data))
+
+    async def receive(self):
+        # Returns a decoded frame, or None once the server closed the socket
+        while True:
+            try:
+                output = await self.communicator.receive_output(timeout=3600)
+            except asyncio.TimeoutError:
+                continue
+            if output['type'] == 'websocket.close':
+                return None
+            if output['type'] == 'websocket.send':
+                return loads(output['text'])
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class SocketClient:
+    # A minimal RFC 6455 client over asyncio streams. autobahn can't be used
+    # here: daphne in INSTALLED_APPS pins txaio to Twisted for the process.
+    def __init__(self, url, path):
+        self.url = urlparse(url)
+        self.path = path
+        self.reader = self.writer = None
+
+    async def connect(self):
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.url.hostname, self.url.port or 80), timeout=30
+            )
+            key = base64.b64encode(os.urandom(16)).decode()
+            self.writer.write((
+                f'GET {self.path} HTTP/1.1\r\nHost: {self.url.netloc}\r\nUpgrade: websocket\r\n'
+                f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n'
+                f'Origin: http://{self.url.netloc}\r\n\r\n'
+            ).encode())
+            response = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), timeout=30)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return False
+        return response.startswith(b'HTTP/1.1 101')
+
+    async def send(self, data, opcode=0x1):
+        payload = dumps(data).encode() if opcode == 0x1 else data
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([0x80 | len(payload)])
+        elif len(payload) < 65536:
+            header += bytes([0x80 | 126]) + struct.pack('!H', len(payload))
+        else:
+            header += bytes([0x80 | 127]) + struct.pack('!Q', len(payload))
+        # Client frames must be masked
+        mask = os.urandom(4)
+        self.writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+        await self.writer.drain()
+
+    async def receive(self):
+        while True:
+            try:
+                first, second = await self.reader.readexactly(2)
+                length = second & 0x7F
+                if length == 126:
+                    length, = struct.unpack('!H', await self.reader.readexactly(2))
+                elif length == 127:
+                    length, = struct.unpack('!Q', await self.reader.readexactly(8))
+                payload = await self.reader.readexactly(length)
+            except (OSError, asyncio.IncompleteReadError):
+                return None
+            opcode = first & 0x0F
+            if opcode == 0x1:
+                return loads(payload)
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                await self.send(payload, opcode=0xA)
+
+    async def close(self):
+        if self.writer is not None:
+            await self.send(struct.pack('!H', 1000), opcode=0x8)
+            self.writer.close()
+
+
+class Command(BaseCommand):
+    help = ('Open N ChatConsumer connections, drive chat and trainer-request traffic between them and report '
+            'connections held, deliveries/sec, delivery latency and memory per connection.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=100)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of traffic after all connections are open.')
+        parser.add_argument('--rate', type=float, default=1.0, help='Frames per second sent by each connection.')
+        parser.add_argument('--trainer-request-ratio', type=float, default=0.1,
+                            help='Share of frames that are trainer-request relays instead of chat messages.')
+        parser.add_argument('--url', help='Run against a live server (e.g. ws://127.0.0.1:8000) instead of in-process.')
+        parser.add_argument('--server-pid', type=int, help='With --url, the server process to sample memory from.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        if options['url']:
+            # The server's own database is used, so the users must exist there already
+            users = list(User.objects.filter(is_active=True).order_by('id')[:options['connections']])
+            if len(users) < options['connections']:
+                raise CommandError(f'Only {len(users)} active users available for {options["connections"]} connections.')
+            results = asyncio.run(self.run(users, options))
+        else:
+            # Chat messages are written to the database, so run against a throwaway copy
+            db_settings = connections['default'].settings_dict
+            original_name = db_settings['NAME']
+            connections.close_all()
+            with tempfile.TemporaryDirectory() as tmp:
+                db_settings['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+                shutil.copyfile(original_name, db_settings['NAME'])
+                try:
+                    users = self.bench_users(options['connections'])
+                    results = asyncio.run(self.run(users, options))
+                finally:
+                    connections.close_all()
+                    db_settings['NAME'] = original_name
+
+        latency = results.pop('latency')
+        self.stdout.write(
+            f"mode {results['mode']}  connections held {results['connections_held']}/{options['connections']}  "
+            f"deliveries/s {results['deliveries_per_sec']:.1f}  latency p50 {latency['p50_ms']:.2f} ms  "
+            f"p99 {latency['p99_ms']:.2f} ms  lost {results['lost']}  "
+            f"memory/connection {results['memory_per_connection_kb'] or 'n/a'} KB"
+        )
+        results['latency'] = latency
+        if options['output']:
+            write_results(options['output'], 'websockets', results, **{
+                key: options[key] for key in ('connections', 'duration', 'rate', 'trainer_request_ratio', 'url', 'seed')
+            })
+
+    def bench_users(self, count):
+        users = list(User.objects.filter(is_active=True).order_by('id')[:count])
+        missing = count - len(users)
+        if missing > 0:
+            password = make_password(None)
+            User.objects.bulk_create([
+                User(username=f'{BENCH_PREFIX}_ws_{i}', password=password) for i in range(missing)
+            ])
+            users += list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}_ws_').order_by('id')[:missing])
+        return users
+
+    async def run(self, users, options):
+        if options['url']:
+            make_client = lambda path: SocketClient(options['url'], path)
+            memory_pid = options['server_pid']
+        else:
+            from ptproject.asgi import application
+            make_client = lambda path: InProcessClient(application, path)
+            memory_pid = 'self'
+
+        gc.collect()
+        memory_before = resident_memory_kb(memory_pid) if memory_pid else None
+        clients = {user.id: make_client(f'/ws/user/{user.id}/?token={AccessToken.for_user(user)}') for user in users}
+        connected = {}
+        user_ids = list(clients)
+        # Open in batches so the handshakes don't all queue on the auth lookup at once
+        for start in range(0, len(user_ids), 50):
+            batch = user_ids[start:start + 50]
+            for user_id, ok in zip(batch, await asyncio.gather(*(clients[user_id].connect() for user_id in batch))):
+                if ok:
+                    connected[user_id] = clients[user_id]
+        gc.collect()
+        memory_after = resident_memory_kb(memory_pid) if memory_pid else None
+        if len(connected) < 2:
+            raise CommandError(f'Only {len(connected)} connections could be opened.')
+
+        pending = {}
+        latencies = []
+        stats = {'sent': 0, 'server_closes': 0}
+        frame_ids = itertools.count()
+
+        async def reader(user_id, client):
+            while True:
+                frame = await client.receive()
+                if frame is None:
+                    stats['server_closes'] += 1
+                    return
+                if frame.get('type') == 'message' and frame['message'].get('recipient') == user_id:
+                    key = frame['message']['content']
+                elif frame.get('type') == 'trainer-request-sent':
+                    key = frame['data']['created_at']
+                else:
+                    continue  # Echoes to the sender, rate-limit errors, receipts
+                sent_at = pending.pop(key, None)
+                if sent_at is not None:
+                    latencies.append(time.perf_counter() - sent_at)
+
+        async def writer(user_id, client, deadline, rng):
+            peers = [peer for peer in connected if peer != user_id]
+            interval = 1 / options['rate']
+            await asyncio.sleep(rng.random() * interval)
+            while time.perf_counter() < deadline:
+                recipient = rng.choice(peers)
+                key = f'{BENCH_PREFIX}:{next(frame_ids)}'
+                if rng.random() < options['trainer_request_ratio']:
+                    frame = {'type': 'trainer-request-sent', 'id': 0, 'from_user': user_id, 'to_user': recipient,
+                             'created_at': key, 'is_active': True}
+                else:
+                    frame = {'type': 'message', 'senderId': user_id, 'recipientId': recipient, 'content': key}
+                pending[key] = time.perf_counter()
+                await client.send(frame)
+                stats['sent'] += 1
+                await asyncio.sleep(interval)
+
+        readers = [asyncio.create_task(reader(user_id, client)) for user_id, client in connected.items()]
+        deadline = time.perf_counter() + options['duration']
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            writer(user_id, client, deadline, random.Random(self.rng.random())) for user_id, client in connected.items()
+        ))
+        # Give in-flight frames a moment to land before counting them as lost
+        await asyncio.sleep(2)
+        elapsed = time.perf_counter() - started
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*(client.close() for client in connected.values()), return_exceptions=True)
+
+        memory_per_connection = None
+        if memory_before is not None and memory_after is not None:
+            memory_per_connection = round((memory_after - memory_before) / len(connected), 1)
+        return {
+            'mode': 'socket' if options['url'] else 'in-process',
+            'connections_held': len(connected),
+            'frames_sent': stats['sent'],
+            'deliveries': len(latencies),
+            'lost': len(pending),
+            'server_closes': stats['server_closes'],
+            'deliveries_per_sec': len(latencies) / elapsed,
+            'memory_per_connection_kb': memory_per_connection,
+            'latency': summarize(latencies),
+        }
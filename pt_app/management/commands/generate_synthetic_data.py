@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from pt_app.synthetic import generate_synthetic_data, SYNTHETIC_CHUNK_USERS
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a coherent synthetic dataset (users, trainers and clients, programs, years of '
+            'sessions/logs/sets, chats) for profiling. The defaults give about 3M sets; '
+            '--users 3500 reaches about 10M.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--sessions-per-user', type=int, default=200)
+        parser.add_argument('--days', type=int, default=730, help='Length of the training history in days.')
+        parser.add_argument('--programs-per-user', type=int, default=2)
+        parser.add_argument('--workouts-per-program', type=int, default=4)
+        parser.add_argument('--exercises-per-workout', type=int, default=5)
+        parser.add_argument('--sets-per-exercise', type=int, default=3)
+        parser.add_argument('--trainer-ratio', type=float, default=0.05, help='Share of users who train clients.')
+        parser.add_argument('--clients-per-trainer', type=int, default=10)
+        parser.add_argument('--chats-per-user', type=int, default=1, help='Chats started with random users, besides trainer chats.')
+        parser.add_argument('--messages-per-chat', type=int, default=40)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=SYNTHETIC_CHUNK_USERS, help='Users per transaction.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['sessions_per_user'] < 1 or options['days'] < 1:
+            raise CommandError('--users, --sessions-per-user and --days must be positive.')
+        if options['exercises_per_workout'] > 30:
+            raise CommandError('--exercises-per-workout can be at most 30.')
+
+        expected_sets = options['users'] * options['sessions_per_user'] * options['exercises_per_workout'] * options['sets_per_exercise']
+        self.stdout.write(f"Generating {options['users']} users and about {expected_sets} sets")
+        start = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - start
+            self.stdout.write(f"{result['users']} users, {result['sets']} sets ({result['sets'] / elapsed:.0f} sets/s)")
+
+        result = generate_synthetic_data(
+            progress=progress, chunk_size=options['chunk_size'], seed=options['seed'],
+            **{key: options[key] for key in (
+                'users', 'sessions_per_user', 'days', 'programs_per_user', 'workouts_per_program', 'exercises_per_workout',
+                'sets_per_exercise', 'trainer_ratio', 'clients_per_trainer', 'chats_per_user', 'messages_per_chat'
+            )}
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['users']} users, {result['programs']} programs, {result['sessions']} sessions, "
+            f"{result['sets']} sets, {result['relationships']} trainer relationships, {result['chats']} chats and "
+            f"{result['messages']} messages in {time.monotonic() - start:.1f}s"
+        ))
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from pt_app.importer import import_history, HistoryImportError, IMPORT_CHUNK_SIZE
+from pt_app.models import User
+
+
+class Command(BaseCommand):
+    help = 'Import training history for a user from a CSV file (same columns as the history export).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--user', required=True, help='Username to import the history for.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+
+        start = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - start
+            self.stdout.write(f"{result['rows']} rows, {result['sets_created']} sets ({result['rows'] / elapsed:.0f} rows/s)")
+
+        try:
+            with open(options['csv_path'], encoding='utf-8-sig', newline='') as f:
+                result = import_history(user, f, chunk_size=options['chunk_size'], progress=progress)
+        except (OSError, HistoryImportError) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['sets_created']} sets in {result['sessions_created']} sessions "
+            f"({result['exercises_created']} new exercises) in {time.monotonic() - start:.1f}s"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from pt_app.profiling import make_profile_token, PROFILING_MODES
+
+
+class Command(BaseCommand):
+    help = ("Print a signed X-Profile header value that turns on request profiling, e.g. "
+            "curl -H 'X-Profile: <token>' ...; the slowest profiles show up at profiling/traces/.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('modes', nargs='*',
+                            help=f"Extra profiling on top of the SQL/serializer/render timings: {', '.join(PROFILING_MODES)}.")
+
+    def handle(self, *args, **options):
+        try:
+            self.stdout.write(make_profile_token(options['modes']))
+        except ValueError as e:
+            raise CommandError(str(e))
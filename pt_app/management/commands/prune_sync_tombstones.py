@@ -0,0 +1,14 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pt_app.models import SyncTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete delta-sync tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones older than {cutoff:%Y-%m-%d}'))
@@ -0,0 +1,231 @@
+import functools
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from channels.db import DatabaseSyncToAsync
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from .backpressure import send_queue_stats
+from .presence import presence
+
+# Process-local metrics in the Prometheus text exposition format, scraped from
+# the local-only metrics/ endpoint. Kept dependency-free: counters, gauges and
+# histograms with labels are all this needs. Each worker process has its own
+# registry, so scrape every worker (or sum them) when running more than one.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for name, key, value, *extra in self.samples():
+            lines.append(f'{name}{format_labels(self.labelnames, key, *extra)} {format_value(value)}')
+        return lines
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        # collect, if given, is called at scrape time and returns the value, or
+        # a {label values tuple: value} dict for labelled gauges
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        collected = self.collect()
+        if not isinstance(collected, dict):
+            collected = {(): collected}
+        return [(self.name, key, value) for key, value in sorted(collected.items())]
+
+class CallbackCounter(Gauge):
+    # A counter whose values are kept elsewhere and read at scrape time
+    type = 'counter'
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        return HistogramTimer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key, cumulative, [('le', format_value(bound))]))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, cumulative))
+        return samples
+
+class HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        # Labels may be filled in inside the block, e.g. the outcome of a call
+        if 'outcome' in self.histogram.labelnames and 'outcome' not in self.labels:
+            self.labels['outcome'] = 'error' if exc_type else 'ok'
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+# HTTP, recorded by MetricsMiddleware. Routes are URL patterns, not paths, so
+# the label sets stay bounded.
+http_requests = Counter('pt_http_requests_total', 'HTTP requests by route, method and status code.',
+                        ['route', 'method', 'status'])
+http_request_duration = Histogram('pt_http_request_duration_seconds', 'HTTP request latency by route.',
+                                  ['route', 'method'])
+http_request_queries = Histogram('pt_http_request_db_queries', 'Database queries per HTTP request by route.',
+                                 ['route'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+# Websockets, read from the ChatConsumer bookkeeping at scrape time
+websocket_connections = Gauge('pt_websocket_connections', 'Open ChatConsumer connections.',
+                              collect=lambda: send_queue_stats.snapshot()['connections'])
+websocket_online_users = Gauge('pt_websocket_online_users', 'Users with at least one open connection.',
+                               collect=lambda: presence.online_count())
+websocket_queued_frames = Gauge('pt_websocket_queued_frames', 'Outbound frames waiting in ChatConsumer send queues.',
+                                collect=lambda: send_queue_stats.snapshot()['queued_frames'])
+websocket_events = CallbackCounter('pt_websocket_events_total', 'Slow-consumer closes and rate-limited frames.',
+                                   ['event'], collect=lambda: {(event,): count for event, count in send_queue_stats.counters.items()})
+channel_layer_messages = Counter('pt_channel_layer_messages_total', 'Channel layer messages by operation and type.',
+                                 ['operation', 'type'])
+
+# Sync work done from async code: how long calls wait for the database thread, and how long they then run
+db_sync_wait = Histogram('pt_database_sync_to_async_wait_seconds', 'Time database_sync_to_async calls wait to start.',
+                         ['function'], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+db_sync_duration = Histogram('pt_database_sync_to_async_duration_seconds', 'Run time of database_sync_to_async calls.',
+                             ['function'])
+
+openai_request_duration = Histogram('pt_openai_request_duration_seconds', 'OpenAI API call latency.',
+                                    ['view', 'outcome'], buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120))
+
+class InstrumentedInMemoryChannelLayer(InMemoryChannelLayer):
+    async def send(self, channel, message):
+        try:
+            await super().send(channel, message)
+        except ChannelFull:
+            channel_layer_messages.inc(operation='dropped', type=message.get('type', ''))
+            raise
+        channel_layer_messages.inc(operation='send', type=message.get('type', ''))
+
+    async def group_send(self, group, message):
+        channel_layer_messages.inc(operation='group_send', type=message.get('type', ''))
+        await super().group_send(group, message)
+
+    async def receive(self, channel):
+        message = await super().receive(channel)
+        channel_layer_messages.inc(operation='receive', type=message.get('type', ''))
+        return message
+
+_queued_at = contextvars.ContextVar('pt_app_db_sync_queued_at', default=None)
+
+class TimedDatabaseSyncToAsync(DatabaseSyncToAsync):
+    # The call is stamped on the way in; the copied context carries the stamp
+    # into the worker thread, where the wrapper sees how long it waited
+    def __init__(self, func, *args, **kwargs):
+        name = getattr(func, '__name__', type(func).__name__)
+
+        @functools.wraps(func)
+        def timed(*call_args, **call_kwargs):
+            started = time.perf_counter()
+            queued_at = _queued_at.get()
+            if queued_at is not None:
+                db_sync_wait.observe(started - queued_at, function=name)
+            try:
+                return func(*call_args, **call_kwargs)
+            finally:
+                db_sync_duration.observe(time.perf_counter() - started, function=name)
+
+        super().__init__(timed, *args, **kwargs)
+
+    async def __call__(self, *args, **kwargs):
+        token = _queued_at.set(time.perf_counter())
+        try:
+            return await super().__call__(*args, **kwargs)
+        finally:
+            _queued_at.reset(token)
+
+# Drop-in for channels' database_sync_to_async
+timed_database_sync_to_async = TimedDatabaseSyncToAsync
@@ -0,0 +1,75 @@
+import random
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from .metrics import http_requests, http_request_duration, http_request_queries
+from .profiling import RequestProfile, parse_profile_token, install_serializer_timing, traces
+from .slow_queries import current_view
+
+class MetricsMiddleware:
+    """Request count, latency and query count per route for the metrics/ endpoint."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        current_view.set(None)
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        # The URL pattern rather than the path, so ids don't explode the label sets
+        route = resolver_match.route if resolver_match else 'unmatched'
+        http_requests.inc(route=route, method=request.method, status=response.status_code)
+        http_request_duration.observe(duration, route=route, method=request.method)
+        http_request_queries.observe(queries, route=route)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Lets the slow-query log name the view a query came from
+        current_view.set(request.resolver_match.view_name)
+
+class ProfilingMiddleware:
+    """
+    Profile requests that carry a valid signed X-Profile header (see the
+    profiling_token command) or fall in the PROFILING_SAMPLE_RATE fraction.
+    Everything else passes straight through.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_serializer_timing()
+
+    def __call__(self, request):
+        modes = self.profiling_modes(request)
+        if modes is None:
+            return self.get_response(request)
+
+        profile = RequestProfile(request, modes)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.execute_wrapper))
+            with profile:
+                response = self.get_response(request)
+        # Streaming responses are only timed up to the first byte
+        response['Server-Timing'] = profile.server_timing()
+        traces.add(profile.as_trace(response))
+        return response
+
+    def profiling_modes(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token:
+            return parse_profile_token(token)
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return list(settings.PROFILING_SAMPLE_MODES)
+        return None
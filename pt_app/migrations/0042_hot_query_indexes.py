@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0041_alter_exercise_name_alter_exercise_video_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['name', 'creator'], name='exercise_name_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_session', 'timestamp'], name='message_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='program',
+            index=models.Index(condition=models.Q(('is_ai_generated', True)), fields=['creator', 'created_at'], name='program_creator_ai_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainerrequest',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['to_user'], name='trainerrequest_to_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainerrequest',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['from_user'], name='trainerrequest_from_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(condition=models.Q(('is_ai_generated', True)), fields=['creator', 'created_at'], name='workout_creator_ai_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(fields=['user_program_progress', 'date'], name='session_progress_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(condition=models.Q(('active', True)), fields=['user_program_progress'], name='session_active_idx'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_owner_columns(apps, schema_editor):
+    WorkoutSession = apps.get_model('pt_app', 'WorkoutSession')
+    ExerciseLog = apps.get_model('pt_app', 'ExerciseLog')
+    ExerciseSet = apps.get_model('pt_app', 'ExerciseSet')
+    UserProgramProgress = apps.get_model('pt_app', 'UserProgramProgress')
+    WorkoutExercise = apps.get_model('pt_app', 'WorkoutExercise')
+
+    WorkoutSession.objects.update(user_id=Subquery(
+        UserProgramProgress.objects.filter(pk=OuterRef('user_program_progress_id')).values('user_id')[:1]
+    ))
+    sessions = WorkoutSession.objects.filter(pk=OuterRef('workout_session_id'))
+    ExerciseLog.objects.update(
+        user_id=Subquery(sessions.values('user_id')[:1]),
+        session_date=Subquery(sessions.values('date')[:1]),
+        exercise_id=Subquery(WorkoutExercise.objects.filter(pk=OuterRef('workout_exercise_id')).values('exercise_id')[:1]),
+    )
+    logs = ExerciseLog.objects.filter(pk=OuterRef('exercise_log_id'))
+    ExerciseSet.objects.update(
+        user_id=Subquery(logs.values('user_id')[:1]),
+        exercise_id=Subquery(logs.values('exercise_id')[:1]),
+        session_date=Subquery(logs.values('session_date')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0042_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='workoutsession',
+            name='session_progress_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='workoutsession',
+            name='session_active_idx',
+        ),
+        migrations.AddField(
+            model_name='exerciselog',
+            name='exercise',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercise_logs', to='pt_app.exercise'),
+        ),
+        migrations.AddField(
+            model_name='exerciselog',
+            name='session_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exerciselog',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercise_logs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='exerciseset',
+            name='exercise',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercise_sets', to='pt_app.exercise'),
+        ),
+        migrations.AddField(
+            model_name='exerciseset',
+            name='session_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exerciseset',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercise_sets', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='workoutsession',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='workout_sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owner_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='exerciselog',
+            index=models.Index(fields=['user', 'exercise', 'session_date'], name='log_user_exercise_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseset',
+            index=models.Index(fields=['user', 'exercise', 'session_date'], name='set_user_exercise_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseset',
+            index=models.Index(fields=['user', 'session_date'], name='set_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(fields=['user', 'date'], name='session_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(condition=models.Q(('active', True)), fields=['user'], name='session_user_active_idx'),
+        ),
+    ]
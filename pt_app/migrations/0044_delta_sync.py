@@ -0,0 +1,72 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0043_denormalized_owner_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('program_id', models.IntegerField(blank=True, null=True)),
+                ('chat_session_id', models.IntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='exerciselog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='exerciseset',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='workoutexercise',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='workoutsession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='exerciselog',
+            index=models.Index(fields=['user', 'updated_at'], name='log_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseset',
+            index=models.Index(fields=['user', 'updated_at'], name='set_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(fields=['user', 'updated_at'], name='session_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    ChatSession = apps.get_model('pt_app', 'ChatSession')
+    Message = apps.get_model('pt_app', 'Message')
+    UnreadCounter = apps.get_model('pt_app', 'UnreadCounter')
+
+    unread_by_session = {}
+    for row in Message.objects.filter(read=False).values('chat_session_id', 'sender_id').annotate(n=Count('id')):
+        unread_by_session.setdefault(row['chat_session_id'], []).append((row['sender_id'], row['n']))
+
+    UnreadCounter.objects.bulk_create([
+        UnreadCounter(
+            user_id=user_id, chat_session_id=chat_session_id,
+            count=sum(n for sender_id, n in unread_by_session.get(chat_session_id, []) if sender_id != user_id)
+        )
+        for chat_session_id, user_id in ChatSession.participants.through.objects.values_list('chatsession_id', 'user_id')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0044_delta_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('chat_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='pt_app.chatsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('count__gt', 0)), fields=['user'], name='unread_counter_user_unread_idx')],
+                'constraints': [models.UniqueConstraint(fields=('chat_session', 'user'), name='unread_counter_session_user_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0045_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['timestamp'], name='message_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(fields=['date'], name='session_date_idx'),
+        ),
+    ]
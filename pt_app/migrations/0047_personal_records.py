@@ -0,0 +1,65 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+REP_RANGE_BOUNDS = [('1', 1, 1), ('2-3', 2, 3), ('4-6', 4, 6), ('7-10', 7, 10), ('11-15', 11, 15), ('16+', 16, None)]
+
+
+def backfill_personal_records(apps, schema_editor):
+    ExerciseSet = apps.get_model('pt_app', 'ExerciseSet')
+    PersonalRecord = apps.get_model('pt_app', 'PersonalRecord')
+
+    def rep_range(reps):
+        return next(label for label, low, high in REP_RANGE_BOUNDS if reps >= low and (high is None or reps <= high))
+
+    # Oldest first, so each best points at the first set that reached it
+    rows = ExerciseSet.objects.filter(reps__gte=1, weight_used__gte=1, user__isnull=False, exercise__isnull=False).order_by(
+        'user_id', 'exercise_id', 'session_date', 'id'
+    ).values_list('id', 'user_id', 'exercise_id', 'reps', 'weight_used', 'session_date')
+    records = {}
+    for set_id, user_id, exercise_id, reps, weight_used, session_date in rows.iterator(chunk_size=10000):
+        key = (user_id, exercise_id, rep_range(reps))
+        record = records.setdefault(key, PersonalRecord(user_id=user_id, exercise_id=exercise_id, rep_range=key[2]))
+        metrics = {'weight': weight_used, 'e1rm': round(weight_used * (1 + reps / 30.0), 1), 'volume': weight_used * reps}
+        for metric, value in metrics.items():
+            if getattr(record, f'best_{metric}') is None or value > getattr(record, f'best_{metric}'):
+                setattr(record, f'best_{metric}', value)
+                setattr(record, f'best_{metric}_set_id', set_id)
+                setattr(record, f'best_{metric}_date', session_date)
+    PersonalRecord.objects.bulk_create(records.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0046_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rep_range', models.CharField(choices=[('1', '1'), ('2-3', '2-3'), ('4-6', '4-6'), ('7-10', '7-10'), ('11-15', '11-15'), ('16+', '16+')], max_length=5)),
+                ('best_weight', models.IntegerField()),
+                ('best_weight_date', models.DateTimeField(blank=True, null=True)),
+                ('best_e1rm', models.FloatField()),
+                ('best_e1rm_date', models.DateTimeField(blank=True, null=True)),
+                ('best_volume', models.IntegerField()),
+                ('best_volume_date', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('best_e1rm_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pt_app.exerciseset')),
+                ('best_volume_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pt_app.exerciseset')),
+                ('best_weight_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pt_app.exerciseset')),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_records', to='pt_app.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'exercise', 'rep_range'), name='unique_personal_record')],
+            },
+        ),
+        migrations.RunPython(backfill_personal_records, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-19 19:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pt_app', '0047_personal_records'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reps', models.IntegerField()),
+                ('weight', models.IntegerField()),
+                ('last_sets', models.IntegerField()),
+                ('last_reps', models.IntegerField()),
+                ('last_weight', models.IntegerField()),
+                ('stalls', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_targets', to=settings.AUTH_USER_MODEL)),
+                ('workout_exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='pt_app.workoutexercise')),
+                ('workout_session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pt_app.workoutsession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'workout_exercise'), name='unique_exercise_target')],
+            },
+        ),
+    ]
@@ -32,6 +32,15 @@ class TrainerRequest(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Pending requests shown to the recipient and the sender. Django renders
+            # boolean filters as a bare column, which SQLite matches against a
+            # partial index condition but not against a boolean key column.
+            models.Index(fields=['to_user'], condition=models.Q(is_active=True), name='trainerrequest_to_active_idx'),
+            models.Index(fields=['from_user'], condition=models.Q(is_active=True), name='trainerrequest_from_active_idx'),
+        ]
+
     def __str__(self):
         return f"Trainer request from {self.from_user} to {self.to_user}"
 
@@ -50,6 +59,13 @@ class Program(models.Model):
     participants = models.ManyToManyField(User, related_name='participating_programs', blank=True)
     is_ai_generated = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Weekly AI generation limit
+            models.Index(fields=['creator', 'created_at'], condition=models.Q(is_ai_generated=True), name='program_creator_ai_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -61,6 +77,13 @@ class Workout(models.Model):
     order = models.PositiveIntegerField(default=0)
     is_ai_generated = models.BooleanField(default=False)  # Indicates if the workout is AI-generated
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Weekly AI generation limit
+            models.Index(fields=['creator', 'created_at'], condition=models.Q(is_ai_generated=True), name='workout_creator_ai_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -71,6 +94,12 @@ class Exercise(models.Model):
     video = models.CharField(max_length=50, blank=True, null=True)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Resolving exercise names against the shared and user-created catalog
+            models.Index(fields=['name', 'creator'], name='exercise_name_creator_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -81,6 +110,7 @@ class WorkoutExercise(models.Model):
     reps = models.IntegerField()
     note = models.TextField(blank=True, null=True)
     order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['order']
@@ -103,18 +133,60 @@ class WorkoutSession(models.Model):
     date = models.DateTimeField(default=now, editable=True)
     completed = models.BooleanField(default=False)
     active = models.BooleanField(default=True)
-    
+    # Denormalized from user_program_progress so per-user queries skip the join
+    user = models.ForeignKey(User, related_name='workout_sessions', on_delete=models.CASCADE, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Per-user session history and the date-range charts
+            models.Index(fields=['user', 'date'], name='session_user_date_idx'),
+            # Active session lookups; only a handful of rows are ever active
+            models.Index(fields=['user'], condition=models.Q(active=True), name='session_user_active_idx'),
+            # Delta sync
+            models.Index(fields=['user', 'updated_at'], name='session_user_updated_idx'),
+            # Admin date hierarchy across all users
+            models.Index(fields=['date'], name='session_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.user_program_progress.user_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"ID: {self.id} - {self.user_program_progress.user.username}'s session: {self.workout.name} on {self.date.strftime('%Y-%m-%d')}"
+        # One hop through the denormalized user, so lists can select_related it
+        user = self.user if self.user_id else self.user_program_progress.user
+        return f"ID: {self.id} - {user.username}'s session: {self.workout.name} on {self.date.strftime('%Y-%m-%d')}"
 
 class ExerciseLog(models.Model):
     workout_session = models.ForeignKey(WorkoutSession, related_name='exercise_logs', on_delete=models.CASCADE)
     workout_exercise = models.ForeignKey(WorkoutExercise, on_delete=models.CASCADE)
     sets_completed = models.IntegerField(default=0)
     note = models.TextField(blank=True, null=True)   
+    # Denormalized from workout_session and workout_exercise
+    user = models.ForeignKey(User, related_name='exercise_logs', on_delete=models.CASCADE, null=True, blank=True)
+    exercise = models.ForeignKey(Exercise, related_name='exercise_logs', on_delete=models.CASCADE, null=True, blank=True)
+    session_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'exercise', 'session_date'], name='log_user_exercise_date_idx'),
+            models.Index(fields=['user', 'updated_at'], name='log_user_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None or self.session_date is None:
+            self.user_id = self.workout_session.user_id
+            self.session_date = self.workout_session.date
+        if self.exercise_id is None:
+            self.exercise_id = self.workout_exercise.exercise_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Log for {self.workout_exercise.exercise.name} in session {self.workout_session.id}"
+        exercise = self.exercise if self.exercise_id else self.workout_exercise.exercise
+        return f"Log for {exercise.name} in session {self.workout_session_id}"
     
 class ExerciseSet(models.Model):
     exercise_log = models.ForeignKey(ExerciseLog, related_name='exercise_sets', on_delete=models.CASCADE)
@@ -123,14 +195,89 @@ class ExerciseSet(models.Model):
     weight_used = models.IntegerField(null=True, blank=True)
     video = models.FileField(upload_to='workout_videos/', blank=True, null=True)
     is_logged = models.BooleanField(default=False)
+    # Denormalized from exercise_log so per-user/per-exercise scans hit one table
+    user = models.ForeignKey(User, related_name='exercise_sets', on_delete=models.CASCADE, null=True, blank=True)
+    exercise = models.ForeignKey(Exercise, related_name='exercise_sets', on_delete=models.CASCADE, null=True, blank=True)
+    session_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
     class Meta:
         ordering = ['set_number']
+        indexes = [
+            models.Index(fields=['user', 'exercise', 'session_date'], name='set_user_exercise_date_idx'),
+            models.Index(fields=['user', 'session_date'], name='set_user_date_idx'),
+            models.Index(fields=['user', 'updated_at'], name='set_user_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Copied once: the API never moves a set to another log, and re-dated
+        # sessions and switched exercises are synced by signals.py
+        if self.user_id is None or self.exercise_id is None or self.session_date is None:
+            self.user_id = self.exercise_log.user_id
+            self.exercise_id = self.exercise_log.exercise_id
+            self.session_date = self.exercise_log.session_date
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Set {self.set_number} for {self.exercise_log.workout_exercise.exercise.name}"
+        exercise = self.exercise if self.exercise_id else self.exercise_log.workout_exercise.exercise
+        return f"Set {self.set_number} for {exercise.name}"
+
+class PersonalRecord(models.Model):
+    # Best set per user, exercise and rep range, kept up to date as sets are
+    # logged (see pt_app/records.py) so PRs never need a scan of the history.
+    # Each best points at the set that first reached it.
+    REP_RANGES = [('1', '1'), ('2-3', '2-3'), ('4-6', '4-6'), ('7-10', '7-10'), ('11-15', '11-15'), ('16+', '16+')]
+
+    user = models.ForeignKey(User, related_name='personal_records', on_delete=models.CASCADE)
+    exercise = models.ForeignKey(Exercise, related_name='personal_records', on_delete=models.CASCADE)
+    rep_range = models.CharField(max_length=5, choices=REP_RANGES)
+    best_weight = models.IntegerField()
+    best_weight_set = models.ForeignKey(ExerciseSet, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    best_weight_date = models.DateTimeField(null=True, blank=True)
+    # Estimated one-rep max (Epley), as in the 1RM chart
+    best_e1rm = models.FloatField()
+    best_e1rm_set = models.ForeignKey(ExerciseSet, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    best_e1rm_date = models.DateTimeField(null=True, blank=True)
+    # weight x reps of a single set
+    best_volume = models.IntegerField()
+    best_volume_set = models.ForeignKey(ExerciseSet, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    best_volume_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise', 'rep_range'], name='unique_personal_record'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}'s {self.rep_range} rep PR for exercise {self.exercise_id}: {self.best_weight}"
     
+class ExerciseTarget(models.Model):
+    # What the user should aim for the next time they do a workout exercise,
+    # worked out when a session ends (see pt_app/targets.py) so starting a
+    # session can suggest weights without reading any history
+    user = models.ForeignKey(User, related_name='exercise_targets', on_delete=models.CASCADE)
+    workout_exercise = models.ForeignKey(WorkoutExercise, related_name='targets', on_delete=models.CASCADE)
+    reps = models.IntegerField()
+    weight = models.IntegerField()
+    # The working sets of the session the target was worked out from
+    last_sets = models.IntegerField()
+    last_reps = models.IntegerField()
+    last_weight = models.IntegerField()
+    # Sessions in a row that missed the target; enough of them trigger a deload
+    stalls = models.IntegerField(default=0)
+    workout_session = models.ForeignKey(WorkoutSession, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'workout_exercise'], name='unique_exercise_target'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}'s target for workout exercise {self.workout_exercise_id}: {self.reps} @ {self.weight}"
+
 #Chat_Feature
 class ChatSession(models.Model):
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chats', blank=True)
@@ -145,8 +292,49 @@ class Message(models.Model):
     content = models.TextField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Chat history and last-message lookups
+            models.Index(fields=['chat_session', 'timestamp'], name='message_session_time_idx'),
+            # Admin date hierarchy across all chats
+            models.Index(fields=['timestamp'], name='message_time_idx'),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender} on {self.timestamp}"
 
+class UnreadCounter(models.Model):
+    # Messages from others in a chat session the user hasn't read yet, kept up
+    # to date as messages arrive and are read so the inbox badge never has to
+    # count Message rows
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='unread_counters', on_delete=models.CASCADE)
+    chat_session = models.ForeignKey(ChatSession, related_name='unread_counters', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat_session', 'user'], name='unread_counter_session_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(count__gt=0), name='unread_counter_user_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} has {self.count} unread in {self.chat_session}"
 
+#Delta sync
+class SyncTombstone(models.Model):
+    # Records a deleted row so offline clients can drop it. The scope columns are
+    # plain integers rather than foreign keys because the rows they point at may
+    # be deleted in the same cascade.
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    user_id = models.IntegerField(null=True, blank=True)
+    program_id = models.IntegerField(null=True, blank=True)
+    chat_session_id = models.IntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Deleted {self.model} {self.object_id}"
@@ -0,0 +1,32 @@
+from collections import Counter
+
+# Which users have an open websocket, counted per connection so a user with the
+# app open on two devices stays online until both disconnect. Kept in process
+# memory, which is layer-wide while CHANNEL_LAYERS uses InMemoryChannelLayer;
+# a shared layer (e.g. Redis) would need this moved alongside it.
+
+class PresenceRegistry:
+    def __init__(self):
+        self.connections = Counter()
+
+    def connect(self, user_id):
+        self.connections[user_id] += 1
+        return self.connections[user_id] == 1
+
+    def disconnect(self, user_id):
+        self.connections[user_id] -= 1
+        if self.connections[user_id] <= 0:
+            del self.connections[user_id]
+            return True
+        return False
+
+    def is_online(self, user_id):
+        return self.connections.get(user_id, 0) > 0
+
+    def online(self, user_ids):
+        return {user_id: self.is_online(user_id) for user_id in user_ids}
+
+    def online_count(self):
+        return len(self.connections)
+
+presence = PresenceRegistry()
@@ -0,0 +1,229 @@
+import contextvars
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import threading
+import time
+import tracemalloc
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.functional import empty
+
+# Per-request profiles for finding out where a slow endpoint spends its time.
+# ProfilingMiddleware (middleware.py) opens a RequestProfile for requests that
+# carry a signed X-Profile header or fall in the sampled fraction; SQL,
+# serializer and render time are added to it while the request runs, and the
+# slowest PROFILING_MAX_TRACES profiles of this process are kept for the
+# admin-only profiling/traces/ endpoint.
+
+PROFILING_MODES = ('cprofile', 'tracemalloc')
+PROFILING_TOKEN_SALT = 'pt_app.profiling'
+PROFILING_SLOW_QUERIES = 5
+PROFILING_CPROFILE_LINES = 40
+
+_current_profile = contextvars.ContextVar('pt_app_profile', default=None)
+
+def current_profile():
+    return _current_profile.get()
+
+def make_profile_token(modes=()):
+    """Header value that turns profiling on for a request, e.g. for curl -H 'X-Profile: <token>'."""
+    unknown = set(modes) - set(PROFILING_MODES)
+    if unknown:
+        raise ValueError(f"Unknown profiling modes: {', '.join(sorted(unknown))}")
+    return signing.TimestampSigner(salt=PROFILING_TOKEN_SALT).sign(','.join(modes) or 'timings')
+
+def parse_profile_token(token):
+    # Returns the requested modes, or None when the token is forged or expired
+    try:
+        value = signing.TimestampSigner(salt=PROFILING_TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    return [mode for mode in value.split(',') if mode in PROFILING_MODES]
+
+class RequestProfile:
+    def __init__(self, request, modes):
+        self.request = request
+        self.modes = modes
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.slow_queries = []
+        self.timings = {'serializer': 0.0, 'render': 0.0}
+        self.serializer_depth = 0
+        self.profiler = None
+        self.started_tracemalloc = False
+
+    def __enter__(self):
+        self.token = _current_profile.set(self)
+        if 'tracemalloc' in self.modes:
+            # Process-wide: concurrent requests in other threads add to the numbers
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self.started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self.memory_before = tracemalloc.take_snapshot()
+        if 'cprofile' in self.modes:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total_time = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+        if 'tracemalloc' in self.modes:
+            self.memory_after = tracemalloc.take_snapshot()
+            _, self.memory_peak = tracemalloc.get_traced_memory()
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+        _current_profile.reset(self.token)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper() for the duration of the request
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.sql_count += 1
+            self.sql_time += duration
+            if self.serializer_depth:
+                # Lazy querysets run inside serializer.data; keep them out of the serializer time
+                self.timings['serializer'] -= duration
+            heapq.heappush(self.slow_queries, (duration, self.sql_count, sql))
+            if len(self.slow_queries) > PROFILING_SLOW_QUERIES:
+                heapq.heappop(self.slow_queries)
+
+    def add_time(self, name, seconds):
+        self.timings[name] += seconds
+
+    def server_timing(self):
+        # Server-Timing lets browser devtools show the breakdown next to the request
+        return ', '.join([
+            f'sql;desc="{self.sql_count} queries";dur={self.sql_time * 1000:.1f}',
+            f'serializer;dur={self.timings["serializer"] * 1000:.1f}',
+            f'render;dur={self.timings["render"] * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def as_trace(self, response):
+        request = self.request
+        resolver_match = getattr(request, 'resolver_match', None)
+        trace = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': resolver_match.view_name if resolver_match else None,
+            'status': response.status_code,
+            'user_id': authenticated_user_id(request),
+            'started_at': self.started_at,
+            'modes': self.modes,
+            'total_ms': round(self.total_time * 1000, 3),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'serializer_ms': round(self.timings['serializer'] * 1000, 3),
+            'render_ms': round(self.timings['render'] * 1000, 3),
+            'slow_queries': [
+                {'ms': round(duration * 1000, 3), 'sql': sql}
+                for duration, _, sql in sorted(self.slow_queries, reverse=True)
+            ],
+        }
+        if self.profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(PROFILING_CPROFILE_LINES)
+            trace['cprofile'] = out.getvalue()
+        if 'tracemalloc' in self.modes:
+            trace['memory_peak_kb'] = round(self.memory_peak / 1024, 1)
+            trace['allocations'] = [
+                {'where': str(stat.traceback), 'size_kb': round(stat.size_diff / 1024, 1), 'count': stat.count_diff}
+                for stat in self.memory_after.compare_to(self.memory_before, 'lineno')[:10]
+            ]
+        return trace
+
+def authenticated_user_id(request):
+    # DRF puts its authenticated user on the request; don't force the lazy session user otherwise
+    user = request.__dict__.get('user')
+    user = getattr(user, '_wrapped', user)
+    if user is None or user is empty or not user.is_authenticated:
+        return None
+    return user.pk
+
+class TraceStore:
+    def __init__(self, size):
+        self.size = size
+        self.heap = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add(self, trace):
+        with self.lock:
+            trace['id'] = next(self.ids)
+            # Min-heap on total time: once full, a new trace only gets in by pushing out the fastest
+            entry = (trace['total_ms'], trace['id'], trace)
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, entry)
+            elif entry > self.heap[0]:
+                heapq.heapreplace(self.heap, entry)
+
+    def slowest(self):
+        with self.lock:
+            return [trace for _, _, trace in sorted(self.heap, reverse=True)]
+
+    def get(self, trace_id):
+        with self.lock:
+            return next((trace for _, id_, trace in self.heap if id_ == trace_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.heap = []
+
+traces = TraceStore(settings.PROFILING_MAX_TRACES)
+
+class timed:
+    """Add the time spent in the block to the current profile, if any."""
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = current_profile()
+        if self.profile is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.add_time(self.name, time.perf_counter() - self.start)
+
+_serializer_timing_installed = False
+
+def install_serializer_timing():
+    # Views call serializer.data directly, so the property itself is wrapped.
+    # Nested serializers go through to_representation and are covered by the
+    # outer call; the depth check keeps .data called inside .data from counting twice.
+    global _serializer_timing_installed
+    if _serializer_timing_installed:
+        return
+    from rest_framework.serializers import Serializer, ListSerializer
+
+    def wrap(prop):
+        def data(serializer):
+            profile = current_profile()
+            if profile is None or profile.serializer_depth:
+                return prop.fget(serializer)
+            profile.serializer_depth += 1
+            start = time.perf_counter()
+            try:
+                return prop.fget(serializer)
+            finally:
+                profile.serializer_depth -= 1
+                profile.add_time('serializer', time.perf_counter() - start)
+        return property(data)
+
+    Serializer.data = wrap(Serializer.data)
+    ListSerializer.data = wrap(ListSerializer.data)
+    _serializer_timing_installed = True
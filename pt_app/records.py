@@ -0,0 +1,173 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+from .models import ExerciseSet, PersonalRecord
+from .presence import presence
+
+# Personal records per (user, exercise, rep range), maintained incrementally:
+# each logged set is compared against the one PersonalRecord row for its
+# bucket, so detection costs one lookup whatever the size of the history. Only
+# edits or deletes of a set holding a best rescan the sets of that bucket.
+
+REP_RANGE_BOUNDS = [('1', 1, 1), ('2-3', 2, 3), ('4-6', 4, 6), ('7-10', 7, 10), ('11-15', 11, 15), ('16+', 16, None)]
+PR_METRICS = ('weight', 'e1rm', 'volume')
+
+def rep_range(reps):
+    for label, low, high in REP_RANGE_BOUNDS:
+        if reps >= low and (high is None or reps <= high):
+            return label
+    return None
+
+def set_metrics(reps, weight_used):
+    # None for sets that can't hold a record: unlogged, bodyweight or zero reps
+    if not reps or not weight_used or reps < 1 or weight_used < 1:
+        return None
+    return {'weight': weight_used, 'e1rm': round(weight_used * (1 + reps / 30.0), 1), 'volume': weight_used * reps}
+
+def record_payload(record, improved=()):
+    payload = {
+        'exercise_id': record.exercise_id,
+        'rep_range': record.rep_range,
+        'improved': list(improved),
+    }
+    for metric in PR_METRICS:
+        payload[metric] = {
+            'value': getattr(record, f'best_{metric}'),
+            'set_id': getattr(record, f'best_{metric}_set_id'),
+            'date': getattr(record, f'best_{metric}_date'),
+        }
+    return payload
+
+def apply_set(record, set_id, session_date, metrics, only_improvements=True):
+    # Moves the bests the set beats onto it and returns their names
+    improved = []
+    for metric in PR_METRICS:
+        if only_improvements and metrics[metric] <= getattr(record, f'best_{metric}'):
+            continue
+        setattr(record, f'best_{metric}', metrics[metric])
+        setattr(record, f'best_{metric}_set_id', set_id)
+        setattr(record, f'best_{metric}_date', session_date)
+        improved.append(metric)
+    return improved
+
+def update_personal_records(exercise_set, previous=None):
+    """
+    Bring the PRs in step with a set that was just created, or edited from
+    previous=(reps, weight_used). Returns the payloads of records the set
+    beat; the first set of a bucket sets the baseline and isn't reported,
+    and neither is an edited set keeping a best it already held.
+    """
+    if exercise_set.user_id is None or exercise_set.exercise_id is None:
+        return []
+    metrics = set_metrics(exercise_set.reps, exercise_set.weight_used)
+    bucket = rep_range(exercise_set.reps) if metrics else None
+
+    held = []
+    with transaction.atomic():
+        if previous is not None and set_metrics(*previous):
+            previous_bucket = rep_range(previous[0])
+            record = PersonalRecord.objects.select_for_update().filter(
+                user_id=exercise_set.user_id, exercise_id=exercise_set.exercise_id, rep_range=previous_bucket
+            ).first()
+            if record is not None:
+                held = [metric for metric in PR_METRICS if getattr(record, f'best_{metric}_set_id') == exercise_set.id]
+            if held:
+                # The record still counts the set's old numbers: rescan the bucket
+                # without it, then weigh the edited set against the rest below
+                recompute_personal_record(exercise_set.user_id, exercise_set.exercise_id, previous_bucket,
+                                          exclude_set_id=exercise_set.id)
+                if previous_bucket != bucket:
+                    held = []
+        if bucket is None:
+            return []
+
+        record = PersonalRecord.objects.select_for_update().filter(
+            user_id=exercise_set.user_id, exercise_id=exercise_set.exercise_id, rep_range=bucket
+        ).first()
+        if record is None:
+            record = PersonalRecord(user_id=exercise_set.user_id, exercise_id=exercise_set.exercise_id, rep_range=bucket)
+            apply_set(record, exercise_set.id, exercise_set.session_date, metrics, only_improvements=False)
+            record.save()
+            return []
+        moved = apply_set(record, exercise_set.id, exercise_set.session_date, metrics)
+        if not moved:
+            return []
+        record.save()
+        improved = [metric for metric in moved if metric not in held]
+    return [record_payload(record, improved)] if improved else []
+
+def recompute_personal_record(user_id, exercise_id, bucket, exclude_set_id=None):
+    # Rescan one bucket, e.g. after the set holding a best was edited or deleted
+    low, high = next((low, high) for label, low, high in REP_RANGE_BOUNDS if label == bucket)
+    sets = ExerciseSet.objects.filter(
+        user_id=user_id, exercise_id=exercise_id, reps__gte=low, weight_used__gte=1
+    ).annotate(
+        e1rm=ExpressionWrapper(F('weight_used') * (1 + F('reps') / 30.0), output_field=FloatField()),
+        volume=F('weight_used') * F('reps'),
+    )
+    if high is not None:
+        sets = sets.filter(reps__lte=high)
+    if exclude_set_id is not None:
+        sets = sets.exclude(id=exclude_set_id)
+
+    best = {}
+    for metric, field in (('weight', 'weight_used'), ('e1rm', 'e1rm'), ('volume', 'volume')):
+        # Earliest set to reach the best
+        best[metric] = sets.order_by(f'-{field}', 'session_date', 'id').first()
+    if best['weight'] is None:
+        PersonalRecord.objects.filter(user_id=user_id, exercise_id=exercise_id, rep_range=bucket).delete()
+        return None
+
+    record = PersonalRecord.objects.filter(user_id=user_id, exercise_id=exercise_id, rep_range=bucket).first()
+    record = record or PersonalRecord(user_id=user_id, exercise_id=exercise_id, rep_range=bucket)
+    for metric, exercise_set in best.items():
+        metrics = set_metrics(exercise_set.reps, exercise_set.weight_used)
+        setattr(record, f'best_{metric}', metrics[metric])
+        setattr(record, f'best_{metric}_set_id', exercise_set.id)
+        setattr(record, f'best_{metric}_date', exercise_set.session_date)
+    record.save()
+    return record
+
+def rebuild_personal_records(user_ids=None, batch_size=1000):
+    """
+    Recompute PRs from scratch for the given users (or everyone) in one ordered
+    pass over their sets, for bulk writes that skip update_personal_records:
+    the history importer and the synthetic data generator.
+    """
+    sets = ExerciseSet.objects.filter(reps__gte=1, weight_used__gte=1)
+    existing = PersonalRecord.objects.all()
+    if user_ids is not None:
+        sets = sets.filter(user_id__in=user_ids)
+        existing = existing.filter(user_id__in=user_ids)
+    rows = sets.exclude(user=None).exclude(exercise=None).order_by('user_id', 'exercise_id', 'session_date', 'id').values_list(
+        'id', 'user_id', 'exercise_id', 'reps', 'weight_used', 'session_date'
+    )
+
+    with transaction.atomic():
+        existing.delete()
+        records, created = {}, 0
+        for set_id, user_id, exercise_id, reps, weight_used, session_date in rows.iterator(chunk_size=10000):
+            key = (user_id, exercise_id, rep_range(reps))
+            record = records.get(key)
+            if record is None:
+                record = records[key] = PersonalRecord(user_id=user_id, exercise_id=exercise_id, rep_range=key[2])
+                apply_set(record, set_id, session_date, set_metrics(reps, weight_used), only_improvements=False)
+            else:
+                apply_set(record, set_id, session_date, set_metrics(reps, weight_used))
+            if len(records) >= batch_size:
+                # Rows come ordered by user and exercise, so earlier keys are complete
+                done = [k for k in records if k[:2] != (user_id, exercise_id)]
+                PersonalRecord.objects.bulk_create([records.pop(k) for k in done])
+                created += len(done)
+        PersonalRecord.objects.bulk_create(records.values())
+        created += len(records)
+    return created
+
+def notify_personal_records(user_id, records):
+    # Over the user's websocket, for their other devices and the open session screen
+    if records and presence.is_online(user_id):
+        async_to_sync(get_channel_layer().group_send)(f"user_{user_id}", personal_record_event(records))
+
+def personal_record_event(records):
+    return {'type': 'forward_personal_records', 'data': records}
@@ -0,0 +1,87 @@
+from datetime import timedelta
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import User, WorkoutSession, ExerciseSet, UserProgramProgress, PersonalRecord
+from .utils import get_current_week_range
+
+# Summary of every client of a trainer for the roster screen. Each figure is
+# one grouped query over all the clients at once, so the number of queries
+# doesn't grow with the size of the roster.
+
+# Records set within this window are listed as recent PRs
+ROSTER_RECENT_PR_DAYS = 14
+ROSTER_MAX_RECENT_PRS = 5
+
+def client_roster(trainer):
+    clients = list(
+        User.objects.filter(client_relationships__trainer=trainer)
+        .order_by('username').only('id', 'username', 'profile_picture')
+    )
+    client_ids = [client.id for client in clients]
+    if not client_ids:
+        return []
+    week_start, week_end = get_current_week_range()
+
+    sessions = {
+        row['user_id']: row for row in
+        WorkoutSession.objects.filter(user_id__in=client_ids).values('user_id').annotate(
+            last_session=Max('date'),
+            sessions_this_week=Count('id', filter=Q(date__range=(week_start, week_end))),
+        ).order_by()
+    }
+    weekly_volume = dict(
+        ExerciseSet.objects.filter(
+            user_id__in=client_ids,
+            session_date__range=(week_start, week_end),
+            weight_used__isnull=False,
+            reps__isnull=False,
+        ).values('user_id').annotate(volume=Sum(F('weight_used') * F('reps'))).order_by().values_list('user_id', 'volume')
+    )
+    active_programs = {
+        row['user_id']: {'id': row['program_id'], 'name': row['program__name']}
+        for row in UserProgramProgress.objects.filter(user_id__in=client_ids, is_active=True)
+        .values('user_id', 'program_id', 'program__name')
+    }
+    recent_prs = recent_personal_records(client_ids)
+
+    roster = []
+    for client in clients:
+        client_sessions = sessions.get(client.id, {})
+        roster.append({
+            'id': client.id,
+            'username': client.username,
+            'profile_picture': client.profile_picture.url if client.profile_picture else None,
+            'last_session': client_sessions.get('last_session'),
+            'sessions_this_week': client_sessions.get('sessions_this_week', 0),
+            'weekly_volume': weekly_volume.get(client.id, 0),
+            'active_program': active_programs.get(client.id),
+            'recent_prs': recent_prs.get(client.id, []),
+        })
+    return roster
+
+def recent_personal_records(client_ids):
+    # {user id: [PR, ...]} for the records set in the last ROSTER_RECENT_PR_DAYS, newest first
+    cutoff = timezone.now() - timedelta(days=ROSTER_RECENT_PR_DAYS)
+    records = PersonalRecord.objects.filter(user_id__in=client_ids).filter(
+        Q(best_weight_date__gte=cutoff) | Q(best_e1rm_date__gte=cutoff) | Q(best_volume_date__gte=cutoff)
+    ).annotate(
+        latest=Greatest('best_weight_date', 'best_e1rm_date', 'best_volume_date')
+    ).order_by('user_id', '-latest').values(
+        'user_id', 'exercise_id', 'exercise__name', 'rep_range', 'best_weight', 'best_e1rm', 'best_volume', 'latest'
+    )
+
+    prs = {}
+    for row in records:
+        user_prs = prs.setdefault(row['user_id'], [])
+        if len(user_prs) < ROSTER_MAX_RECENT_PRS:
+            user_prs.append({
+                'exercise_id': row['exercise_id'],
+                'exercise': row['exercise__name'],
+                'rep_range': row['rep_range'],
+                'weight': row['best_weight'],
+                'e1rm': row['best_e1rm'],
+                'volume': row['best_volume'],
+                'date': row['latest'],
+            })
+    return prs
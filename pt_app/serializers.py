@@ -340,12 +340,36 @@ class ExerciseSetSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExerciseSet
         fields = ['id', 'exercise_log', 'set_number', 'reps', 'weight_used', 'video', 'is_logged']
+        # A set stays in its log: the owner, exercise and date copied from it aren't re-derived on update
+        read_only_fields = ['exercise_log']
 
 class ExerciseSetVideoSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExerciseSet
         fields = ['video']
 
+class ExerciseSetMutationSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    reps = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    weight_used = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    is_logged = serializers.BooleanField(required=False)
+
+class ExerciseLogMutationSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    sets_completed = serializers.IntegerField(required=False, min_value=0)
+    note = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+class WorkoutSessionBatchSerializer(serializers.Serializer):
+    sets = ExerciseSetMutationSerializer(many=True, required=False, default=list)
+    logs = ExerciseLogMutationSerializer(many=True, required=False, default=list)
+
+    def validate(self, data):
+        if not data['sets'] and not data['logs']:
+            raise serializers.ValidationError('At least one set or log mutation is required.')
+        if len(data['sets']) + len(data['logs']) > 500:
+            raise serializers.ValidationError('At most 500 mutations per batch.')
+        return data
+
 class ExerciseLogSerializer(serializers.ModelSerializer):
     sets = ExerciseSetSerializer(many=True, read_only=True, source='exercise_sets')
     workout_exercise = WorkoutExerciseSerializer(read_only=True)
@@ -380,7 +404,7 @@ class ChatSessionSerializer(serializers.ModelSerializer):
         last_message = obj.messages.order_by('-timestamp').first()  # Get the most recent message
         if last_message:
             time_since = timesince(last_message.timestamp).split(',')[0]  # Simplify to the most significant unit
-            if last_message.sender == self.context['request'].user:
+            if last_message.sender_id == self.context['request'].user.id:
                 return {"message": f"You: {last_message.content}", "timestamp": time_since, "exact_time": last_message.timestamp.isoformat(), "read": last_message.read, "id": last_message.id, "sender": "user"}
             else:
                 return {"message": last_message.content, "timestamp": time_since, "exact_time": last_message.timestamp.isoformat(), "read": last_message.read, "id": last_message.id, "sender": "other_user"}
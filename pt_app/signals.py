@@ -0,0 +1,169 @@
+from django.conf import settings
+from django.db import models
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import (User, Program, Workout, WorkoutExercise, UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet,
+                     ChatSession, Message, SyncTombstone, UnreadCounter, PersonalRecord)
+from .cache import invalidate_user_charts
+from .sync import tombstones_for, program_access_granted, program_access_revoked
+from .authentication import invalidate_cached_user
+from .inbox import ensure_counters, adjust_unread
+from .slow_queries import slow_query_logger
+from .records import set_metrics, rep_range, recompute_personal_record
+
+# Chart cache invalidation. Sessions, logs and sets carry their owner, so no
+# lookups are needed to find whose charts to invalidate.
+
+@receiver(post_save, sender=WorkoutSession)
+@receiver(pre_delete, sender=WorkoutSession)
+@receiver(post_save, sender=ExerciseLog)
+@receiver(pre_delete, sender=ExerciseLog)
+@receiver(post_save, sender=ExerciseSet)
+@receiver(pre_delete, sender=ExerciseSet)
+def invalidate_charts_for_owner(sender, instance, **kwargs):
+    invalidate_user_charts(instance.user_id)
+
+# Keep the denormalized session date and exercise on logs and sets in step
+# when the session is re-dated or the workout exercise is switched.
+
+@receiver(post_save, sender=WorkoutSession)
+def sync_session_date(sender, instance, created, **kwargs):
+    if created:
+        return
+    updated_at = timezone.now()
+    ExerciseLog.objects.filter(workout_session=instance).exclude(session_date=instance.date).update(
+        session_date=instance.date, updated_at=updated_at
+    )
+    ExerciseSet.objects.filter(exercise_log__workout_session=instance).exclude(session_date=instance.date).update(
+        session_date=instance.date, updated_at=updated_at
+    )
+
+@receiver(post_save, sender=WorkoutExercise)
+def sync_exercise(sender, instance, created, **kwargs):
+    if created:
+        return
+    updated_at = timezone.now()
+    logs = ExerciseLog.objects.filter(workout_exercise=instance)
+    if logs.exclude(exercise_id=instance.exercise_id).update(exercise_id=instance.exercise_id, updated_at=updated_at):
+        ExerciseSet.objects.filter(exercise_log__workout_exercise=instance).update(
+            exercise_id=instance.exercise_id, updated_at=updated_at
+        )
+        for user_id in logs.values_list('user_id', flat=True).distinct():
+            invalidate_user_charts(user_id)
+
+# Drop the cached auth user so deactivation and profile edits apply at once
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+# Unread counters: one row per chat participant, bumped for everyone but the sender
+
+@receiver(m2m_changed, sender=ChatSession.participants.through)
+def sync_unread_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        if reverse:
+            for chat_session_id in pk_set:
+                ensure_counters(chat_session_id, [instance.pk])
+        else:
+            ensure_counters(instance.pk, pk_set)
+    elif action == 'post_remove':
+        if reverse:
+            UnreadCounter.objects.filter(user=instance, chat_session_id__in=pk_set).delete()
+        else:
+            UnreadCounter.objects.filter(chat_session=instance, user_id__in=pk_set).delete()
+    elif action == 'post_clear':
+        UnreadCounter.objects.filter(**{'user' if reverse else 'chat_session': instance}).delete()
+
+@receiver(post_save, sender=Message)
+def count_new_message(sender, instance, created, **kwargs):
+    if created and not instance.read:
+        adjust_unread(instance, 1)
+
+@receiver(pre_delete, sender=Message)
+def uncount_deleted_message(sender, instance, **kwargs):
+    if not instance.read:
+        adjust_unread(instance, -1)
+
+# Personal records: a deleted set that held a best leaves its set column null
+# (SET_NULL), so the bucket is rescanned for the next best
+
+@receiver(post_delete, sender=ExerciseSet)
+def drop_deleted_personal_record(sender, instance, **kwargs):
+    if instance.user_id is None or instance.exercise_id is None or not set_metrics(instance.reps, instance.weight_used):
+        return
+    bucket = rep_range(instance.reps)
+    if PersonalRecord.objects.filter(user_id=instance.user_id, exercise_id=instance.exercise_id, rep_range=bucket).filter(
+        models.Q(best_weight_set=None) | models.Q(best_e1rm_set=None) | models.Q(best_volume_set=None)
+    ).exists():
+        recompute_personal_record(instance.user_id, instance.exercise_id, bucket)
+
+# Tombstones for delta sync. pre_delete so a program's participants can still
+# be read before the cascade removes them.
+
+@receiver(pre_delete, sender=Program)
+@receiver(pre_delete, sender=Workout)
+@receiver(pre_delete, sender=WorkoutExercise)
+@receiver(pre_delete, sender=WorkoutSession)
+@receiver(pre_delete, sender=ExerciseLog)
+@receiver(pre_delete, sender=ExerciseSet)
+@receiver(pre_delete, sender=Message)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    tombstones = tombstones_for(instance)
+    if isinstance(origin, User):
+        # Nobody syncs on behalf of a deleted account
+        tombstones = [tombstone for tombstone in tombstones if tombstone.user_id != origin.pk or tombstone.program_id]
+    if tombstones:
+        SyncTombstone.objects.bulk_create(tombstones)
+
+# Gaining or losing a program (as a participant or through progress in it)
+# changes which rows delta sync sends without any of them being written
+
+@receiver(m2m_changed, sender=Program.participants.through)
+def sync_program_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # clear() doesn't pass the removed ids, so note them first
+        field, other = ('user', 'program_id') if reverse else ('program', 'user_id')
+        instance._cleared_participants = set(sender.objects.filter(**{field: instance}).values_list(other, flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_participants', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    changes = {program_id: [instance.pk] for program_id in pk_set} if reverse else {instance.pk: list(pk_set)}
+    for program_id, user_ids in changes.items():
+        if action == 'post_add':
+            program_access_granted(program_id)
+        else:
+            program_access_revoked(program_id, user_ids)
+
+@receiver(post_save, sender=UserProgramProgress)
+def sync_program_progress_created(sender, instance, created, **kwargs):
+    if created:
+        program_access_granted(instance.program_id)
+
+@receiver(post_delete, sender=UserProgramProgress)
+def sync_program_progress_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting the program or the user tombstones what's needed already
+    if not isinstance(origin, (Program, User)):
+        program_access_revoked(instance.program_id, [instance.user_id])
+
+@receiver(connection_created)
+def install_slow_query_logger(sender, connection, **kwargs):
+    # Fires again on every reconnect of the same connection object. The
+    # connection may open inside a request, under the wrappers the middleware
+    # pushed with execute_wrapper(), which pop the last entry on exit, so the
+    # logger goes to the bottom of the stack rather than the top.
+    if slow_query_logger not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_logger)
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
@@ -0,0 +1,140 @@
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+# Slow-query log. slow_query_logger is installed as an execute wrapper on every
+# database connection (see signals.py); queries slower than
+# SLOW_QUERY_THRESHOLD_MS are logged and aggregated per query shape, with the
+# query plan captured the first time a shape turns up. The aggregate for this
+# process is served to admins at slow-queries/.
+
+logger = logging.getLogger(__name__)
+
+PROJECT_PACKAGES = ('pt_app', 'ptproject')
+# Frames of the instrumentation itself are never the origin of a query
+IGNORED_MODULES = ('pt_app.slow_queries', 'pt_app.middleware', 'pt_app.profiling', 'pt_app.metrics')
+# Outside HTTP requests the origin is the outermost consumer or command frame
+ORIGIN_MODULES = ('pt_app.consumers', 'pt_app.management.commands.')
+
+# Set by MetricsMiddleware once the URL has been resolved
+current_view = contextvars.ContextVar('pt_app_current_view', default=None)
+_explaining = contextvars.ContextVar('pt_app_slow_query_explaining', default=False)
+
+_IN_LIST = re.compile(r'\(\s*%s(\s*,\s*%s)+\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w"])-?\d+(\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_sql(sql):
+    # One shape per query whatever the literals or the length of an IN list
+    sql = _NUMBER.sub('%s', _STRING.sub('%s', sql))
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(...)', sql)).strip()
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+def params_fingerprint(params):
+    # Enough to tell repeats of the same call apart without logging user data
+    return fingerprint(repr(params)) if params else None
+
+def query_origin():
+    # (view, frame), e.g. ('user_chats', 'pt_app/utils.py:57 in get_chat_session'):
+    # the frame is the innermost project code on the stack
+    view, frame_description = current_view.get(), None
+    frame = sys._getframe()
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith(PROJECT_PACKAGES) and not module.startswith(IGNORED_MODULES):
+            if frame_description is None:
+                path = os.path.relpath(frame.f_code.co_filename, settings.BASE_DIR)
+                frame_description = f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+            if module.startswith(ORIGIN_MODULES) and not current_view.get():
+                view = getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+        frame = frame.f_back
+    return view or '-', frame_description or '-'
+
+def explain(connection, sql, params):
+    if not sql.lstrip()[:6].upper() == 'SELECT':
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        _explaining.reset(token)
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail) rows
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(str(row[0]) for row in rows)
+
+class SlowQueryLog:
+    def __init__(self, size):
+        self.size = size
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def record(self, connection, sql, params, duration):
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        view, frame = query_origin()
+        with self.lock:
+            entry = self.entries.get(key)
+            new = entry is None
+            if new:
+                if len(self.entries) >= self.size:
+                    # Make room by dropping the shape that has cost the least so far
+                    del self.entries[min(self.entries, key=lambda k: self.entries[k]['total_ms'])]
+                entry = self.entries[key] = {
+                    'fingerprint': key, 'sql': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'first_seen': timezone.now(), 'views': {}, 'frames': {}, 'params': [], 'plan': None,
+                }
+            ms = duration * 1000
+            entry['count'] += 1
+            entry['total_ms'] = round(entry['total_ms'] + ms, 3)
+            entry['max_ms'] = round(max(entry['max_ms'], ms), 3)
+            entry['last_seen'] = timezone.now()
+            entry['views'][view] = entry['views'].get(view, 0) + 1
+            entry['frames'][frame] = entry['frames'].get(frame, 0) + 1
+            params_key = params_fingerprint(params)
+            if params_key and params_key not in entry['params'] and len(entry['params']) < 10:
+                entry['params'].append(params_key)
+
+        if new and settings.SLOW_QUERY_EXPLAIN:
+            entry['plan'] = explain(connection, sql, params)
+        logger.warning(
+            'Slow query %.1fms [%s] view=%s frame=%s params=%s: %s',
+            ms, key, view, frame, params_fingerprint(params), normalized,
+        )
+
+    def summary(self):
+        # Most expensive query shapes first
+        with self.lock:
+            entries = [dict(entry, views=dict(entry['views']), frames=dict(entry['frames'])) for entry in self.entries.values()]
+        return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+slow_queries = SlowQueryLog(settings.SLOW_QUERY_MAX_FINGERPRINTS)
+
+def slow_query_logger(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS and not many and not _explaining.get():
+            slow_queries.record(context['connection'], sql, params, duration)
@@ -0,0 +1,160 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .fast_json import dumps, loads
+from .models import (Program, Workout, WorkoutExercise, UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet,
+                     Message, SyncTombstone)
+
+# Delta sync for offline-first clients. Every synced model carries updated_at;
+# deletes leave a SyncTombstone. A client sends the cursor from its last sync
+# and gets back only the rows changed or deleted after it, paged per model in
+# (updated_at, id) order so the work done is proportional to the changes.
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 2000
+
+# Response key -> (model, fields sent to the client, queryset scoped to the user)
+SYNC_MODELS = {
+    'programs': (Program, ['id', 'name', 'description', 'creator_id', 'is_ai_generated', 'created_at', 'updated_at'],
+                 lambda user: Program.objects.filter(id__in=visible_program_ids(user))),
+    'workouts': (Workout, ['id', 'program_id', 'name', 'creator_id', 'order', 'is_ai_generated', 'created_at', 'updated_at'],
+                 lambda user: Workout.objects.filter(program_id__in=visible_program_ids(user))),
+    'workout_exercises': (WorkoutExercise, ['id', 'workout_id', 'exercise_id', 'sets', 'reps', 'note', 'order', 'updated_at'],
+                          lambda user: WorkoutExercise.objects.filter(workout__program_id__in=visible_program_ids(user))),
+    'workout_sessions': (WorkoutSession, ['id', 'workout_id', 'date', 'completed', 'active', 'updated_at'],
+                         lambda user: WorkoutSession.objects.filter(user=user)),
+    'exercise_logs': (ExerciseLog, ['id', 'workout_session_id', 'workout_exercise_id', 'exercise_id', 'sets_completed', 'note', 'updated_at'],
+                      lambda user: ExerciseLog.objects.filter(user=user)),
+    'exercise_sets': (ExerciseSet, ['id', 'exercise_log_id', 'set_number', 'reps', 'weight_used', 'video', 'is_logged', 'updated_at'],
+                      lambda user: ExerciseSet.objects.filter(user=user)),
+    'messages': (Message, ['id', 'chat_session_id', 'sender_id', 'content', 'timestamp', 'read', 'updated_at'],
+                 lambda user: Message.objects.filter(chat_session__participants=user)),
+}
+
+SYNC_MODEL_KEYS = {model: key for key, (model, _, _) in SYNC_MODELS.items()}
+
+SYNC_TOMBSTONES_KEY = 'deleted'
+
+class SyncCursorExpired(Exception):
+    pass
+
+def visible_program_ids(user):
+    # Programs the user created, joined as a participant, or has progress in
+    return Program.objects.filter(
+        Q(creator=user) | Q(participants=user) | Q(id__in=UserProgramProgress.objects.filter(user=user).values('program_id'))
+    ).values('id')
+
+def encode_cursor(positions):
+    payload = {key: [timestamp.isoformat(), last_id] for key, (timestamp, last_id) in positions.items()}
+    return urlsafe_b64encode(dumps(payload).encode()).decode()
+
+def parse_cursor(value):
+    # The cursor holds an (updated_at, id) position per model, so each model
+    # pages independently even when a bulk update stamped many rows alike
+    if not value:
+        return {}
+    try:
+        payload = loads(urlsafe_b64decode(value.encode()))
+        positions = {key: (parse_datetime(timestamp), int(last_id)) for key, (timestamp, last_id) in payload.items()}
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError('Invalid cursor.')
+    # encode_cursor only writes aware timestamps, and naive ones can't be compared below
+    if any(timestamp is None or timezone.is_naive(timestamp) for timestamp, _ in positions.values()):
+        raise ValueError('Invalid cursor.')
+    # Deletes older than the tombstone retention can't be replayed
+    oldest = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    if any(timestamp < oldest for timestamp, _ in positions.values()):
+        raise SyncCursorExpired()
+    return positions
+
+def page_after(queryset, field, position, limit):
+    if position is not None:
+        timestamp, last_id = position
+        # The >= bound lets SQLite range-scan the (user, updated_at) indexes
+        queryset = queryset.filter(Q(**{f'{field}__gte': timestamp}), Q(**{f'{field}__gt': timestamp}) | Q(id__gt=last_id))
+    rows = list(queryset.order_by(field, 'id')[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][field], rows[-1]['id'])
+    return rows, None
+
+def changes_since(user, positions=None, limit=SYNC_DEFAULT_LIMIT):
+    positions = positions or {}
+    # Rows are stamped before their transaction commits, so a caught-up model
+    # resumes a little before now to pick up writes that were still in flight
+    caught_up = (timezone.now() - timedelta(seconds=settings.SYNC_CURSOR_OVERLAP_SECONDS), 0)
+    next_positions, changes, has_more = {}, {}, False
+
+    def advance(key, last_position):
+        nonlocal has_more
+        if last_position is not None:
+            has_more = True
+            next_positions[key] = last_position
+        else:
+            next_positions[key] = max(caught_up, positions.get(key, caught_up))
+
+    for key, (model, fields, scoped) in SYNC_MODELS.items():
+        rows, last_position = page_after(scoped(user).values(*fields), 'updated_at', positions.get(key), limit)
+        changes[key] = rows
+        advance(key, last_position)
+
+    tombstones = SyncTombstone.objects.filter(
+        Q(user_id=user.id) |
+        Q(program_id__in=visible_program_ids(user)) |
+        Q(chat_session_id__in=user.chats.values('id'))
+    ).values('id', 'model', 'object_id', 'deleted_at')
+    rows, last_position = page_after(tombstones, 'deleted_at', positions.get(SYNC_TOMBSTONES_KEY), limit)
+    deleted = {key: [] for key in SYNC_MODELS}
+    for row in rows:
+        deleted[row['model']].append(row['object_id'])
+    advance(SYNC_TOMBSTONES_KEY, last_position)
+
+    return {'cursor': encode_cursor(next_positions), 'has_more': has_more, 'changes': changes, 'deleted': deleted}
+
+def program_access_granted(program_id):
+    # The new viewer's cursor is already past the program's rows, so restamp
+    # them to come through on their next sync (and, harmlessly, everyone else's)
+    updated_at = timezone.now()
+    Program.objects.filter(id=program_id).update(updated_at=updated_at)
+    Workout.objects.filter(program_id=program_id).update(updated_at=updated_at)
+    WorkoutExercise.objects.filter(workout__program_id=program_id).update(updated_at=updated_at)
+
+def program_access_revoked(program_id, user_ids):
+    # Nothing was deleted, so address tombstones to the users who can no
+    # longer see the program for their clients to drop it and its workouts
+    still_visible = set(Program.objects.filter(id=program_id).values_list('creator_id', flat=True))
+    still_visible.update(Program.participants.through.objects.filter(program_id=program_id).values_list('user_id', flat=True))
+    still_visible.update(UserProgramProgress.objects.filter(program_id=program_id).values_list('user_id', flat=True))
+    user_ids = set(user_ids) - still_visible
+    if not user_ids:
+        return
+    workout_ids = Workout.objects.filter(program_id=program_id).values_list('id', flat=True)
+    workout_exercise_ids = WorkoutExercise.objects.filter(workout__program_id=program_id).values_list('id', flat=True)
+    objects = [(SYNC_MODEL_KEYS[Program], program_id)]
+    objects += [(SYNC_MODEL_KEYS[Workout], workout_id) for workout_id in workout_ids]
+    objects += [(SYNC_MODEL_KEYS[WorkoutExercise], workout_exercise_id) for workout_exercise_id in workout_exercise_ids]
+    SyncTombstone.objects.bulk_create([
+        SyncTombstone(model=key, object_id=object_id, user_id=user_id) for user_id in user_ids for key, object_id in objects
+    ])
+
+def tombstones_for(instance):
+    key = SYNC_MODEL_KEYS[type(instance)]
+    if isinstance(instance, Program):
+        # The program's participants lose access along with it, so address them directly
+        user_ids = {instance.creator_id}
+        user_ids.update(instance.participants.values_list('id', flat=True))
+        user_ids.update(instance.active_users.values_list('user_id', flat=True))
+        return [SyncTombstone(model=key, object_id=instance.id, user_id=user_id) for user_id in user_ids]
+    if isinstance(instance, Workout):
+        return [SyncTombstone(model=key, object_id=instance.id, user_id=instance.creator_id, program_id=instance.program_id)]
+    if isinstance(instance, WorkoutExercise):
+        program_id = Workout.objects.filter(id=instance.workout_id).values_list('program_id', flat=True).first()
+        if program_id is None:
+            return []
+        return [SyncTombstone(model=key, object_id=instance.id, program_id=program_id)]
+    if isinstance(instance, Message):
+        return [SyncTombstone(model=key, object_id=instance.id, chat_session_id=instance.chat_session_id)]
+    return [SyncTombstone(model=key, object_id=instance.id, user_id=instance.user_id)]
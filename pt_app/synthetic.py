@@ -0,0 +1,279 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.utils import timezone
+from .inbox import rebuild_unread_counters
+from .records import rebuild_personal_records
+from .models import (User, TrainerRequest, TrainerClientRelationship, Program, Workout, Exercise, WorkoutExercise,
+                     UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet, ChatSession, Message)
+
+# Synthetic dataset for profiling: users with years of training history,
+# trainers with clients, shared programs and chats. Everything is written with
+# explicitly allocated ids, a chunk of users per transaction, with model
+# signals muted; the denormalized owner/exercise/date columns and the unread
+# counters are filled in directly instead.
+
+SYNTHETIC_PREFIX = 'synthetic'
+SYNTHETIC_CHUNK_USERS = 50
+SYNTHETIC_BATCH_SIZE = 2000
+
+# Name -> rough starting working weight
+SYNTHETIC_EXERCISES = {
+    'Bench Press': 60, 'Squat': 80, 'Deadlift': 100, 'Overhead Press': 40, 'Barbell Row': 60, 'Pull Up': 0,
+    'Dip': 0, 'Incline Bench Press': 50, 'Front Squat': 60, 'Romanian Deadlift': 70, 'Leg Press': 120,
+    'Lunge': 30, 'Hip Thrust': 80, 'Lat Pulldown': 50, 'Seated Row': 50, 'Dumbbell Press': 25, 'Lateral Raise': 8,
+    'Bicep Curl': 12, 'Tricep Extension': 15, 'Face Pull': 20, 'Leg Curl': 35, 'Leg Extension': 40,
+    'Calf Raise': 60, 'Shrug': 60, 'Chest Fly': 15, 'Hammer Curl': 12, 'Skull Crusher': 25, 'Good Morning': 40,
+    'Chin Up': 0, 'Push Press': 50,
+}
+
+@contextmanager
+def muted_signals(*signals):
+    signals = signals or (pre_save, post_save, pre_delete, post_delete, m2m_changed)
+    saved = [(signal, signal.receivers) for signal in signals]
+    for signal in signals:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+@contextmanager
+def explicit_timestamps(*fields):
+    # auto_now_add would stamp every historical row with the current time
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+def insert_rows(model, fields, rows):
+    # bulk_create spends most of its time compiling per-field SQL values, which
+    # dominates at millions of rows; the rows here are already database-ready
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    sql = (f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+           f'VALUES ({", ".join(["%s"] * len(fields))})')
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), SYNTHETIC_BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + SYNTHETIC_BATCH_SIZE])
+
+class SyntheticDataGenerator:
+    def __init__(self, users=1000, sessions_per_user=200, days=730, programs_per_user=2, workouts_per_program=4,
+                 exercises_per_workout=5, sets_per_exercise=3, trainer_ratio=0.05, clients_per_trainer=10,
+                 chats_per_user=1, messages_per_chat=40, seed=0, chunk_size=SYNTHETIC_CHUNK_USERS, progress=None):
+        self.users = users
+        self.sessions_per_user = sessions_per_user
+        self.days = days
+        self.programs_per_user = programs_per_user
+        self.workouts_per_program = workouts_per_program
+        self.exercises_per_workout = exercises_per_workout
+        self.sets_per_exercise = sets_per_exercise
+        self.trainer_ratio = trainer_ratio
+        self.clients_per_trainer = clients_per_trainer
+        self.chats_per_user = chats_per_user
+        self.messages_per_chat = messages_per_chat
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.password = make_password(None)
+        self.user_ids = []
+        self.programs_by_user = {}
+        self.result = {'users': 0, 'programs': 0, 'sessions': 0, 'logs': 0, 'sets': 0, 'relationships': 0,
+                       'chats': 0, 'messages': 0}
+
+    def run(self):
+        models = [User, Program, Workout, Exercise, WorkoutExercise, UserProgramProgress, WorkoutSession, ExerciseLog,
+                  ExerciseSet, TrainerRequest, TrainerClientRelationship, ChatSession, Message]
+        # Ids are handed out here so children can be built before their parents are inserted
+        self.next_ids = {model: (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1 for model in models}
+        timestamps = [Program._meta.get_field('created_at'), Workout._meta.get_field('created_at'),
+                      UserProgramProgress._meta.get_field('start_date'), TrainerRequest._meta.get_field('created_at'),
+                      TrainerClientRelationship._meta.get_field('created_at'), ChatSession._meta.get_field('created_at'),
+                      Message._meta.get_field('timestamp')]
+
+        with muted_signals(), explicit_timestamps(*timestamps):
+            with transaction.atomic():
+                self.exercises = self.exercise_catalog()
+            for start in range(0, self.users, self.chunk_size):
+                with transaction.atomic():
+                    self.create_users(min(self.chunk_size, self.users - start))
+                # The sets were written without update_personal_records
+                rebuild_personal_records(self.user_ids[start:])
+                if self.progress:
+                    self.progress(self.result)
+            with transaction.atomic():
+                self.create_relationships_and_chats()
+            if self.progress:
+                self.progress(self.result)
+
+        rebuild_unread_counters()
+        # Keep the database's own sequences ahead of the ids used here
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        return self.result
+
+    def allocate(self, model, count=1):
+        first = self.next_ids[model]
+        self.next_ids[model] += count
+        return range(first, first + count)
+
+    def exercise_catalog(self):
+        existing = {exercise.name: exercise for exercise in Exercise.objects.filter(creator=None, name__in=SYNTHETIC_EXERCISES)}
+        created = [
+            Exercise(id=exercise_id, name=name)
+            for exercise_id, name in zip(self.allocate(Exercise, len(SYNTHETIC_EXERCISES)), SYNTHETIC_EXERCISES)
+            if name not in existing
+        ]
+        Exercise.objects.bulk_create(created)
+        catalog = {**existing, **{exercise.name: exercise for exercise in created}}
+        return [(catalog[name].id, weight) for name, weight in SYNTHETIC_EXERCISES.items()]
+
+    def random_past(self, days):
+        return self.now - timedelta(seconds=self.rng.random() * days * 86400)
+
+    def create_users(self, count):
+        rng = self.rng
+        users, programs, workouts, workout_exercises, progress = [], [], [], [], []
+        sessions, logs, sets = [], [], []
+        updated_at = connection.ops.adapt_datetimefield_value(self.now)
+
+        for user_id in self.allocate(User, count):
+            joined = self.now - timedelta(days=self.days + rng.randint(0, 30))
+            users.append(User(id=user_id, username=f'{SYNTHETIC_PREFIX}_{user_id}', password=self.password,
+                              date_joined=joined))
+            self.user_ids.append(user_id)
+            # Starting weights vary per user; every session adds a little
+            strength = rng.uniform(0.5, 1.5)
+            gain = rng.uniform(0.1, 0.6)
+
+            # Programs follow each other in time, the last one is active
+            program_count = rng.randint(1, self.programs_per_user)
+            program_workouts = []
+            self.programs_by_user[user_id] = list(self.allocate(Program, program_count))
+            for index, program_id in enumerate(self.programs_by_user[user_id]):
+                created_at = joined + timedelta(days=self.days * index / program_count)
+                programs.append(Program(id=program_id, name=f'Program {index + 1}', creator_id=user_id,
+                                        created_at=created_at))
+                progress_id = self.allocate(UserProgramProgress)[0]
+                progress.append(UserProgramProgress(id=progress_id, user_id=user_id, program_id=program_id,
+                                                    is_active=index == program_count - 1, start_date=created_at.date()))
+                day_plans = []
+                for order, workout_id in enumerate(self.allocate(Workout, self.workouts_per_program)):
+                    workouts.append(Workout(id=workout_id, program_id=program_id, name=f'Day {order + 1}',
+                                            creator_id=user_id, order=order, created_at=created_at))
+                    plan = []
+                    for position, (exercise_id, base_weight) in enumerate(rng.sample(self.exercises, self.exercises_per_workout)):
+                        workout_exercise_id = self.allocate(WorkoutExercise)[0]
+                        workout_exercises.append(WorkoutExercise(
+                            id=workout_exercise_id, workout_id=workout_id, exercise_id=exercise_id,
+                            sets=self.sets_per_exercise, reps=rng.choice((5, 8, 10, 12)), order=position
+                        ))
+                        plan.append((workout_exercise_id, exercise_id, base_weight * strength))
+                    day_plans.append((workout_id, plan))
+                program_workouts.append((progress_id, day_plans))
+
+            dates = sorted(self.random_past(self.days) for _ in range(self.sessions_per_user))
+            for index, (session_id, date) in enumerate(zip(self.allocate(WorkoutSession, len(dates)), dates)):
+                progress_id, day_plans = program_workouts[index * program_count // len(dates)]
+                workout_id, plan = day_plans[index % len(day_plans)]
+                # The history tables are written as plain rows, see insert_rows
+                session_date = connection.ops.adapt_datetimefield_value(date)
+                sessions.append((session_id, progress_id, user_id, workout_id, session_date, True, False, updated_at))
+                overload = 1 + gain * index / len(dates)
+                for (workout_exercise_id, exercise_id, weight), log_id in zip(plan, self.allocate(ExerciseLog, len(plan))):
+                    logs.append((log_id, session_id, workout_exercise_id, self.sets_per_exercise, user_id, exercise_id,
+                                 session_date, updated_at))
+                    working_weight = round(weight * overload * rng.uniform(0.95, 1.05))
+                    for set_number, set_id in enumerate(self.allocate(ExerciseSet, self.sets_per_exercise), start=1):
+                        sets.append((set_id, log_id, set_number, rng.randint(3, 12), working_weight, True, user_id,
+                                     exercise_id, session_date, updated_at))
+
+        for model, objects in ((User, users), (Program, programs), (Workout, workouts), (WorkoutExercise, workout_exercises),
+                               (UserProgramProgress, progress)):
+            model.objects.bulk_create(objects, batch_size=SYNTHETIC_BATCH_SIZE)
+        insert_rows(WorkoutSession, ['id', 'user_program_progress', 'user', 'workout', 'date', 'completed', 'active',
+                                     'updated_at'], sessions)
+        insert_rows(ExerciseLog, ['id', 'workout_session', 'workout_exercise', 'sets_completed', 'user', 'exercise',
+                                  'session_date', 'updated_at'], logs)
+        insert_rows(ExerciseSet, ['id', 'exercise_log', 'set_number', 'reps', 'weight_used', 'is_logged', 'user',
+                                  'exercise', 'session_date', 'updated_at'], sets)
+
+        self.result['users'] += len(users)
+        self.result['programs'] += len(programs)
+        self.result['sessions'] += len(sessions)
+        self.result['logs'] += len(logs)
+        self.result['sets'] += len(sets)
+
+    def create_relationships_and_chats(self):
+        rng = self.rng
+        user_ids = list(self.user_ids)
+        rng.shuffle(user_ids)
+        trainer_count = round(len(user_ids) * self.trainer_ratio)
+        trainers, clients = user_ids[:trainer_count], user_ids[trainer_count:]
+
+        relationships, requests, participations, pairs = [], [], [], set()
+        for trainer_id in trainers:
+            for client_id in clients[:self.clients_per_trainer]:
+                created_at = self.random_past(self.days)
+                relationships.append(TrainerClientRelationship(
+                    id=self.allocate(TrainerClientRelationship)[0], trainer_id=trainer_id, client_id=client_id,
+                    created_at=created_at
+                ))
+                requests.append(TrainerRequest(id=self.allocate(TrainerRequest)[0], from_user_id=client_id,
+                                               to_user_id=trainer_id, is_active=False, created_at=created_at))
+                # Clients follow their trainer's latest program
+                participations.append(Program.participants.through(
+                    program_id=self.programs_by_user[trainer_id][-1], user_id=client_id
+                ))
+                pairs.add((trainer_id, client_id))
+            clients = clients[self.clients_per_trainer:]
+            # A few requests still waiting for an answer
+            for client_id in clients[:2]:
+                requests.append(TrainerRequest(id=self.allocate(TrainerRequest)[0], from_user_id=client_id,
+                                               to_user_id=trainer_id, created_at=self.random_past(7)))
+
+        if len(user_ids) > 1:
+            for user_id in user_ids:
+                for _ in range(self.chats_per_user):
+                    other_id = rng.choice(user_ids)
+                    if other_id != user_id and (other_id, user_id) not in pairs:
+                        pairs.add((user_id, other_id))
+
+        chats, chat_participants, messages = [], [], []
+        for (first_id, second_id), chat_id in zip(sorted(pairs), self.allocate(ChatSession, len(pairs))):
+            started = self.random_past(self.days)
+            chats.append(ChatSession(id=chat_id, created_at=started))
+            chat_participants += [ChatSession.participants.through(chatsession_id=chat_id, user_id=user_id)
+                                  for user_id in (first_id, second_id)]
+            span = (self.now - started).total_seconds()
+            timestamps = sorted(started + timedelta(seconds=rng.random() * span) for _ in range(self.messages_per_chat))
+            # The last couple of messages may still be unread
+            unread_from = len(timestamps) - rng.randint(0, min(3, len(timestamps)))
+            for index, (message_id, timestamp) in enumerate(zip(self.allocate(Message, len(timestamps)), timestamps)):
+                messages.append(Message(id=message_id, chat_session_id=chat_id, sender_id=rng.choice((first_id, second_id)),
+                                        content=f'Synthetic message {index + 1}', timestamp=timestamp,
+                                        read=index < unread_from))
+
+        for model, objects in ((TrainerClientRelationship, relationships), (TrainerRequest, requests),
+                               (Program.participants.through, participations), (ChatSession, chats),
+                               (ChatSession.participants.through, chat_participants), (Message, messages)):
+            model.objects.bulk_create(objects, batch_size=SYNTHETIC_BATCH_SIZE)
+
+        self.result['relationships'] += len(relationships)
+        self.result['chats'] += len(chats)
+        self.result['messages'] += len(messages)
+
+def generate_synthetic_data(**options):
+    return SyntheticDataGenerator(**options).run()
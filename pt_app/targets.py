@@ -0,0 +1,81 @@
+from django.utils import timezone
+from .models import ExerciseSet, ExerciseTarget
+
+# Progressive overload targets per (user, workout exercise), worked out when a
+# session ends from that session's sets and the previous target, and returned
+# by start_workout_session next to the new, empty sets. Weights are whole
+# numbers like ExerciseSet.weight_used.
+
+# Added to the working weight after a session that hit every planned set and rep
+TARGET_INCREMENT = 0.025
+TARGET_MIN_INCREMENT = 1
+# Sessions in a row that miss before the weight drops back by TARGET_DELOAD
+TARGET_STALL_LIMIT = 3
+TARGET_DELOAD = 0.9
+
+def next_target(planned_sets, planned_reps, sets, stalls=0):
+    # sets: (reps, weight_used) of the session's sets for one exercise.
+    # Returns the target fields, or None when nothing was lifted.
+    sets = [(reps, weight) for reps, weight in sets if reps and weight and reps > 0 and weight > 0]
+    if not sets:
+        return None
+    working_weight = max(weight for reps, weight in sets)
+    working_reps = [reps for reps, weight in sets if weight == working_weight]
+    completed = sum(1 for reps in working_reps if reps >= planned_reps)
+
+    if completed >= planned_sets:
+        weight, stalls = working_weight + max(TARGET_MIN_INCREMENT, round(working_weight * TARGET_INCREMENT)), 0
+    elif stalls + 1 >= TARGET_STALL_LIMIT:
+        weight, stalls = max(1, round(working_weight * TARGET_DELOAD)), 0
+    else:
+        weight, stalls = working_weight, stalls + 1
+    return {
+        'reps': planned_reps, 'weight': weight, 'stalls': stalls,
+        'last_sets': len(working_reps), 'last_reps': min(working_reps), 'last_weight': working_weight,
+    }
+
+def update_targets(session):
+    """Work out next-session targets for every exercise of a finished session."""
+    rows = ExerciseSet.objects.filter(
+        exercise_log__workout_session=session, reps__isnull=False, weight_used__isnull=False
+    ).values_list('exercise_log__workout_exercise_id', 'exercise_log__workout_exercise__sets',
+                  'exercise_log__workout_exercise__reps', 'reps', 'weight_used')
+    by_workout_exercise = {}
+    for workout_exercise_id, planned_sets, planned_reps, reps, weight_used in rows:
+        entry = by_workout_exercise.setdefault(workout_exercise_id, (planned_sets, planned_reps, []))
+        entry[2].append((reps, weight_used))
+    if not by_workout_exercise:
+        return []
+
+    existing = {
+        target.workout_exercise_id: target
+        for target in ExerciseTarget.objects.filter(user_id=session.user_id, workout_exercise_id__in=by_workout_exercise)
+    }
+    updated_at = timezone.now()
+    created, updated = [], []
+    for workout_exercise_id, (planned_sets, planned_reps, sets) in by_workout_exercise.items():
+        target = existing.get(workout_exercise_id)
+        fields = next_target(planned_sets, planned_reps, sets, target.stalls if target else 0)
+        if fields is None:
+            continue
+        if target is None:
+            target = ExerciseTarget(user_id=session.user_id, workout_exercise_id=workout_exercise_id)
+            created.append(target)
+        else:
+            updated.append(target)
+        for field, value in fields.items():
+            setattr(target, field, value)
+        target.workout_session = session
+        target.updated_at = updated_at
+    ExerciseTarget.objects.bulk_create(created)
+    ExerciseTarget.objects.bulk_update(updated, ['reps', 'weight', 'stalls', 'last_sets', 'last_reps', 'last_weight',
+                                                 'workout_session', 'updated_at'])
+    return created + updated
+
+def target_payload(target, planned_sets):
+    # "last time: 3x5 @ 100, today: 3x5 @ 102"
+    return {
+        'workout_exercise': target.workout_exercise_id,
+        'last': {'sets': target.last_sets, 'reps': target.last_reps, 'weight': target.last_weight},
+        'target': {'sets': planned_sets, 'reps': target.reps, 'weight': target.weight},
+    }
@@ -1,3 +1,852 @@
-from django.test import TestCase
+import io
+from unittest import mock
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from .importer import HistoryImportError, import_history
+from .cache import get_chart_cache, get_chart_version
+from .admin import EstimatedCountPaginator
+from .authentication import CachedJWTAuthentication, JWTAuthMiddlewareStack, _user_cache
+from .consumers import CLOSE_RATE_LIMITED
+from .fast_json import dumps, loads
+from .inbox import rebuild_unread_counters
+from .models import (User, Program, Workout, Exercise, WorkoutExercise, UserProgramProgress, WorkoutSession,
+                     ExerciseLog, ExerciseSet, PersonalRecord, ExerciseTarget, ChatSession, Message, TrainerRequest,
+                     TrainerClientRelationship)
+from .presence import presence
+from .records import rebuild_personal_records
+from .routing import websocket_urlpatterns
+from .signals import install_slow_query_logger
+from .slow_queries import slow_query_logger
+from .sync import encode_cursor
+from .targets import TARGET_STALL_LIMIT, next_target
+from .utils import get_current_week_range
 
-# Create your tests here.
+def auth_headers(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+def websocket_communicator(user):
+    return WebsocketCommunicator(
+        JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns)), f'/ws/user/{user.id}/?token={AccessToken.for_user(user)}'
+    )
+
+def create_workout(user, exercise_name='Squat', sets=3, reps=5):
+    program = Program.objects.create(name='Program', creator=user)
+    workout = Workout.objects.create(name='Workout', program=program, creator=user)
+    exercise = Exercise.objects.create(name=exercise_name, creator=user)
+    workout_exercise = WorkoutExercise.objects.create(workout=workout, exercise=exercise, sets=sets, reps=reps)
+    UserProgramProgress.objects.create(user=user, program=program)
+    return workout, workout_exercise
+
+def create_session(user, workout, workout_exercises, sets=(), date=None, **kwargs):
+    # sets: (reps, weight_used) logged for every workout exercise
+    session = WorkoutSession.objects.create(
+        user_program_progress=UserProgramProgress.objects.get(user=user, program=workout.program),
+        workout=workout, date=date or timezone.now(), **kwargs
+    )
+    for workout_exercise in workout_exercises:
+        log = ExerciseLog.objects.create(workout_session=session, workout_exercise=workout_exercise)
+        for set_number, (reps, weight_used) in enumerate(sets, start=1):
+            ExerciseSet.objects.create(exercise_log=log, set_number=set_number, reps=reps, weight_used=weight_used,
+                                       is_logged=reps is not None)
+    return session
+
+class IndexUsageTests(TestCase):
+    """The hot query shapes are answered by the indexes declared for them (EXPLAIN QUERY PLAN)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lifter', password='pw')
+        cls.other = User.objects.create_user(username='coach', password='pw')
+        cls.program = Program.objects.create(name='Program', creator=cls.user)
+        cls.workout = Workout.objects.create(name='Workout', program=cls.program, creator=cls.user)
+        cls.progress = UserProgramProgress.objects.create(user=cls.user, program=cls.program)
+        cls.chat = ChatSession.objects.create()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_session_date_range(self):
+        now = timezone.now()
+        self.assertUsesIndex(
+            WorkoutSession.objects.filter(user=self.user, date__range=(now - timedelta(days=90), now)).order_by('date'),
+            'session_user_date_idx'
+        )
+
+    def test_active_session(self):
+        self.assertUsesIndex(WorkoutSession.objects.filter(user=self.user, active=True), 'session_user_active_idx')
+
+    def test_chat_history(self):
+        self.assertUsesIndex(
+            Message.objects.filter(chat_session=self.chat).order_by('timestamp'), 'message_session_time_idx'
+        )
+
+    def test_pending_trainer_requests(self):
+        self.assertUsesIndex(TrainerRequest.objects.filter(to_user=self.user, is_active=True), 'trainerrequest_to_active_idx')
+        self.assertUsesIndex(TrainerRequest.objects.filter(from_user=self.user, is_active=True), 'trainerrequest_from_active_idx')
+
+    def test_ai_generation_limits(self):
+        week_range = get_current_week_range()
+        for model, index_name in ((Program, 'program_creator_ai_idx'), (Workout, 'workout_creator_ai_idx')):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(
+                    model.objects.filter(creator=self.user, is_ai_generated=True, created_at__range=week_range),
+                    index_name
+                )
+
+    def test_exercise_name_lookup(self):
+        self.assertUsesIndex(Exercise.objects.filter(name='Back Squat', creator=self.user), 'exercise_name_creator_idx')
+
+class HistoryImportTests(TestCase):
+    HEADER = 'date,exercise,set_number,reps,weight_used\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='importer', password='pw')
+
+    def test_imports_rows(self):
+        result = import_history(self.user, io.StringIO(
+            self.HEADER + '2024-01-01,squat,1,5,100\n2024-01-01,squat,2,5,100\n2024-01-03,bench press,1,8,60\n'
+        ))
+        self.assertEqual(result['rows'], 3)
+        self.assertEqual(result['sets_created'], 3)
+        self.assertEqual(result['sessions_created'], 2)
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(ExerciseSet.objects.filter(user=self.user, exercise__name='Squat').count(), 2)
+
+    def test_missing_columns(self):
+        with self.assertRaisesMessage(HistoryImportError, 'weight_used'):
+            import_history(self.user, io.StringIO('date,exercise,set_number,reps\n2024-01-01,squat,1,5\n'))
+
+    def test_bad_rows_are_reported_per_line(self):
+        result = import_history(self.user, io.StringIO(
+            self.HEADER + '2024-01-01,squat,1,5,100\nyesterday,squat,1,5,100\n2024-01-02,,1,5,100\n2024-01-02,squat,one,5,100\n'
+        ))
+        self.assertEqual(result['sets_created'], 1)
+        self.assertEqual([error['line'] for error in result['errors']], [3, 4, 5])
+
+    def test_out_of_range_numbers(self):
+        result = import_history(self.user, io.StringIO(
+            self.HEADER + '2024-01-01,squat,1,5,1e19\n2024-01-01,squat,2,5,inf\n2024-01-01,squat,3,99999999999,100\n'
+            '2024-01-01,squat,4,5,100\n'
+        ))
+        self.assertEqual(result['sets_created'], 1)
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3, 4])
+
+    def test_truncated_row(self):
+        # DictReader fills the missing columns with None
+        result = import_history(self.user, io.StringIO(self.HEADER + '2024-01-01,squat,1,5,100\n2024-01-02\n2024-01-03,squat\n'))
+        self.assertEqual(result['sets_created'], 1)
+        self.assertEqual([error['line'] for error in result['errors']], [3, 4])
+
+    def test_upload_with_truncated_row(self):
+        upload = SimpleUploadedFile('history.csv', (self.HEADER + '2024-01-01,squat,1,5,100\n2024-01-02\n').encode())
+        response = self.client.post('/import-history/', {'file': upload}, **auth_headers(self.user))
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['sets_created'], 1)
+        self.assertEqual(response.json()['errors'][0]['line'], 3)
+
+class SessionBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='batcher', password='pw')
+        cls.workout, cls.workout_exercise = create_workout(cls.user)
+
+    def setUp(self):
+        self.session = create_session(self.user, self.workout, [self.workout_exercise], sets=[(None, None)] * 2)
+        self.sets = list(ExerciseSet.objects.filter(exercise_log__workout_session=self.session))
+        self.log = self.session.exercise_logs.get()
+
+    def post(self, data, session=None):
+        session = session or self.session
+        return self.client.post(f'/workout_session_batch/{session.id}/', data, content_type='application/json',
+                                **auth_headers(self.user))
+
+    def test_applies_mutations(self):
+        response = self.post({
+            'sets': [{'id': self.sets[0].id, 'reps': 5, 'weight_used': 100, 'is_logged': True}],
+            'logs': [{'id': self.log.id, 'sets_completed': 1, 'note': 'felt easy'}],
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['sets'], [{'id': self.sets[0].id, 'status': 'updated'}])
+        self.sets[0].refresh_from_db()
+        self.log.refresh_from_db()
+        self.assertEqual((self.sets[0].reps, self.sets[0].weight_used, self.sets[0].is_logged), (5, 100, True))
+        self.assertEqual((self.log.sets_completed, self.log.note), (1, 'felt easy'))
+        self.assertIsNone(ExerciseSet.objects.get(id=self.sets[1].id).reps)
+
+    def test_reports_ids_outside_the_session(self):
+        other_session = create_session(self.user, self.workout, [self.workout_exercise], sets=[(5, 80)])
+        other_set = ExerciseSet.objects.get(exercise_log__workout_session=other_session)
+        response = self.post({'sets': [{'id': other_set.id, 'reps': 1}, {'id': self.sets[0].id, 'reps': 3}]})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['sets'], [
+            {'id': other_set.id, 'status': 'not_found'}, {'id': self.sets[0].id, 'status': 'updated'},
+        ])
+        other_set.refresh_from_db()
+        self.assertEqual(other_set.reps, 5)
+
+    def test_invalid_batches(self):
+        for data in ({}, {'sets': [{'id': self.sets[0].id, 'reps': -1}]}, {'sets': [{'reps': 5}]}):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(data).status_code, 400)
+        self.sets[0].refresh_from_db()
+        self.assertIsNone(self.sets[0].reps)
+
+    def test_other_users_session(self):
+        other = User.objects.create_user(username='other', password='pw')
+        workout, workout_exercise = create_workout(other)
+        session = create_session(other, workout, [workout_exercise], sets=[(5, 80)])
+        self.assertEqual(self.post({'sets': [{'id': self.sets[0].id, 'reps': 1}]}, session=session).status_code, 404)
+
+class SyncCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='syncer', password='pw')
+        cls.workout, cls.workout_exercise = create_workout(cls.user)
+
+    def get(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        return self.client.get('/sync/changes/', params, **auth_headers(self.user))
+
+    def raw_cursor(self, payload):
+        return urlsafe_b64encode(dumps(payload).encode()).decode()
+
+    def test_pages_through_changes(self):
+        for _ in range(3):
+            create_session(self.user, self.workout, [self.workout_exercise])
+        first = self.get(limit=2).json()
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['changes']['workout_sessions']), 2)
+        second = self.get(first['cursor'], limit=2).json()
+        self.assertEqual(len(second['changes']['workout_sessions']), 1)
+        ids = [row['id'] for row in first['changes']['workout_sessions'] + second['changes']['workout_sessions']]
+        self.assertCountEqual(ids, WorkoutSession.objects.filter(user=self.user).values_list('id', flat=True))
+
+    def test_invalid_cursors(self):
+        for cursor in ('not a cursor', self.raw_cursor(['x']), self.raw_cursor({'workout_sessions': ['yesterday', 1]}),
+                       self.raw_cursor({'workout_sessions': [timezone.now().isoformat(), 'x']})):
+            with self.subTest(cursor=cursor):
+                response = self.get(cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Invalid cursor.')
+
+    def test_naive_cursor(self):
+        naive = timezone.now().replace(tzinfo=None).isoformat()
+        response = self.get(self.raw_cursor({'workout_sessions': [naive, 1]}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid cursor.')
+
+    def test_expired_cursor(self):
+        response = self.get(encode_cursor({'workout_sessions': (timezone.now() - timedelta(days=3650), 1)}))
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['full_sync_required'])
+
+class MarkReadConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='pw')
+        self.sender = User.objects.create_user(username='sender', password='pw')
+        self.chat = ChatSession.objects.create()
+        self.chat.participants.add(self.reader, self.sender)
+        self.message = Message.objects.create(chat_session=self.chat, sender=self.sender, content='hi')
+        rebuild_unread_counters()
+
+    async def mark_read(self, frames, drop=()):
+        communicator = websocket_communicator(self.reader)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        replies = []
+        for frame in frames:
+            frame = {'type': 'mark-read', 'chatSessionId': self.chat.id, **frame}
+            await communicator.send_json_to({key: value for key, value in frame.items() if key not in drop})
+            if not await communicator.receive_nothing(timeout=0.3):
+                replies.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+        return replies
+
+    def test_marks_read_and_refreshes_counts(self):
+        replies = async_to_sync(self.mark_read)([{'upTo': self.message.id}, {'upTo': self.message.id}])
+        self.message.refresh_from_db()
+        self.assertTrue(self.message.read)
+        # Nothing left to mark the second time, so no second refresh
+        self.assertEqual(replies, [{'type': 'unread_counts', 'data': {'total': 0, 'sessions': {}}}])
+
+    def test_rejects_bad_chat_session_ids(self):
+        error = {'type': 'error', 'error': 'invalid_chat_session', 'event': 'mark-read'}
+        replies = async_to_sync(self.mark_read)([{'chatSessionId': None}, {'chatSessionId': 'general'}, {'chatSessionId': [1]}])
+        self.assertEqual(replies, [error] * 3)
+        # No chatSessionId at all
+        replies = async_to_sync(self.mark_read)([{}], drop=['chatSessionId'])
+        self.assertEqual(replies, [error])
+        self.message.refresh_from_db()
+        self.assertFalse(self.message.read)
+
+    def test_rejects_non_integer_up_to(self):
+        replies = async_to_sync(self.mark_read)([{'upTo': str(self.message.id)}])
+        self.assertEqual(replies, [{'type': 'error', 'error': 'invalid_up_to', 'event': 'mark-read'}])
+        self.message.refresh_from_db()
+        self.assertFalse(self.message.read)
+
+class SlowQueryLoggerTests(TestCase):
+    def test_survives_connection_opened_under_a_wrapper(self):
+        def request_wrapper(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        wrappers = list(connection.execute_wrappers)
+        with connection.execute_wrapper(request_wrapper):
+            # What happens when the request's first query opens the connection
+            connection.execute_wrappers.remove(slow_query_logger)
+            install_slow_query_logger(sender=connection.__class__, connection=connection)
+        self.assertEqual(connection.execute_wrappers, wrappers)
+        self.assertIn(slow_query_logger, connection.execute_wrappers)
+
+    def test_wrappers_unchanged_after_a_request(self):
+        user = User.objects.create_user(username='wrapped', password='pw')
+        wrappers = list(connection.execute_wrappers)
+        self.assertEqual(self.client.get('/check_active_session/', **auth_headers(user)).status_code, 200)
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+class PersonalRecordTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='recorder', password='pw')
+        cls.workout, cls.workout_exercise = create_workout(cls.user)
+
+    def setUp(self):
+        self.session = create_session(self.user, self.workout, [self.workout_exercise])
+        self.log = self.session.exercise_logs.get()
+
+    def log_set(self, reps, weight_used):
+        response = self.client.post(f'/exercise-logs/{self.log.id}/exercise-sets/', {'reps': reps, 'weight_used': weight_used},
+                                    content_type='application/json', **auth_headers(self.user))
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def edit_set(self, set_id, reps, weight_used):
+        response = self.client.post(f'/workout_session_batch/{self.session.id}/',
+                                    {'sets': [{'id': set_id, 'reps': reps, 'weight_used': weight_used}]},
+                                    content_type='application/json', **auth_headers(self.user))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['personal_records']
+
+    def record(self, bucket='4-6'):
+        return PersonalRecord.objects.get(user=self.user, exercise=self.workout_exercise.exercise, rep_range=bucket)
+
+    def test_first_set_is_the_baseline(self):
+        self.assertEqual(self.log_set(5, 100)['personal_records'], [])
+        record = self.record()
+        self.assertEqual((record.best_weight, record.best_volume), (100, 500))
+
+    def test_reports_beaten_records(self):
+        self.log_set(5, 100)
+        self.assertEqual(self.log_set(4, 100)['personal_records'], [])
+        records = self.log_set(5, 105)['personal_records']
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['improved'], ['weight', 'e1rm', 'volume'])
+        self.assertEqual(records[0]['weight']['value'], 105)
+
+    def test_editing_up_a_held_best_is_not_a_new_record(self):
+        first = self.log_set(5, 95)
+        self.log_set(5, 100)
+        self.assertEqual(self.edit_set(first['id'], 5, 90), [])
+        top = ExerciseSet.objects.get(exercise_log=self.log, weight_used=100)
+        self.assertEqual(self.edit_set(top.id, 5, 102), [])
+        record = self.record()
+        self.assertEqual((record.best_weight, record.best_weight_set_id), (102, top.id))
+
+    def test_editing_down_rescans_the_bucket(self):
+        first = self.log_set(5, 100)
+        second = self.log_set(5, 90)
+        self.assertEqual(self.edit_set(first['id'], 5, 80), [])
+        record = self.record()
+        self.assertEqual((record.best_weight, record.best_weight_set_id), (90, second['id']))
+        self.assertEqual(record.best_volume_set_id, second['id'])
+
+    def test_mixed_edit_reports_the_metrics_it_takes(self):
+        heavy = self.log_set(5, 100)   # weight 100, e1rm 116.7, volume 500
+        self.log_set(6, 90)            # weight 90, e1rm 108, volume 540
+        # Lower weight, but more volume than the other set
+        records = self.edit_set(heavy['id'], 6, 95)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['improved'], ['volume'])
+        record = self.record()
+        self.assertEqual((record.best_weight, record.best_volume), (95, 570))
+        self.assertEqual({record.best_weight_set_id, record.best_e1rm_set_id, record.best_volume_set_id}, {heavy['id']})
+
+    def test_edit_into_another_rep_range(self):
+        first = self.log_set(5, 100)
+        second = self.log_set(5, 90)
+        self.edit_set(first['id'], 8, 100)
+        self.assertEqual(self.record().best_weight_set_id, second['id'])
+        self.assertEqual(self.record('7-10').best_weight_set_id, first['id'])
+
+    def test_delete_rescans_the_bucket(self):
+        first = self.log_set(5, 100)
+        second = self.log_set(5, 90)
+        ExerciseSet.objects.get(id=first['id']).delete()
+        self.assertEqual(self.record().best_weight_set_id, second['id'])
+        ExerciseSet.objects.get(id=second['id']).delete()
+        self.assertFalse(PersonalRecord.objects.filter(user=self.user).exists())
+
+class TargetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='progressor', password='pw')
+        cls.workout, cls.squat = create_workout(cls.user, sets=3, reps=5)
+        cls.bench = WorkoutExercise.objects.create(
+            workout=cls.workout, exercise=Exercise.objects.create(name='Bench press', creator=cls.user), sets=3, reps=5
+        )
+
+    def test_next_target(self):
+        # Every planned set at the planned reps: up 2.5%, at least 1
+        self.assertEqual(next_target(3, 5, [(5, 100)] * 3)['weight'], 102)
+        self.assertEqual(next_target(3, 5, [(5, 20)] * 3)['weight'], 21)
+        # A miss repeats the weight and counts a stall
+        missed = next_target(3, 5, [(5, 100), (5, 100), (4, 100)], stalls=0)
+        self.assertEqual((missed['weight'], missed['stalls'], missed['last_reps']), (100, 1, 4))
+        # Too many misses in a row deload
+        deload = next_target(3, 5, [(5, 100), (3, 100)], stalls=TARGET_STALL_LIMIT - 1)
+        self.assertEqual((deload['weight'], deload['stalls']), (90, 0))
+        # Warm-ups below the working weight don't count as working sets
+        self.assertEqual(next_target(3, 5, [(5, 60), (5, 100), (5, 100), (5, 100)])['last_sets'], 3)
+        self.assertIsNone(next_target(3, 5, [(None, None), (0, 100)]))
+
+    def post(self, path, data=None):
+        return self.client.post(path, data or {}, content_type='application/json', **auth_headers(self.user))
+
+    def test_session_round_trip(self):
+        ExerciseTarget.objects.create(user=self.user, workout_exercise=self.bench, reps=5, weight=60, last_sets=3,
+                                      last_reps=4, last_weight=60, stalls=1)
+        response = self.post('/start_workout_session/', {'workout_id': self.workout.id})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['targets'], [{
+            'workout_exercise': self.bench.id,
+            'last': {'sets': 3, 'reps': 4, 'weight': 60},
+            'target': {'sets': 3, 'reps': 5, 'weight': 60},
+        }])
+        session_id = response.json()['session_id']
+        # Targets are only suggested; the sets start empty
+        sets = ExerciseSet.objects.filter(exercise_log__workout_session_id=session_id)
+        self.assertEqual(sets.count(), 6)
+        self.assertFalse(sets.filter(reps__isnull=False).exists() or sets.filter(weight_used__isnull=False).exists())
+
+        # Squats done, bench skipped
+        squat_sets = sets.filter(exercise_log__workout_exercise=self.squat)
+        response = self.post(f'/workout_session_batch/{session_id}/', {
+            'sets': [{'id': exercise_set.id, 'reps': 5, 'weight_used': 100, 'is_logged': True} for exercise_set in squat_sets]
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.post(f'/end-session/{session_id}/').status_code, 200)
+
+        squat = ExerciseTarget.objects.get(user=self.user, workout_exercise=self.squat)
+        self.assertEqual((squat.weight, squat.stalls, squat.workout_session_id), (102, 0, session_id))
+        bench = ExerciseTarget.objects.get(user=self.user, workout_exercise=self.bench)
+        self.assertEqual((bench.weight, bench.stalls, bench.workout_session_id), (60, 1, None))
+        # Nothing was lifted on the skipped exercise, so it holds no record either
+        self.assertFalse(PersonalRecord.objects.filter(user=self.user, exercise=self.bench.exercise).exists())
+
+class ExerciseSetHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='historian', password='pw')
+        cls.workout, cls.workout_exercise = create_workout(cls.user)
+        cls.exercise = cls.workout_exercise.exercise
+        now = timezone.now()
+        cls.sessions = [
+            create_session(cls.user, cls.workout, [cls.workout_exercise], sets=[(5, 100 + days), (5, 100 + days), (None, None)],
+                           date=now - timedelta(days=days))
+            for days in (1, 2, 3, 400)
+        ]
+        other = User.objects.create_user(username='stranger', password='pw')
+        workout, workout_exercise = create_workout(other)
+        create_session(other, workout, [workout_exercise], sets=[(5, 100)])
+
+    def get(self, **params):
+        return self.client.get(f'/exercise-sets/history/{self.exercise.id}/', params, **auth_headers(self.user))
+
+    def test_groups_sets_by_session_newest_first(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200, response.content)
+        sessions = response.json()['sessions']
+        # The session older than the default window is left out
+        self.assertEqual(len(sessions), 3)
+        self.assertEqual([session['sets'][0]['weight_used'] for session in sessions], [101, 102, 103])
+        # Sets with nothing entered aren't history
+        self.assertEqual([len(session['sets']) for session in sessions], [2, 2, 2])
+        self.assertEqual([s['set_number'] for s in sessions[0]['sets']], [1, 2])
+        self.assertIsNone(response.json()['next'])
+
+    def test_pages_with_the_cursor(self):
+        first = self.get(limit=2).json()
+        self.assertEqual(len(first['sessions']), 2)
+        self.assertIsNotNone(first['next'])
+        second = self.get(limit=2, before=first['next']).json()
+        self.assertEqual([session['sets'][0]['weight_used'] for session in second['sessions']], [103])
+        self.assertIsNone(second['next'])
+        self.assertEqual(len(self.get(days=500).json()['sessions']), 4)
+
+    def test_invalid_parameters(self):
+        naive = urlsafe_b64encode(timezone.now().replace(tzinfo=None).isoformat().encode()).decode()
+        for params in ({'before': 'not a cursor'}, {'before': naive}, {'limit': 0}, {'limit': 1000}, {'days': 0}, {'days': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+@override_settings(WEBSOCKET_RATE_LIMITS={'message': (5, 20), 'default': (0.001, 3)}, WEBSOCKET_RATE_LIMIT_STRIKES=2)
+class ConsumerFrameTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatty', password='pw')
+
+    async def exchange(self, frames):
+        # Returns the replies and the close code, if the server closed the socket
+        communicator = websocket_communicator(self.user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        replies, close_code = [], None
+        for frame in frames:
+            await communicator.send_to(text_data=frame)
+            if await communicator.receive_nothing(timeout=0.2):
+                continue
+            output = await communicator.receive_output()
+            if output['type'] == 'websocket.close':
+                close_code = output['code']
+                break
+            replies.append(loads(output['text']))
+        await communicator.disconnect()
+        return replies, close_code
+
+    def test_invalid_frames(self):
+        replies, close_code = async_to_sync(self.exchange)(['not json', '[]', '{"type": 1}'])
+        self.assertEqual(replies, [{'type': 'error', 'error': 'invalid_frame'}] * 3)
+        self.assertIsNone(close_code)
+
+    def test_unknown_types_share_the_default_bucket(self):
+        frames = [dumps({'type': f'made-up-{n}'}) for n in range(10)]
+        replies, close_code = async_to_sync(self.exchange)(frames)
+        # Three frames fit the burst, then two strikes are answered and the third closes
+        self.assertEqual([reply['error'] for reply in replies], ['rate_limited'] * 2)
+        self.assertEqual(close_code, CLOSE_RATE_LIMITED)
+
+class ChartAuthenticationTests(TestCase):
+    PATHS = ('/workout_sessions_last_3_months/', '/cumulative-weight/')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='charted', password='pw')
+
+    def test_token_and_session_callers(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path, **auth_headers(self.user)).status_code, 200)
+        self.client.force_login(self.user)
+        for path in self.PATHS:
+            with self.subTest(path=path, auth='session'):
+                self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_anonymous_callers(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assertIn(self.client.get(path).status_code, (401, 403))
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        _user_cache.clear()
+        self.user = User.objects.create_user(username='cached', password='pw')
+
+    def authenticate(self):
+        request = RequestFactory().get('/', **auth_headers(self.user))
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_serves_copies_from_the_cache(self):
+        first = self.authenticate()
+        first.username = 'changed in a view'
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().username, 'cached')
+
+    def test_profile_edit_drops_the_cached_user(self):
+        self.authenticate()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.authenticate().first_name, 'Renamed')
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.assertEqual(self.client.get('/check_active_session/', **auth_headers(self.user)).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/check_active_session/', **auth_headers(self.user)).status_code, 401)
+
+class ChartCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='plotted', password='pw')
+        cls.workout, cls.workout_exercise = create_workout(cls.user)
+
+    def setUp(self):
+        get_chart_cache().clear()
+        self.session = create_session(self.user, self.workout, [self.workout_exercise], sets=[(5, 100)])
+        self.exercise_set = ExerciseSet.objects.get(exercise_log__workout_session=self.session)
+
+    def total_today(self):
+        response = self.client.get('/cumulative-weight/', **auth_headers(self.user))
+        return response.json()[-1]['total_weight_lifted']
+
+    def sessions_this_week(self):
+        response = self.client.get('/workout_sessions_last_3_months/', **auth_headers(self.user))
+        return response.json()[-1]['workouts']
+
+    def test_served_from_the_cache(self):
+        self.assertEqual(self.total_today(), 500)
+        # Written without signals, so the cached figure stays
+        ExerciseSet.objects.filter(id=self.exercise_set.id).update(weight_used=200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.total_today(), 500)
+
+    def test_set_edits_and_deletes(self):
+        self.assertEqual(self.total_today(), 500)
+        self.exercise_set.weight_used = 120
+        self.exercise_set.save()
+        self.assertEqual(self.total_today(), 600)
+        self.exercise_set.delete()
+        self.assertEqual(self.total_today(), 0)
+
+    def test_batch_edits(self):
+        self.assertEqual(self.total_today(), 500)
+        response = self.client.post(f'/workout_session_batch/{self.session.id}/', {'sets': [{'id': self.exercise_set.id, 'reps': 6}]},
+                                    content_type='application/json', **auth_headers(self.user))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.total_today(), 600)
+
+    def test_log_and_session_edits(self):
+        version = get_chart_version(self.user.id)
+        log = self.session.exercise_logs.get()
+        log.note = 'grindy'
+        log.save()
+        self.assertNotEqual(get_chart_version(self.user.id), version)
+
+        self.assertEqual(self.sessions_this_week(), 1)
+        self.assertEqual(self.total_today(), 500)
+        # Moving the session out of the window takes its sets along
+        self.session.date = timezone.now() - timedelta(days=120)
+        self.session.save()
+        self.assertEqual(self.sessions_this_week(), 0)
+        self.assertEqual(self.total_today(), 0)
+
+    def test_other_users_keep_their_entries(self):
+        other = User.objects.create_user(username='unplotted', password='pw')
+        version = get_chart_version(other.id)
+        self.exercise_set.save()
+        self.assertEqual(get_chart_version(other.id), version)
+
+class WebsocketAuthenticationTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='socket', password='pw')
+        self.other = User.objects.create_user(username='elsewhere', password='pw')
+
+    async def close_code(self, path):
+        communicator = WebsocketCommunicator(JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns)), path)
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        return code
+
+    def test_rejects_bad_handshakes(self):
+        for path, code in (
+            (f'/ws/user/{self.user.id}/', 4401),
+            (f'/ws/user/{self.user.id}/?token=not-a-token', 4401),
+            (f'/ws/user/{self.other.id}/?token={AccessToken.for_user(self.user)}', 4403),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(async_to_sync(self.close_code)(path), code)
+        self.assertFalse(presence.is_online(self.user.id))
+
+    def test_inactive_user(self):
+        token = AccessToken.for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(async_to_sync(self.close_code)(f'/ws/user/{self.user.id}/?token={token}'), 4401)
+
+    async def connect_twice(self):
+        # The user stays online until their last connection closes
+        first, second = websocket_communicator(self.user), websocket_communicator(self.user)
+        self.assertTrue((await first.connect())[0])
+        self.assertTrue((await second.connect())[0])
+        online = [presence.is_online(self.user.id)]
+        await first.disconnect()
+        online.append(presence.is_online(self.user.id))
+        await second.disconnect()
+        online.append(presence.is_online(self.user.id))
+        return online
+
+    def test_presence(self):
+        self.assertEqual(async_to_sync(self.connect_twice)(), [True, True, False])
+
+    def test_online_status_endpoint(self):
+        presence.connect(self.other.id)
+        try:
+            response = self.client.get('/online-status/', {'user_ids': f'{self.user.id},{self.other.id}'},
+                                       **auth_headers(self.user))
+        finally:
+            presence.disconnect(self.other.id)
+        self.assertEqual(response.json(), {str(self.user.id): False, str(self.other.id): True})
+        self.assertEqual(self.client.get('/online-status/', {'user_ids': 'a,b'}, **auth_headers(self.user)).status_code, 400)
+
+class ClientRosterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.trainer = User.objects.create_user(username='trainer', password='pw')
+        cls.active = User.objects.create_user(username='active', password='pw')
+        cls.idle = User.objects.create_user(username='idle', password='pw')
+        stranger = User.objects.create_user(username='stranger', password='pw')
+        for client in (cls.active, cls.idle):
+            TrainerClientRelationship.objects.create(trainer=cls.trainer, client=client)
+        cls.workout, workout_exercise = create_workout(cls.active)
+        create_session(cls.active, cls.workout, [workout_exercise], sets=[(5, 100), (5, 100), (None, None)])
+        workout, workout_exercise = create_workout(stranger)
+        create_session(stranger, workout, [workout_exercise], sets=[(5, 100)])
+        rebuild_personal_records()
+
+    def get(self):
+        response = self.client.get('/client-roster/', **auth_headers(self.trainer))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_summarises_each_client(self):
+        active, idle = self.get()
+        self.assertEqual(active['username'], 'active')
+        self.assertEqual((active['sessions_this_week'], active['weekly_volume']), (1, 1000))
+        self.assertEqual(active['active_program'], {'id': self.workout.program_id, 'name': 'Program'})
+        self.assertEqual([(pr['exercise'], pr['rep_range'], pr['weight']) for pr in active['recent_prs']], [('Squat', '4-6', 100)])
+        self.assertIsNotNone(active['last_session'])
+        self.assertEqual(idle, {
+            'id': self.idle.id, 'username': 'idle', 'profile_picture': None, 'last_session': None,
+            'sessions_this_week': 0, 'weekly_volume': 0, 'active_program': None, 'recent_prs': [],
+        })
+
+    def test_queries_dont_grow_with_the_roster(self):
+        with self.assertNumQueries(5):
+            self.get()
+        for n in range(3):
+            client = User.objects.create_user(username=f'client{n}', password='pw')
+            TrainerClientRelationship.objects.create(trainer=self.trainer, client=client)
+            workout, workout_exercise = create_workout(client)
+            create_session(client, workout, [workout_exercise], sets=[(5, 80)])
+        with self.assertNumQueries(5):
+            self.assertEqual(len(self.get()), 5)
+
+    def test_no_clients(self):
+        response = self.client.get('/client-roster/', **auth_headers(self.active))
+        self.assertEqual(response.json(), [])
+
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'user{n}') for n in range(12)])
+
+    @mock.patch('pt_app.admin.ADMIN_EXACT_COUNT_LIMIT', 5)
+    def test_counts(self):
+        users = User.objects.order_by('-pk')
+        highest = self.users[-1].pk
+        # Unfiltered: the highest primary key stands in for COUNT(*)
+        self.assertEqual(EstimatedCountPaginator(users, 2).count, highest)
+        # Filtered: counted exactly, even past the limit, so every page can be reached
+        filtered = users.filter(username__startswith='user')
+        paginator = EstimatedCountPaginator(filtered, 2)
+        self.assertEqual(paginator.count, 12)
+        self.assertEqual(len(paginator.page(paginator.num_pages)), 2)
+
+class ExerciseSetUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='mover', password='pw')
+        workout, cls.squat = create_workout(cls.user)
+        cls.bench = WorkoutExercise.objects.create(
+            workout=workout, exercise=Exercise.objects.create(name='Bench press', creator=cls.user), sets=3, reps=5
+        )
+        cls.session = create_session(cls.user, workout, [cls.squat], sets=[(5, 100)],
+                                     date=timezone.now() - timedelta(days=3))
+        cls.exercise_set = ExerciseSet.objects.get(exercise_log__workout_session=cls.session)
+        other_session = create_session(cls.user, workout, [cls.bench])
+        cls.other_log = other_session.exercise_logs.get()
+
+    def test_denormalized_columns_are_copied_from_the_log(self):
+        log = self.exercise_set.exercise_log
+        self.assertEqual(
+            (self.exercise_set.user_id, self.exercise_set.exercise_id, self.exercise_set.session_date),
+            (self.user.id, self.squat.exercise_id, self.session.date)
+        )
+        self.assertEqual((log.user_id, log.exercise_id, log.session_date), (self.user.id, self.squat.exercise_id, self.session.date))
+
+    def test_update_cannot_move_a_set_to_another_log(self):
+        for method in ('put', 'patch'):
+            with self.subTest(method=method):
+                response = getattr(self.client, method)(
+                    f'/exercise_set_update/{self.exercise_set.id}/',
+                    {'exercise_log': self.other_log.id, 'set_number': 1, 'reps': 6, 'weight_used': 100},
+                    content_type='application/json', **auth_headers(self.user)
+                )
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(response.json()['exercise_log'], self.exercise_set.exercise_log_id)
+        exercise_set = ExerciseSet.objects.get(id=self.exercise_set.id)
+        self.assertEqual(
+            (exercise_set.exercise_log_id, exercise_set.exercise_id, exercise_set.session_date, exercise_set.reps),
+            (self.exercise_set.exercise_log_id, self.squat.exercise_id, self.session.date, 6)
+        )
+
+class SyncAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='pw')
+        cls.viewer = User.objects.create_user(username='viewer', password='pw')
+        cls.workout, cls.workout_exercise = create_workout(cls.owner)
+        cls.program = cls.workout.program
+
+    def setUp(self):
+        # Rows written well before the viewer's cursor
+        long_ago = timezone.now() - timedelta(hours=1)
+        Program.objects.filter(id=self.program.id).update(updated_at=long_ago)
+        Workout.objects.filter(id=self.workout.id).update(updated_at=long_ago)
+        WorkoutExercise.objects.filter(id=self.workout_exercise.id).update(updated_at=long_ago)
+        self.cursor = self.sync()['cursor']
+
+    def sync(self, cursor=None):
+        params = {'since': cursor} if cursor else {}
+        response = self.client.get('/sync/changes/', params, **auth_headers(self.viewer))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def assertReceivesProgram(self, result, key='changes'):
+        # Changes are rows, deletes are bare ids
+        for model, object_id in (('programs', self.program.id), ('workouts', self.workout.id),
+                                 ('workout_exercises', self.workout_exercise.id)):
+            rows = result[key][model]
+            self.assertEqual([row['id'] if key == 'changes' else row for row in rows], [object_id], model)
+
+    def test_participant_added_and_removed(self):
+        self.assertEqual(self.sync(self.cursor)['changes']['programs'], [])
+        self.program.participants.add(self.viewer)
+        granted = self.sync(self.cursor)
+        self.assertReceivesProgram(granted)
+
+        self.program.participants.remove(self.viewer)
+        self.assertReceivesProgram(self.sync(granted['cursor']), key='deleted')
+
+    def test_progress_created_and_deleted(self):
+        progress = UserProgramProgress.objects.create(user=self.viewer, program=self.program)
+        granted = self.sync(self.cursor)
+        self.assertReceivesProgram(granted)
+        progress.delete()
+        self.assertReceivesProgram(self.sync(granted['cursor']), key='deleted')
+
+    def test_no_tombstones_while_still_visible(self):
+        UserProgramProgress.objects.create(user=self.viewer, program=self.program)
+        self.viewer.participating_programs.add(self.program)
+        granted = self.sync(self.cursor)
+        self.viewer.participating_programs.clear()
+        self.assertEqual(self.sync(granted['cursor'])['deleted']['programs'], [])
@@ -12,7 +12,11 @@ ProgramCreateView, ActiveProgramView, SetActiveProgramView, StartWorkoutSessionV
  UserExerciseViewSet, AIProgramLimitView, AIWorkoutLimitView, UserChatSessionsView, UpdatePublicKeyView, AddParticipantView, UserParticipatingProgramsView,
  RemoveParticipantView, SendTrainerRequestView, HandleTrainerRequestView, UserTrainerRequestsView, ClientWorkoutSessionView, ClientWorkoutSessionsLast3MonthsView, 
  ClientExercise1RMView, GuestUserCreateAPIView, ClientExercisesWithWeightsView, ClientCumulativeWeightView, ProfilePictureUploadView, RemoveClientView, 
- RemoveTrainerView, ExerciseLogCreationAPI)
+ RemoveTrainerView, ExerciseLogCreationAPI, DashboardView, TrainingHistoryExportView, ClientTrainingHistoryExportView,
+ TrainingHistoryImportView, WorkoutSessionBatchUpdateView, SyncChangesView,
+ OnlineStatusView, MarkChatReadView, UnreadCountsView,
+ WebsocketStatsView, ProfilingTracesView, SlowQueriesView, metrics,
+ ClientRosterView, PersonalRecordsView)
 
 router = DefaultRouter()
 router.register(r'programs', ProgramViewSet)
@@ -40,6 +44,8 @@ urlpatterns = [
     path('remove-trainer/<int:trainer_id>/', RemoveTrainerView.as_view(), name='remove-trainer'),
     path('update_workout_order/', UpdateWorkoutOrderAPIView.as_view(), name='update_workout_exercise_order'),
     path('update_exercise_order/', UpdateExerciseOrderAPIView.as_view(), name='update_exercise_order'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('sync/changes/', SyncChangesView.as_view(), name='sync-changes'),
     path('get_active_program/', ActiveProgramView.as_view(), name='get_active_program'),
     path('set_active_program/', SetActiveProgramView.as_view(), name='set_active_program'),
     path('set_inactive_program/', SetInactiveProgramView.as_view(), name='set_inactive_program'),
@@ -53,8 +59,11 @@ urlpatterns = [
     path('exercise-logs/<int:log_id>/exercise-sets/', ExerciseSetCreateAPIView.as_view(), name='exercise-set-create'),
     path('exercise-logs/<int:log_id>/delete-last-set/', DeleteLastExerciseSetAPIView.as_view(), name='delete-last-set'),
     path('exercise_log_update/<int:pk>/', ExerciseLogViewSet.as_view(), name='exercise_log_update'),
+    path('workout_session_batch/<int:session_id>/', WorkoutSessionBatchUpdateView.as_view(), name='workout_session_batch'),
     path('upload_video/<int:set_id>/', VideoUploadAPI.as_view(), name='upload_video'),
     path('delete_video/<int:set_id>/', DeleteVideoAPIView.as_view(), name='delete-video'),
+    path('export-history/<str:export_format>/', TrainingHistoryExportView.as_view(), name='export-history'),
+    path('import-history/', TrainingHistoryImportView.as_view(), name='import-history'),
     path('exercise-sets/history/<int:exercise_id>/', ExerciseSetHistoryView.as_view(), name='exercise-set-history'),
     path('api/openai/', OpenAIView.as_view(), name='openai-api'),
     path('api/openaiprogram/', OpenAIProgramView.as_view(), name='openai-api'),
@@ -62,6 +71,13 @@ urlpatterns = [
     path('ai_workout_limit/', AIWorkoutLimitView.as_view(), name='ai_workout_limit'),
     path('chat/<int:other_user_id>/', views.ChatSessionMessageViewSet.as_view({'get': 'retrieve_or_create_session_get_messages'}), name='chat-session', ),
     path('user_chats/', UserChatSessionsView.as_view(), name='user_chats'),
+    path('online-status/', OnlineStatusView.as_view(), name='online-status'),
+    path('chat_sessions/<int:chat_session_id>/mark-read/', MarkChatReadView.as_view(), name='chat-mark-read'),
+    path('unread-counts/', UnreadCountsView.as_view(), name='unread-counts'),
+    path('websocket-stats/', WebsocketStatsView.as_view(), name='websocket-stats'),
+    path('profiling/traces/', ProfilingTracesView.as_view(), name='profiling-traces'),
+    path('slow-queries/', SlowQueriesView.as_view(), name='slow-queries'),
+    path('metrics/', metrics, name='metrics'),
     path('workout_sessions_last_3_months/', WorkoutSessionsLast3MonthsView.as_view(), name='workout_sessions_last_3_months'),
     path('exercise/<int:exercise_id>/1rm/', Exercise1RMView.as_view(), name='exercise-1rm'),
     path('exercises_with_weights/', ExercisesWithWeightsView.as_view(), name='exercises-with-weights'),
@@ -79,6 +95,9 @@ urlpatterns = [
     path('client-exercise-1rm/<int:client_id>/<int:exercise_id>/', ClientExercise1RMView.as_view(), name='client-exercise-1rm'),
     path('client-exercises-with-weights/<int:client_id>/', ClientExercisesWithWeightsView.as_view(), name='client-exercises-with-weights'),
     path('client-cumulative-weight/<int:client_id>/', ClientCumulativeWeightView.as_view(), name='client-cumulative-weight'),
+    path('client-export-history/<int:client_id>/<str:export_format>/', ClientTrainingHistoryExportView.as_view(), name='client-export-history'),
+    path('client-roster/', ClientRosterView.as_view(), name='client-roster'),
+    path('personal-records/', PersonalRecordsView.as_view(), name='personal-records'),
     
 ]
 
@@ -1,8 +1,11 @@
 from django.utils import timezone
+from datetime import timedelta, datetime
 from django.db import transaction
 from .models import (Program, Workout, Exercise, WorkoutExercise, User, UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet,
-                     ChatSession)
+                     ChatSession, ExerciseTarget)
 from django.conf import settings
+from .records import update_personal_records
+from .targets import target_payload
 
 def set_or_update_user_program_progress(user, program_id):
     program = Program.objects.get(id=program_id)
@@ -28,31 +31,128 @@ def set_or_update_user_program_progress(user, program_id):
     return user_program_progress
 
 def start_workout_session(user, workout_id):
+    # Returns the session and the targets for its exercises. The targets are
+    # only suggestions: the sets start empty so nothing counts as lifted
+    # until the user logs it.
     with transaction.atomic():
         user_program_progress = UserProgramProgress.objects.get(user=user, is_active=True)
         workout_session = WorkoutSession.objects.create(
             user_program_progress=user_program_progress,
+            user=user,
             workout_id=workout_id,
             completed=False,
             active=True  # Start session as active
         )
 
-        workout_exercises = WorkoutExercise.objects.filter(workout_id=workout_id)
-        for workout_exercise in workout_exercises:
-            exercise_log = ExerciseLog.objects.create(
+        # Owner, exercise and date are copied onto logs and sets so history
+        # queries don't have to join back through the session
+        workout_exercises = list(WorkoutExercise.objects.filter(workout_id=workout_id))
+        # Worked out when the last session ended, see pt_app/targets.py
+        targets = {
+            target.workout_exercise_id: target
+            for target in ExerciseTarget.objects.filter(user=user, workout_exercise__in=workout_exercises)
+        }
+        exercise_logs = ExerciseLog.objects.bulk_create([
+            ExerciseLog(
                 workout_session=workout_session,
                 workout_exercise=workout_exercise,
-                sets_completed=0
+                sets_completed=0,
+                user=user,
+                exercise_id=workout_exercise.exercise_id,
+                session_date=workout_session.date
+            )
+            for workout_exercise in workout_exercises
+        ])
+
+        ExerciseSet.objects.bulk_create([
+            ExerciseSet(
+                exercise_log=exercise_log,
+                set_number=set_number,
+                reps=None,
+                weight_used=None,
+                user=user,
+                exercise_id=exercise_log.exercise_id,
+                session_date=workout_session.date
             )
+            for exercise_log, workout_exercise in zip(exercise_logs, workout_exercises)
+            for set_number in range(1, workout_exercise.sets + 1)
+        ])
+    return workout_session, [
+        target_payload(targets[workout_exercise.id], workout_exercise.sets)
+        for workout_exercise in workout_exercises if workout_exercise.id in targets
+    ]
+
+def get_active_session(user, user_program_progress=None):
+    # The user's running session, with everything WorkoutSessionSerializer reads.
+    # Callers that already hold the active progress pass it in to scope the lookup.
+    sessions = WorkoutSession.objects.filter(user=user, active=True, completed=False)
+    if user_program_progress is not None:
+        sessions = sessions.filter(user_program_progress=user_program_progress)
+    return sessions.select_related('workout__creator').prefetch_related(
+        'workout__creator__trainers', 'workout__creator__clients',
+        'workout__workout_exercises__exercise',
+        'exercise_logs__workout_exercise__exercise',
+        'exercise_logs__exercise_sets',
+    ).first()
+
+def apply_session_mutations(session, set_mutations, log_mutations):
+    # Apply validated set/log mutations for one session with one SELECT and one
+    # bulk UPDATE per model. Ids that don't belong to the session are reported
+    # back as not_found rather than failing the whole batch.
+    results = {'sets': [], 'logs': [], 'personal_records': []}
+    # (reps, weight_used) of each set before the batch, for PR detection
+    previous, edited_sets = {}, {}
+    for key, model, mutations, filter_field in (
+        ('sets', ExerciseSet, set_mutations, 'exercise_log__workout_session'),
+        ('logs', ExerciseLog, log_mutations, 'workout_session'),
+    ):
+        if not mutations:
+            continue
+        objects = model.objects.filter(
+            id__in=[mutation['id'] for mutation in mutations], **{filter_field: session}
+        ).in_bulk()
+        fields = {'updated_at'}
+        updated_at = timezone.now()
+        for mutation in mutations:
+            obj = objects.get(mutation['id'])
+            if obj is None:
+                results[key].append({'id': mutation['id'], 'status': 'not_found'})
+                continue
+            if model is ExerciseSet:
+                previous.setdefault(obj.id, (obj.reps, obj.weight_used))
+                edited_sets[obj.id] = obj
+            for field, value in mutation.items():
+                if field != 'id':
+                    setattr(obj, field, value)
+                    fields.add(field)
+            obj.updated_at = updated_at
+            results[key].append({'id': obj.id, 'status': 'updated'})
+        if objects:
+            model.objects.bulk_update(objects.values(), sorted(fields))
+    # bulk_update skips the per-set path, so check the edited sets for PRs here
+    for set_id, exercise_set in edited_sets.items():
+        if previous[set_id] != (exercise_set.reps, exercise_set.weight_used):
+            results['personal_records'] += update_personal_records(exercise_set, previous=previous[set_id])
+    return results
+
+def get_current_week_range():
+    now = timezone.now()
+    # The week runs from the most recent Sunday at midnight to the end of Saturday
+    start_of_week = now - timedelta(days=(now.weekday() + 1) % 7)
+    start_of_week = timezone.make_aware(datetime.combine(start_of_week.date(), datetime.min.time()))
+    end_of_week = start_of_week + timedelta(days=6)
+    end_of_week = timezone.make_aware(datetime.combine(end_of_week.date(), datetime.max.time()))
+    return start_of_week, end_of_week
 
-            for set_number in range(1, workout_exercise.sets + 1):
-                ExerciseSet.objects.create(
-                    exercise_log=exercise_log,
-                    set_number=set_number,
-                    reps=None,
-                    weight_used=None
-                )
-    return workout_session
+def get_remaining_ai_generations(user, model, week_range=None):
+    # model is Program or Workout; both carry creator, is_ai_generated and created_at
+    week_range = week_range or get_current_week_range()
+    ai_count = model.objects.filter(
+        creator=user,
+        is_ai_generated=True,
+        created_at__range=week_range
+    ).count()
+    return 3 - ai_count  # Limit is 3 AI generations per week
 
 #chat feature
 def get_chat_session(user_id_a, user_id_b):
@@ -5,18 +5,41 @@ from rest_framework.views import APIView
 from rest_framework.generics import RetrieveAPIView, RetrieveUpdateAPIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 from .models import (Program, Workout, Exercise, WorkoutExercise, UserProgramProgress, WorkoutSession, ExerciseLog, ExerciseSet, 
-                    User, Message, ChatSession)
+                    User, Message, ChatSession, PersonalRecord)
 from .serializers import (MyTokenObtainPairSerializer, ProgramSerializer, WorkoutSerializer, ExerciseSerializer, WorkoutExerciseSerializer, 
                         WorkoutSessionSerializer, ExerciseSetSerializer, UserSerializer, MessageSerializer, ChatSessionSerializer,
                         ExerciseSetVideoSerializer, ExerciseLogSerializer, WorkoutOrderSerializer, ExerciseOrderSerializer, UserRegistrationSerializer,
-                        PublicKeySerializer, TrainerRequestSerializer, GuestRegistrationSerializer)
-from .utils import set_or_update_user_program_progress, start_workout_session, get_chat_session, get_messages_for_session
+                        PublicKeySerializer, TrainerRequestSerializer, GuestRegistrationSerializer, WorkoutSessionBatchSerializer)
+from .utils import (set_or_update_user_program_progress, start_workout_session, get_chat_session, get_messages_for_session,
+                    get_current_week_range, get_remaining_ai_generations, apply_session_mutations, get_active_session)
+from . import charts
+from .roster import client_roster
+from .records import update_personal_records, notify_personal_records, record_payload
+from .targets import update_targets
+from .history import (exercise_set_history, parse_history_cursor, HISTORY_DEFAULT_DAYS, HISTORY_MAX_DAYS,
+                      HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT)
+from .cache import invalidate_user_charts
+from .export import EXPORT_STREAMS, EXPORT_CONTENT_TYPES, aiter_stream
+from .importer import import_history, HistoryImportError
+from .authentication import TokenClaimsJWTAuthentication
+from .presence import presence
+from .backpressure import send_queue_stats
+from .profiling import traces as profiling_traces
+from .metrics import registry as metrics_registry, openai_request_duration
+from .slow_queries import slow_queries
+from .inbox import mark_read, unread_counts, read_receipt_event, chat_participant_ids, adjust_unread
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .sync import changes_since, parse_cursor, SyncCursorExpired, SYNC_DEFAULT_LIMIT, SYNC_MAX_LIMIT
+import io
 from .models import User, TrainerRequest, TrainerClientRelationship
 from rest_framework import permissions, status, views
 import openai
 import json
+import csv
 from django.conf import settings
 from django.utils.timezone import now
 from datetime import timedelta, datetime, time
@@ -25,7 +48,7 @@ from django.db.models import Exists, OuterRef
 from rest_framework.decorators import api_view, permission_classes
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.http import Http404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 
 def get_tokens_for_user(user):
@@ -302,9 +325,14 @@ class ExerciseSetCreateAPIView(APIView):
             exercise_log=exercise_log,
             set_number=new_set_number,
             reps=request.data.get('reps', None),  # Optional data from request
-            weight_used=request.data.get('weight_used', None)  # Optional data from request
+            weight_used=request.data.get('weight_used', None),  # Optional data from request
+            user_id=exercise_log.user_id,
+            exercise_id=exercise_log.exercise_id,
+            session_date=exercise_log.session_date
         )
         exercise_set.save()
+        personal_records = update_personal_records(exercise_set)
+        notify_personal_records(exercise_set.user_id, personal_records)
 
         # Optionally update the ExerciseLog sets_completed field
         exercise_log.sets_completed += 1
@@ -312,7 +340,7 @@ class ExerciseSetCreateAPIView(APIView):
 
         # Serialize and return the new ExerciseSet
         serializer = ExerciseSetSerializer(exercise_set)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response({**serializer.data, 'personal_records': personal_records}, status=status.HTTP_201_CREATED)
     
 class DeleteLastExerciseSetAPIView(APIView):
     def delete(self, request, log_id):
@@ -510,14 +538,15 @@ class StartWorkoutSessionView(APIView):
         try:
             # Ensure there is no other active session
             if WorkoutSession.objects.filter(
-                user_program_progress__user=request.user,
+                user=request.user,
                 user_program_progress__is_active=True,
                 active=True
             ).exists():
                 return Response({'error': 'Another workout session is already active.'}, status=400)
 
-            workout_session = start_workout_session(request.user, workout_id)
-            return Response({'message': 'Workout session started successfully.', 'session_id': workout_session.id})
+            workout_session, targets = start_workout_session(request.user, workout_id)
+            return Response({'message': 'Workout session started successfully.', 'session_id': workout_session.id,
+                             'targets': targets})
 
         except Exception as e:
             return Response({'error': str(e)}, status=400)
@@ -525,12 +554,7 @@ class StartWorkoutSessionView(APIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_active_session(request):
-    current_user = request.user
-    active_session = WorkoutSession.objects.filter(
-        user_program_progress__user=current_user,
-        active=True,
-        completed=False
-    ).first()
+    active_session = get_active_session(request.user)
 
     if active_session:
         # Serialize the active session
@@ -550,6 +574,8 @@ class EndWorkoutSession(APIView):
                 session.completed = True
                 session.active = False
                 session.save()
+                # Next time's weights are worked out now so starting a session stays cheap
+                update_targets(session)
                 return Response({'status': 'success', 'message': 'Workout session ended successfully.'})
             else:
                 return Response({'status': 'error', 'message': 'Session already completed.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -561,7 +587,7 @@ class UserWorkoutSessionView(viewsets.ModelViewSet):
     #permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return WorkoutSession.objects.filter(user_program_progress__user=self.request.user)
+        return WorkoutSession.objects.filter(user=self.request.user)
         
 class WorkoutSessionDetailView(RetrieveAPIView):
     queryset = WorkoutSession.objects.all()
@@ -581,28 +607,52 @@ class ExerciseSetViewSet(RetrieveUpdateAPIView):
     serializer_class = ExerciseSetSerializer
 
     def perform_update(self, serializer):
-    # Custom update logic here
-        serializer.save()
+        previous = (serializer.instance.reps, serializer.instance.weight_used)
+        exercise_set = serializer.save()
+        if previous != (exercise_set.reps, exercise_set.weight_used):
+            notify_personal_records(exercise_set.user_id, update_personal_records(exercise_set, previous=previous))
 
-class ExerciseSetHistoryView(APIView):
+class WorkoutSessionBatchUpdateView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, exercise_id):
-        # Filter WorkoutExercises by exercise_id
-        workout_exercises = WorkoutExercise.objects.filter(exercise__id=exercise_id)
+    def post(self, request, session_id):
+        session = get_object_or_404(WorkoutSession, id=session_id, user=request.user)
+        serializer = WorkoutSessionBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # Retrieve all the ExerciseLog ids associated with these WorkoutExercises
-        workout_exercises_ids = [we.id for we in workout_exercises]
+        # One transaction for the whole batch so a sync either lands completely or not at all
+        with transaction.atomic():
+            results = apply_session_mutations(session, serializer.validated_data['sets'], serializer.validated_data['logs'])
+        # bulk_update doesn't send post_save, so drop the cached charts here
+        invalidate_user_charts(request.user.id)
+        notify_personal_records(request.user.id, results['personal_records'])
+        return Response(results, status=status.HTTP_200_OK)
 
-        # Fetch ExerciseSets linked through these WorkoutExercises ids and filter by weight_used not null or zero
-        exercise_sets = ExerciseSet.objects.filter(
-            exercise_log__workout_exercise__id__in=workout_exercises_ids,
-            exercise_log__workout_session__user_program_progress__user=request.user,
-            weight_used__gt=0  # Filters out ExerciseSets where weight_used is greater than 0
-        )
-        serializer = ExerciseSetSerializer(exercise_sets, many=True)
-        return Response(serializer.data)
+class ExerciseSetHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
 
+    def get(self, request, exercise_id):
+        # ?days= bounds how far back to look, ?limit= is sessions per page and
+        # ?before= is the cursor from the previous page
+        try:
+            days = int(request.query_params.get('days', HISTORY_DEFAULT_DAYS))
+            limit = int(request.query_params.get('limit', HISTORY_DEFAULT_LIMIT))
+            before = parse_history_cursor(request.query_params.get('before'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= HISTORY_MAX_DAYS or not 1 <= limit <= HISTORY_MAX_LIMIT:
+            return Response({'error': f'days must be 1-{HISTORY_MAX_DAYS} and limit 1-{HISTORY_MAX_LIMIT}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        sessions, next_cursor = exercise_set_history(request.user, exercise_id, days, before, limit)
+        return Response({
+            'sessions': [
+                {'date': session_date, 'sets': ExerciseSetSerializer(sets, many=True).data}
+                for session_date, sets in sessions
+            ],
+            'next': next_cursor,
+        })
 
 #openai api
 
@@ -637,29 +687,30 @@ class OpenAIView(APIView):
                 return Response({"error": "You have reached the limit of 3 AI-generated workouts per week."}, status=status.HTTP_400_BAD_REQUEST)
             
             openai.api_key = settings.API_KEY
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                response_format={"type":"json_object"},
-                messages=[
-        {
-            "role": "system",
-            "content": "You are Professional NSCA Certified Strength and Conditioning Specialist. Write a workout based on the user's prompts following all NSCA guidelines. If the users prompt contains text that is unrelated, send them back the infamous One Punch Man workout formatted in the data structure that follows(100 situps, 100 pushups, 100 squats, and a 10-km run). Your response should be a valid JSON object structured as follows: "
-                       "{"
-                       "\"workout_exercises\": ["
-                       "    {"
-                       "        \"exercise_name\": \"<Name of the exercise(max_length=45)>\","
-                       "        \"sets\": <int>,"
-                       "        \"reps\": <int>,"
-                       "        \"note\": \"<Any specific note for the exercise>\""
-                       "    },"
-                       "    {...additional exercises}"
-                       "],"
-                       "\"name\": \"<Name of the workout program(max_length=45)>\""
-                       "}. Use double quotes for keys and string values. Replace placeholder text with actual exercise details."
-        },
-        {"role": "user", "content": user_prompt}
-    ]
-            )
+            with openai_request_duration.time(view='workout'):
+                response = openai.chat.completions.create(
+                    model="gpt-4o",
+                    response_format={"type":"json_object"},
+                    messages=[
+            {
+                "role": "system",
+                "content": "You are Professional NSCA Certified Strength and Conditioning Specialist. Write a workout based on the user's prompts following all NSCA guidelines. If the users prompt contains text that is unrelated, send them back the infamous One Punch Man workout formatted in the data structure that follows(100 situps, 100 pushups, 100 squats, and a 10-km run). Your response should be a valid JSON object structured as follows: "
+                           "{"
+                           "\"workout_exercises\": ["
+                           "    {"
+                           "        \"exercise_name\": \"<Name of the exercise(max_length=45)>\","
+                           "        \"sets\": <int>,"
+                           "        \"reps\": <int>,"
+                           "        \"note\": \"<Any specific note for the exercise>\""
+                           "    },"
+                           "    {...additional exercises}"
+                           "],"
+                           "\"name\": \"<Name of the workout program(max_length=45)>\""
+                           "}. Use double quotes for keys and string values. Replace placeholder text with actual exercise details."
+            },
+            {"role": "user", "content": user_prompt}
+        ]
+                )
             workout_data = json.loads(response.choices[0].message.content)
             workout_data['program'] = program_id
 
@@ -703,42 +754,43 @@ class OpenAIProgramView(APIView):
                 return Response({"error": "You have reached the limit of 3 AI programs per week."}, status=status.HTTP_400_BAD_REQUEST)
             
             openai.api_key = settings.API_KEY
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                response_format={"type":"json_object"},
-                messages=[
-        {
-        "role": "system",
-        "content": "You are a Professional NSCA Certified Strength and Conditioning Specialist. Write a workout program based on the user's prompts following all NSCA guidelines. Your response should be a valid JSON object structured as follows:" 
-        "{"
-            "\"name\": \"<Name of the workout program(max_length=45)>\","
-            "\"description\": \"<Description of the workout program>\","
-            "\"workouts\": ["
-                "{"
-                    "\"name\": \"<Name of the workout(max_length=45)>\","
-                    "\"workout_exercises\": ["
-                        "{"
-                            "\"exercise_name\": \"<Name of the exercise(max_length=45)>\","
-                            "\"sets\": <type:int>,"
-                            "\"reps\": <type:int>,"
-                            "\"note\": \"<Specific note for the exercise>\""
-                        "},"
-                        "{"
-                            "\"exercise_name\": \"<Name of another exercise>\","
-                            "\"sets\": <type:int>,"
-                            "\"reps\": <type:int>,"
-                            "\"note\": \"<Specific note for another exercise>\""
-                        "}"
-                        "    {...additional exercises}"
-                    "]"
-                "}"
-                "{...additional workouts}"
-            "]"
-        "}.Replace placeholder text with actual program and exercise details."
-        },
-        {"role": "user", "content": user_prompt}
-    ]
-            )
+            with openai_request_duration.time(view='program'):
+                response = openai.chat.completions.create(
+                    model="gpt-4o",
+                    response_format={"type":"json_object"},
+                    messages=[
+            {
+            "role": "system",
+            "content": "You are a Professional NSCA Certified Strength and Conditioning Specialist. Write a workout program based on the user's prompts following all NSCA guidelines. Your response should be a valid JSON object structured as follows:" 
+            "{"
+                "\"name\": \"<Name of the workout program(max_length=45)>\","
+                "\"description\": \"<Description of the workout program>\","
+                "\"workouts\": ["
+                    "{"
+                        "\"name\": \"<Name of the workout(max_length=45)>\","
+                        "\"workout_exercises\": ["
+                            "{"
+                                "\"exercise_name\": \"<Name of the exercise(max_length=45)>\","
+                                "\"sets\": <type:int>,"
+                                "\"reps\": <type:int>,"
+                                "\"note\": \"<Specific note for the exercise>\""
+                            "},"
+                            "{"
+                                "\"exercise_name\": \"<Name of another exercise>\","
+                                "\"sets\": <type:int>,"
+                                "\"reps\": <type:int>,"
+                                "\"note\": \"<Specific note for another exercise>\""
+                            "}"
+                            "    {...additional exercises}"
+                        "]"
+                    "}"
+                    "{...additional workouts}"
+                "]"
+            "}.Replace placeholder text with actual program and exercise details."
+            },
+            {"role": "user", "content": user_prompt}
+        ]
+                )
             program_data = json.loads(response.choices[0].message.content)
 
 
@@ -755,36 +807,12 @@ class OpenAIProgramView(APIView):
         
 class AIProgramLimitView(APIView):
     def get(self, request):
-        now = timezone.now()
-        start_of_week = now - timedelta(days=(now.weekday() + 1) % 7)
-        start_of_week = timezone.make_aware(datetime.combine(start_of_week.date(), datetime.min.time()))
-        end_of_week = start_of_week + timedelta(days=6)
-        end_of_week = timezone.make_aware(datetime.combine(end_of_week.date(), datetime.max.time()))
-
-        ai_program_count = Program.objects.filter(
-            creator=request.user,
-            is_ai_generated=True,
-            created_at__range=[start_of_week, end_of_week]
-        ).count()
-
-        remaining = 3 - ai_program_count  # Assuming the limit is 5 programs per week
+        remaining = get_remaining_ai_generations(request.user, Program)
         return Response({"remaining": remaining}, status=status.HTTP_200_OK)
     
 class AIWorkoutLimitView(APIView):
     def get(self, request):
-        now = timezone.now()
-        start_of_week = now - timedelta(days=(now.weekday() + 1) % 7)
-        start_of_week = timezone.make_aware(datetime.combine(start_of_week.date(), datetime.min.time()))
-        end_of_week = start_of_week + timedelta(days=6)
-        end_of_week = timezone.make_aware(datetime.combine(end_of_week.date(), datetime.max.time()))
-
-        ai_workout_count = Workout.objects.filter(
-            creator=request.user,
-            is_ai_generated=True,
-            created_at__range=[start_of_week, end_of_week]
-        ).count()
-
-        remaining = 3 - ai_workout_count  # Assuming the limit is 5 workouts per week
+        remaining = get_remaining_ai_generations(request.user, Workout)
         return Response({"remaining": remaining}, status=status.HTTP_200_OK)
         
 #APIs for Messages
@@ -797,6 +825,13 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
 
+    def perform_update(self, serializer):
+        was_read = serializer.instance.read
+        message = serializer.save()
+        # Keep the unread counters in step with a single message being (un)read
+        if message.read != was_read:
+            adjust_unread(message, -1 if message.read else 1)
+
 class ChatSessionViewSet(viewsets.ModelViewSet):
     queryset = ChatSession.objects.all()
     serializer_class = ChatSessionSerializer
@@ -826,126 +861,245 @@ class UserChatSessionsView(APIView):
         serializer = ChatSessionSerializer(chat_sessions, many=True, context={'request': request})
         return Response(serializer.data)
     
+class MarkChatReadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, chat_session_id):
+        participants = chat_participant_ids(chat_session_id)
+        if request.user.id not in participants:
+            return Response({'error': 'Chat session not found'}, status=status.HTTP_404_NOT_FOUND)
+        up_to = request.data.get('up_to')
+        if up_to is not None and not isinstance(up_to, int):
+            return Response({'error': 'up_to must be a message id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        marked = mark_read(request.user, chat_session_id, up_to)
+        if marked:
+            # Read receipts for whoever is connected on the other side
+            channel_layer = get_channel_layer()
+            for user_id in participants - {request.user.id}:
+                if presence.is_online(user_id):
+                    async_to_sync(channel_layer.group_send)(f"user_{user_id}", read_receipt_event(chat_session_id, request.user.id, up_to))
+        return Response({'marked': marked, **unread_counts(request.user)})
+
+class UnreadCountsView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(unread_counts(request.user))
+
 #dataCharts
     
+class PersonalRecordsView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        records = PersonalRecord.objects.filter(user=request.user).order_by('exercise_id', 'rep_range')
+        exercise_id = request.query_params.get('exercise_id')
+        if exercise_id is not None:
+            if not exercise_id.isdigit():
+                return Response({'error': 'exercise_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+            records = records.filter(exercise_id=exercise_id)
+        return Response([record_payload(record) for record in records])
+
 class WorkoutSessionsLast3MonthsView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
     def get(self, request):
-        end_date = now()
-        start_date = end_date - timedelta(days=90)  # Approximately 3 months
-
-        sessions = WorkoutSession.objects.filter(
-            user_program_progress__user=request.user,
-            date__range=(start_date, end_date)
-        ).order_by('date')
-
-        chart_data = self.process_sessions_by_week(sessions, start_date, end_date)
-        return Response(chart_data)
-
-    def process_sessions_by_week(self, sessions, start_date, end_date):
-        data = OrderedDict()
-        current_date = start_date
-        while current_date <= end_date:
-            week_str = current_date.strftime('%Y-%U')  # Maintain unique year-week identification
-            data[week_str] = 0
-            current_date += timedelta(days=7)
-        
-        end_week_str = end_date.strftime('%Y-%U')
-        if end_week_str not in data:
-            data[end_week_str] = 0
-
-        for session in sessions:
-            week_str = session.date.strftime('%Y-%U')
-            if week_str in data:
-                data[week_str] += 1
-
-        # Convert to a format suitable for Recharts, consider transforming week_str for frontend display if needed
-        chart_data = [{'week': week, 'workouts': count} for week, count in data.items()]
-        return chart_data
+        return Response(charts.workout_sessions_last_3_months(request.user))
     
 class Exercise1RMView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, exercise_id):
-        # Calculate the date 6 months ago from today
-        six_months_ago = now() - timedelta(days=180)
-        
-        # Fetch exercise sets for the given exercise in the last 6 months for the current user
-        exercise_sets = ExerciseSet.objects.filter(
-            exercise_log__workout_exercise__exercise_id=exercise_id,
-            exercise_log__workout_session__date__gte=six_months_ago,
-            exercise_log__workout_session__user_program_progress__user=request.user
-        ).select_related('exercise_log__workout_exercise__exercise').exclude(weight_used__isnull=True).exclude(reps__isnull=True).order_by('exercise_log__workout_session__date')
-        
-        # Prepare the data for the chart
-        chart_data = self.prepare_chart_data(exercise_sets)
-        
-        return Response(chart_data)
-
-    def prepare_chart_data(self, exercise_sets):
-        chart_data = {}
-        for exercise_set in exercise_sets:
-            # Calculate 1RM using the Epley formula for each set
-            one_rm = exercise_set.weight_used * (1 + exercise_set.reps / 30.0)
-            one_rm = round(one_rm, 1)
-            day = exercise_set.exercise_log.workout_session.date.strftime('%Y-%m-%d')
-            
-            # If multiple sets are done on the same day, store the max 1RM
-            if day not in chart_data or one_rm > chart_data[day]:
-                chart_data[day] = one_rm
-        
-        # Convert the chart data dictionary to a list of objects
-        return [{'day': day, 'one_rm': one_rm} for day, one_rm in chart_data.items()]
+        return Response(charts.exercise_1rm(request.user, exercise_id))
     
 class ExercisesWithWeightsView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]  # Ensure the user is authenticated
 
     def get(self, request):
-        user = request.user
-        
-        # Adjusted subquery to check for ExerciseSets linked to the user's WorkoutExercises
-        has_weighted_sets = ExerciseSet.objects.filter(
-            exercise_log__workout_session__user_program_progress__user=user,
-            exercise_log__workout_exercise__exercise_id=OuterRef('pk'),  # Note the change here
-            weight_used__isnull=False
-        )
-
-        # Query for Exercises with at least one ExerciseSet with weight_used for the user
-        exercises = Exercise.objects.annotate(
-            has_weighted_set=Exists(has_weighted_sets)
-        ).filter(has_weighted_set=True).distinct()
-        
-        # Prepare and return the response with Exercise details
-        exercises_data = [{'id': exercise.id, 'name': exercise.name} for exercise in exercises]
-        return Response(exercises_data)
+        return Response(charts.exercises_with_weights(request.user))
     
 class CumulativeWeightView(APIView):
-    def get(self, request):
-        user = request.user  # Assuming you have user authentication set up
-        end_date = now().date()
-        start_date = end_date - timedelta(days=6)  # Last 7 days including today
-
-        # Fetch all sessions for the user in the last 7 days
-        sessions = WorkoutSession.objects.filter(
-            user_program_progress__user=user,
-            date__date__range=(start_date, end_date)
-        ).prefetch_related('exercise_logs__exercise_sets')
-
-        # Prepare data structure for cumulative weights
-        cumulative_weights = {date.strftime('%Y-%m-%d'): 0 for date in [start_date + timedelta(days=x) for x in range((end_date-start_date).days + 1)]}
-
-        # Calculate cumulative weight for each day
-        for session in sessions:
-            session_date = session.date.date().strftime('%Y-%m-%d')
-            for log in session.exercise_logs.all():
-                for exercise_set in log.exercise_sets.all():
-                    if exercise_set.weight_used and exercise_set.reps:
-                        cumulative_weights[session_date] += (exercise_set.weight_used * exercise_set.reps)
-        
-        # Format the data for the response
-        response_data = [{'date': date, 'total_weight_lifted': weight} for date, weight in cumulative_weights.items()]
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        return Response(response_data)
+    def get(self, request):
+        return Response(charts.cumulative_weight(request.user))
     
+#history export
+
+def training_history_response(user, export_format):
+    if export_format not in EXPORT_STREAMS:
+        return Response({'error': 'Unsupported export format.'}, status=status.HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(aiter_stream(EXPORT_STREAMS[export_format](user)), content_type=EXPORT_CONTENT_TYPES[export_format])
+    filename = f"{user.username}_training_history.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+class TrainingHistoryExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, export_format):
+        return training_history_response(request.user, export_format)
+
+class ClientTrainingHistoryExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, client_id, export_format):
+        client = get_object_or_404(User, pk=client_id)
+
+        # Ensure the client is one of the user's clients
+        if not request.user.clients.filter(pk=client_id).exists():
+            return Response({"detail": "Client not found or not authorized."}, status=403)
+
+        return training_history_response(client, export_format)
+
+class TrainingHistoryImportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            return Response({'error': 'A CSV file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Decode while reading so the upload is never held in memory as one string
+        lines = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+        try:
+            result = import_history(request.user, lines)
+        except (HistoryImportError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+class SyncChangesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            positions = parse_cursor(request.query_params.get('since'))
+            limit = min(int(request.query_params.get('limit', SYNC_DEFAULT_LIMIT)), SYNC_MAX_LIMIT)
+        except SyncCursorExpired:
+            return Response({'error': 'Cursor is too old, a full sync is required.', 'full_sync_required': True}, status=status.HTTP_410_GONE)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(request.user, positions, limit))
+
+class OnlineStatusView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # Answered from the websocket presence registry, no database access
+        try:
+            user_ids = [int(user_id) for user_id in request.query_params.get('user_ids', '').split(',') if user_id]
+        except ValueError:
+            return Response({'error': 'user_ids must be a comma-separated list of ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > 200:
+            return Response({'error': 'At most 200 user ids per request.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({str(user_id): online for user_id, online in presence.online(user_ids).items()})
+
+class WebsocketStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        # Per-process numbers; each worker reports its own connections
+        return Response({'online_users': presence.online_count(), **send_queue_stats.snapshot()})
+
+class ProfilingTracesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        # The slowest profiled requests of this process, slowest first. The
+        # cProfile output and allocation lists are only sent for ?id=<trace id>.
+        trace_id = request.query_params.get('id')
+        if trace_id is not None:
+            trace = profiling_traces.get(int(trace_id)) if trace_id.isdigit() else None
+            if trace is None:
+                return Response({'error': 'Trace not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(trace)
+        return Response([
+            {key: value for key, value in trace.items() if key not in ('cprofile', 'allocations')}
+            for trace in profiling_traces.slowest()
+        ])
+
+    def delete(self, request):
+        profiling_traces.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class SlowQueriesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        # Query shapes over SLOW_QUERY_THRESHOLD_MS in this process, most total time first
+        return Response({'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS, 'queries': slow_queries.summary()})
+
+    def delete(self, request):
+        slow_queries.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+def metrics(request):
+    # Prometheus scrape target for this process, only reachable from the host itself
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+#dashboard
+
+class DashboardView(APIView):
+    """
+    Everything the home screen needs on launch in one request: the active program
+    and session, chats, trainer requests, AI limits and the home charts.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+
+        user_program_progress = UserProgramProgress.objects.filter(
+            user=user, is_active=True
+        ).select_related('program__creator').prefetch_related(
+            'program__creator__trainers', 'program__creator__clients',
+            'program__workouts__creator__trainers', 'program__workouts__creator__clients',
+            'program__workouts__workout_exercises__exercise',
+        ).first()
+
+        week_range = get_current_week_range()
+        received_requests = TrainerRequest.objects.filter(to_user=user, is_active=True)
+        sent_requests = TrainerRequest.objects.filter(from_user=user, is_active=True)
+        chat_sessions = ChatSession.objects.filter(participants=user).distinct().prefetch_related(
+            'participants__trainers', 'participants__clients'
+        )
+
+        return Response({
+            'active_program': ProgramSerializer(user_program_progress.program).data if user_program_progress else None,
+            'active_session': self.get_active_session(user, user_program_progress),
+            'chats': ChatSessionSerializer(chat_sessions, many=True, context={'request': request}).data,
+            'trainer_requests': {
+                'received_requests': TrainerRequestSerializer(received_requests, many=True).data,
+                'sent_requests': TrainerRequestSerializer(sent_requests, many=True).data,
+            },
+            'ai_program_limit': {'remaining': get_remaining_ai_generations(user, Program, week_range)},
+            'ai_workout_limit': {'remaining': get_remaining_ai_generations(user, Workout, week_range)},
+            'charts': {
+                'workout_sessions_last_3_months': charts.workout_sessions_last_3_months(user),
+                'cumulative_weight': charts.cumulative_weight(user),
+                'exercises_with_weights': charts.exercises_with_weights(user),
+            },
+        })
+
+    def get_active_session(self, user, user_program_progress):
+        # Same lookup as check_active_session, scoped to the progress fetched above
+        active_session = get_active_session(user, user_program_progress)
+        if active_session is None:
+            return {'active': False}
+        return WorkoutSessionSerializer(active_session).data
+
 #client progress
     
 class ClientWorkoutSessionView(viewsets.ModelViewSet):
@@ -960,7 +1114,7 @@ class ClientWorkoutSessionView(viewsets.ModelViewSet):
         if not self.request.user.clients.filter(pk=client_id).exists():
             return WorkoutSession.objects.none()  # Return an empty queryset if unauthorized
 
-        return WorkoutSession.objects.filter(user_program_progress__user=client)
+        return WorkoutSession.objects.filter(user=client)
 
 class ClientWorkoutSessionsLast3MonthsView(APIView):
     permission_classes = [IsAuthenticated]
@@ -972,37 +1126,7 @@ class ClientWorkoutSessionsLast3MonthsView(APIView):
         if not request.user.clients.filter(pk=client_id).exists():
             return Response({"detail": "Client not found or not authorized."}, status=403)
 
-        end_date = now()
-        start_date = end_date - timedelta(days=90)  # Approximately 3 months
-
-        sessions = WorkoutSession.objects.filter(
-            user_program_progress__user=client,
-            date__range=(start_date, end_date)
-        ).order_by('date')
-
-        chart_data = self.process_sessions_by_week(sessions, start_date, end_date)
-        return Response(chart_data)
-
-    def process_sessions_by_week(self, sessions, start_date, end_date):
-        data = OrderedDict()
-        current_date = start_date
-        while current_date <= end_date:
-            week_str = current_date.strftime('%Y-%U')  # Maintain unique year-week identification
-            data[week_str] = 0
-            current_date += timedelta(days=7)
-        
-        end_week_str = end_date.strftime('%Y-%U')
-        if end_week_str not in data:
-            data[end_week_str] = 0
-
-        for session in sessions:
-            week_str = session.date.strftime('%Y-%U')
-            if week_str in data:
-                data[week_str] += 1
-
-        # Convert to a format suitable for Recharts, consider transforming week_str for frontend display if needed
-        chart_data = [{'week': week, 'workouts': count} for week, count in data.items()]
-        return chart_data
+        return Response(charts.workout_sessions_last_3_months(client))
 
 class ClientExercise1RMView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1014,35 +1138,7 @@ class ClientExercise1RMView(APIView):
         if not request.user.clients.filter(pk=client_id).exists():
             return Response({"detail": "Client not found or not authorized."}, status=403)
 
-        # Calculate the date 6 months ago from today
-        six_months_ago = now() - timedelta(days=180)
-        
-        # Fetch exercise sets for the given exercise in the last 6 months
-        exercise_sets = ExerciseSet.objects.filter(
-            exercise_log__workout_exercise__exercise_id=exercise_id,
-            exercise_log__workout_session__user_program_progress__user=client,
-            exercise_log__workout_session__date__gte=six_months_ago
-        ).select_related('exercise_log__workout_exercise__exercise').exclude(weight_used__isnull=True).exclude(reps__isnull=True).order_by('exercise_log__workout_session__date')
-        
-        # Prepare the data for the chart
-        chart_data = self.prepare_chart_data(exercise_sets)
-        
-        return Response(chart_data)
-
-    def prepare_chart_data(self, exercise_sets):
-        chart_data = {}
-        for exercise_set in exercise_sets:
-            # Calculate 1RM using the Epley formula for each set
-            one_rm = exercise_set.weight_used * (1 + exercise_set.reps / 30.0)
-            one_rm = round(one_rm, 1)
-            day = exercise_set.exercise_log.workout_session.date.strftime('%Y-%m-%d')
-            
-            # If multiple sets are done on the same day, store the max 1RM
-            if day not in chart_data or one_rm > chart_data[day]:
-                chart_data[day] = one_rm
-        
-        # Convert the chart data dictionary to a list of objects
-        return [{'day': day, 'one_rm': one_rm} for day, one_rm in chart_data.items()]
+        return Response(charts.exercise_1rm(client, exercise_id))
 
 class ClientExercisesWithWeightsView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1054,21 +1150,7 @@ class ClientExercisesWithWeightsView(APIView):
         if not request.user.clients.filter(pk=client_id).exists():
             return Response({"detail": "Client not found or not authorized."}, status=403)
 
-        # Adjusted subquery to check for ExerciseSets linked to the client's WorkoutExercises
-        has_weighted_sets = ExerciseSet.objects.filter(
-            exercise_log__workout_session__user_program_progress__user=client,
-            exercise_log__workout_exercise__exercise_id=OuterRef('pk'),  # Note the change here
-            weight_used__isnull=False
-        )
-
-        # Query for Exercises with at least one ExerciseSet with weight_used for the client
-        exercises = Exercise.objects.annotate(
-            has_weighted_set=Exists(has_weighted_sets)
-        ).filter(has_weighted_set=True).distinct()
-        
-        # Prepare and return the response with Exercise details
-        exercises_data = [{'id': exercise.id, 'name': exercise.name} for exercise in exercises]
-        return Response(exercises_data)
+        return Response(charts.exercises_with_weights(client))
 
 class ClientCumulativeWeightView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1080,27 +1162,12 @@ class ClientCumulativeWeightView(APIView):
         if not request.user.clients.filter(pk=client_id).exists():
             return Response({"detail": "Client not found or not authorized."}, status=403)
 
-        end_date = now().date()
-        start_date = end_date - timedelta(days=6)  # Last 7 days including today
-
-        # Fetch all sessions for the client in the last 7 days
-        sessions = WorkoutSession.objects.filter(
-            user_program_progress__user=client,
-            date__date__range=(start_date, end_date)
-        ).prefetch_related('exercise_logs__exercise_sets')
-
-        # Prepare data structure for cumulative weights
-        cumulative_weights = {date.strftime('%Y-%m-%d'): 0 for date in [start_date + timedelta(days=x) for x in range((end_date-start_date).days + 1)]}
-
-        # Calculate cumulative weight for each day
-        for session in sessions:
-            session_date = session.date.date().strftime('%Y-%m-%d')
-            for log in session.exercise_logs.all():
-                for exercise_set in log.exercise_sets.all():
-                    if exercise_set.weight_used and exercise_set.reps:
-                        cumulative_weights[session_date] += (exercise_set.weight_used * exercise_set.reps)
-        
-        # Format the data for the response
-        response_data = [{'date': date, 'total_weight_lifted': weight} for date, weight in cumulative_weights.items()]
+        return Response(charts.cumulative_weight(client))
 
-        return Response(response_data)
+class ClientRosterView(APIView):
+    authentication_classes = [TokenClaimsJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # All of the trainer's clients at once, instead of a chart call per client
+        return Response(client_roster(request.user))
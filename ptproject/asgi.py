@@ -7,13 +7,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ptproject.settings')
 
 django.setup()
 
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 import pt_app.routing  # Import the routing of your app
+from pt_app.authentication import JWTAuthMiddlewareStack
 
 application = ProtocolTypeRouter({
   "http": get_asgi_application(),
-  "websocket": AuthMiddlewareStack(
+  "websocket": JWTAuthMiddlewareStack(
         URLRouter(
             pt_app.routing.websocket_urlpatterns
         )
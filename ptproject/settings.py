@@ -64,13 +64,25 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'pt_app.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    )
+    ),
+    # orjson-backed JSON, falling back to the stdlib when orjson isn't installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'pt_app.fast_json.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'pt_app.fast_json.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'pt_app.middleware.MetricsMiddleware',
+    'pt_app.middleware.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -117,10 +129,68 @@ SIMPLE_JWT = {
 
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        # InMemoryChannelLayer that counts messages for the metrics/ endpoint
+        "BACKEND": "pt_app.metrics.InstrumentedInMemoryChannelLayer",
+        # Events for a connection that isn't keeping up are dropped past this many
+        "CONFIG": {"capacity": 200, "expiry": 30},
     },
 }
 
+# ChatConsumer flow control: (refill per second, burst) per inbound frame type
+WEBSOCKET_RATE_LIMITS = {
+    'message': (5, 20),
+    'mark-read': (2, 10),
+    'default': (5, 20),
+}
+# Consecutive rejected frames before the socket is closed
+WEBSOCKET_RATE_LIMIT_STRIKES = 20
+# Outbound frames buffered per connection, and how stale the oldest may get
+# (seconds) before the client is treated as a slow consumer and disconnected
+WEBSOCKET_SEND_QUEUE_SIZE = 100
+WEBSOCKET_SEND_MAX_LAG = 10
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Per-user chart data, invalidated by signals on session/set writes
+    "charts": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pt-charts",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Upper bound on chart cache entries; the date-relative charts also roll over daily
+CHART_CACHE_TIMEOUT = 60 * 15
+
+# Per-process cache of authenticated users, see pt_app/authentication.py
+AUTH_USER_CACHE_TTL = 30
+AUTH_USER_CACHE_MAX_ENTRIES = 10000
+
+# Delta sync: clients with an older cursor must do a full resync
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+# How far the returned cursor steps back to cover writes still in flight
+SYNC_CURSOR_OVERLAP_SECONDS = 5
+
+# Request profiling (pt_app/middleware.py): requests with a signed X-Profile
+# header from the profiling_token command are always profiled, plus this
+# fraction of all others with the given extra modes ('cprofile', 'tracemalloc')
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=0.0)
+PROFILING_SAMPLE_MODES = []
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+# Slowest profiled requests kept per process for profiling/traces/
+PROFILING_MAX_TRACES = 50
+
+# Prometheus scrape endpoint (metrics/), only served to these addresses
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Queries at least this slow are logged and aggregated by shape (slow-queries/),
+# with EXPLAIN captured the first time each shape is seen
+SLOW_QUERY_THRESHOLD_MS = env.float('SLOW_QUERY_THRESHOLD_MS', default=100.0)
+SLOW_QUERY_EXPLAIN = True
+SLOW_QUERY_MAX_FINGERPRINTS = 500
+
 ROOT_URLCONF = 'ptproject.urls'
 
 TEMPLATES = [
@@ -150,9 +220,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Writes inside transaction.atomic() take the write lock up front instead of
+            # failing with "database is locked" when a read transaction tries to upgrade.
+            # Set for every connection on purpose: only atomic() blocks issue BEGIN, and
+            # all of ours write. Plain reads run in autocommit and never take the lock,
+            # so don't wrap read-only code in atomic() (or turn on ATOMIC_REQUESTS).
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds a connection waits on a locked database before raising
+            'timeout': 20,
+        },
+        # Early migrations can't be replayed on an empty database (0012 gives a
+        # foreign key a datetime default), so test databases are created from
+        # the current models instead
+        'TEST': {
+            'MIGRATE': False,
+        },
     }
 }
 
+# Applied to every new SQLite connection by pt_app.signals.configure_sqlite_connection.
+# WAL lets chart reads proceed while a session is being logged.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # ms
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,  # negative is KiB, so ~32MB per connection
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators